@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import argparse
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from murfey.client.instance_environment import MurfeyInstanceEnvironment
+from murfey.util.locks import KeyedLocks, LockStatistics, MeasuredLock
+
+
+def create_environment(
+    request_time: float, single_lock: MeasuredLock | None
+) -> MurfeyInstanceEnvironment:
+    """
+    Create an environment whose listeners take request_time seconds, like
+    listeners sending stashed requests to the server. With a single lock all
+    changes of the environment share that lock, as they did before tilt
+    series had their own locks.
+    """
+    environment = MurfeyInstanceEnvironment(
+        url=urlparse("http://localhost:8000", allow_fragments=False), visit="cm1-1"
+    )
+    if single_lock:
+        environment._tag_locks = KeyedLocks("tag", shared=single_lock)
+        environment._store._lock = single_lock
+    environment.listeners["data_collection_ids"] = {
+        lambda tag: time.sleep(request_time)
+    }
+    environment.listeners["autoproc_program_ids"] = {
+        lambda tag, app_id: time.sleep(request_time)
+    }
+    return environment
+
+
+def feedback(
+    environment: MurfeyInstanceEnvironment, rate: float, duration: float, tags: int
+):
+    """Apply a state change for one of the tilt series at the given rate"""
+    interval = 1 / rate
+    n = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        tag = f"Position_{n % tags}"
+        if n % 2:
+            environment.apply_state_delta(
+                "autoproc_program_ids",
+                "add",
+                {tag: {"em-tomo-preprocess": n, "em-tomo-align": n}},
+            )
+        else:
+            environment.apply_state_delta("data_collection_ids", "add", {tag: n})
+        n += 1
+        time.sleep(interval)
+
+
+def analyse(
+    environment: MurfeyInstanceEnvironment,
+    tags: int,
+    interval: float,
+    duration: float,
+    waits: list,
+):
+    """
+    Check and stash requests for movies of randomly chosen tilt series, as
+    the Analyser does, recording how long each check waited for its lock
+    """
+    choice = random.Random(0)
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        tag = f"Position_{choice.randrange(tags)}"
+        start = time.perf_counter()
+        with environment.tag_lock(tag):
+            waits.append(time.perf_counter() - start)
+            environment.data_collection_ids.get(tag)
+            environment.autoproc_program_ids.get(tag)
+        time.sleep(interval)
+
+
+def describe(name: str, statistics: LockStatistics) -> str:
+    return (
+        f"{name} {statistics.acquisitions} acquisitions, {statistics.contended} contended, "
+        f"mean wait {statistics.mean_wait * 1000:.3f}ms, max wait {statistics.max_wait * 1000:.1f}ms, "
+        f"mean hold {statistics.mean_hold * 1000:.3f}ms"
+    )
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Measure lock contention in the client environment between a stream of state changes and an analyser, with a lock per tilt series and with a single lock"
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        default=10,
+        help="State changes per second",
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=5,
+        help="Seconds to run each layout for",
+    )
+    parser.add_argument(
+        "-n",
+        "--tags",
+        type=int,
+        default=20,
+        help="Number of tilt series",
+    )
+    parser.add_argument(
+        "-m",
+        "--movie-interval",
+        type=float,
+        default=0.005,
+        help="Seconds between the movies checked by the analyser",
+    )
+    parser.add_argument(
+        "--request-time",
+        type=float,
+        default=0.02,
+        help="Seconds taken by each listener",
+    )
+    args = parser.parse_args()
+
+    for single_lock in (MeasuredLock("single"), None):
+        environment = create_environment(args.request_time, single_lock)
+        waits: list = []
+        threads = [
+            threading.Thread(
+                target=feedback,
+                args=(environment, args.rate, args.duration, args.tags),
+            ),
+            threading.Thread(
+                target=analyse,
+                args=(
+                    environment,
+                    args.tags,
+                    args.movie_interval,
+                    args.duration,
+                    waits,
+                ),
+            ),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        waits.sort()
+        print(
+            f"{'single lock' if single_lock else 'per tilt series'}: analyser waited "
+            f"{sum(waits) * 1000:.1f}ms in total over {len(waits)} checks, "
+            f"99th percentile {waits[int(len(waits) * 0.99)] * 1000:.3f}ms, "
+            f"max {waits[-1] * 1000:.1f}ms"
+        )
+        if single_lock:
+            print(f"  {describe('single:', single_lock.statistics)}")
+        else:
+            for name, statistics in environment.lock_statistics().items():
+                print(f"  {describe(name + ':', statistics)}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from murfey.client.instance_environment import MurfeyInstanceEnvironment
+
+
+def create_environment(entries: int, tilts: int) -> MurfeyInstanceEnvironment:
+    """
+    Create an environment for a tomography session with the given number of
+    movies, in tilt series of the given size, with a listener for motion
+    corrected movies
+    """
+    environment = MurfeyInstanceEnvironment(
+        url=urlparse("http://localhost:8000", allow_fragments=False), visit="cm1-1"
+    )
+    series = [f"Position_{n}" for n in range(entries // tilts + 1)]
+    environment.data_collection_ids = {s: n for n, s in enumerate(series)}
+    environment.processing_job_ids = {s: {"em-tomo-align": 1} for s in series}
+    environment.autoproc_program_ids = {s: {"em-tomo-align": 1} for s in series}
+    for n in range(entries):
+        tilt_series = series[n // tilts]
+        environment.movie_tilt_pair[movie(n)] = tilt_series
+        environment.tilt_angles.setdefault(tilt_series, []).append(
+            [str(movie(n)), str(n % tilts)]
+        )
+    environment.listeners["motion_corrected_movies"] = {lambda *args: None}
+    return environment
+
+
+def movie(n: int) -> Path:
+    return Path(f"/dls/m12/data/2022/cm1-1/Position_{n}.tiff")
+
+
+def time_updates(environment: MurfeyInstanceEnvironment, entries: int, apply):
+    timings = []
+    for n in range(entries):
+        start = time.perf_counter()
+        apply(environment, n)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def add_entry(environment: MurfeyInstanceEnvironment, n: int):
+    environment.apply_state_delta(
+        "motion_corrected_movies",
+        "add",
+        {str(movie(n)): [f"/dls/m12/processed/Position_{n}.mrc", n]},
+    )
+
+
+def assign_merged_copy(environment: MurfeyInstanceEnvironment, n: int):
+    environment.motion_corrected_movies = {
+        **environment.motion_corrected_movies,
+        movie(n): [f"/dls/m12/processed/Position_{n}.mrc", str(n)],
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Time recording motion corrected movies in the client environment, as a new entry per update or as a merged copy of all entries"
+    )
+    parser.add_argument(
+        "-n",
+        "--entries",
+        type=int,
+        default=50000,
+        help="Number of motion corrected movies to record one at a time",
+    )
+    parser.add_argument(
+        "-c",
+        "--copies",
+        type=int,
+        default=1000,
+        help="Number of motion corrected movies to record by assigning merged copies, which is far slower",
+    )
+    parser.add_argument(
+        "-t",
+        "--tilts",
+        type=int,
+        default=61,
+        help="Number of tilts in each tilt series",
+    )
+    args = parser.parse_args()
+
+    for method, apply, entries in (
+        ("add", add_entry, args.entries),
+        ("copy", assign_merged_copy, args.copies),
+    ):
+        environment = create_environment(entries, args.tilts)
+        timings = time_updates(environment, entries, apply)
+        tenth = max(len(timings) // 10, 1)
+        print(
+            f"{method:>4}: {entries} entries in {sum(timings):.3f}s, "
+            f"median per entry in first tenth {statistics.median(timings[:tenth]) * 1e6:.1f}µs, "
+            f"in last tenth {statistics.median(timings[-tenth:]) * 1e6:.1f}µs"
+        )
+
+
+if __name__ == "__main__":
+    run()
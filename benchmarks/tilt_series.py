@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from murfey.client.context import TomographyContext
+
+
+def movie_names(series: int, tilts: int, interleaved: bool) -> list[Path]:
+    """
+    Names of the movies of a tomography session in the order in which they
+    are acquired, either one tilt series after another or, as in batch
+    tomography, all positions at each tilt angle in turn
+    """
+    angles = [(-1) ** n * 3 * ((n + 1) // 2) for n in range(tilts)]
+    if interleaved:
+        order = [(s, a) for a in angles for s in range(1, series + 1)]
+    else:
+        order = [(s, a) for s in range(1, series + 1) for a in angles]
+    return [Path(f"Position_{s}_[{a:.1f}].tiff") for s, a in order]
+
+
+def time_session(movies: list[Path]) -> list[float]:
+    context = TomographyContext("tomo")
+    timings = []
+    for movie in movies:
+        start = time.perf_counter()
+        context.post_transfer(movie, role="detector")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Time the tracking of tilt series in a TomographyContext for a synthetic tomography session"
+    )
+    parser.add_argument(
+        "-s",
+        "--series",
+        type=int,
+        default=100,
+        help="Number of tilt series in the session",
+    )
+    parser.add_argument(
+        "-t",
+        "--tilts",
+        type=int,
+        default=61,
+        help="Number of tilts in each tilt series",
+    )
+    args = parser.parse_args()
+
+    for interleaved in (False, True):
+        movies = movie_names(args.series, args.tilts, interleaved)
+        timings = time_session(movies)
+        tenth = max(len(timings) // 10, 1)
+        print(
+            f"{'interleaved' if interleaved else 'sequential':>11}: {len(movies)} movies in {sum(timings):.3f}s, "
+            f"median per movie in first tenth {statistics.median(timings[:tenth]) * 1e6:.1f}µs, "
+            f"in last tenth {statistics.median(timings[-tenth:]) * 1e6:.1f}µs"
+        )
+
+
+if __name__ == "__main__":
+    run()
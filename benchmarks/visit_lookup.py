@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+import sqlalchemy
+import sqlalchemy.orm
+from ispyb.sqlalchemy import BLSession, Proposal
+
+# murfey.server.ispyb sets up an ISPyB engine on import, which needs
+# credentials even though the benchmark only talks to SQLite
+if "ISPYB_CREDENTIALS" not in os.environ:
+    with tempfile.NamedTemporaryFile("w", suffix=".cfg", delete=False) as cfg:
+        cfg.write(
+            "[ispyb_sqlalchemy]\nusername = murfey\npassword = murfey\n"
+            "host = localhost\nport = 3306\ndatabase = ispyb\n"
+        )
+    os.environ["ISPYB_CREDENTIALS"] = cfg.name
+
+import murfey.server.ispyb  # noqa: E402
+
+
+def create_database(path: str, visits: int) -> sqlalchemy.orm.sessionmaker:
+    """
+    Create a SQLite database holding the ISPyB Proposal and BLSession tables,
+    with the given number of visits on the microscope m12, half of which are
+    ongoing
+    """
+    engine = sqlalchemy.create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False}
+    )
+    metadata = sqlalchemy.MetaData()
+    for model in (Proposal, BLSession):
+        sqlalchemy.Table(
+            model.__table__.name,
+            metadata,
+            *(
+                sqlalchemy.Column(
+                    column.name,
+                    column.type.as_generic(),
+                    primary_key=column.primary_key,
+                )
+                for column in model.__table__.columns
+            ),
+        )
+    metadata.create_all(engine)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)
+    now = datetime.datetime.now()
+    with session() as db:
+        for n in range(visits):
+            db.add(
+                Proposal(
+                    proposalId=n,
+                    personId=1,
+                    proposalCode="cm",
+                    proposalNumber=str(30000 + n),
+                    title=f"Proposal {n}",
+                )
+            )
+            db.add(
+                BLSession(
+                    sessionId=n,
+                    proposalId=n,
+                    beamLineName="m12",
+                    visit_number=1,
+                    startDate=now - datetime.timedelta(days=1),
+                    endDate=now + datetime.timedelta(days=1 if n % 2 else -0.5),
+                )
+            )
+        db.commit()
+    return session
+
+
+def time_lookups(lookup, requests: int) -> list[float]:
+    timings = []
+    for n in range(requests):
+        start = time.perf_counter()
+        lookup(n)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Compare looking up visits in ISPyB with looking them up in a VisitCache, using SQLite in place of ISPyB"
+    )
+    parser.add_argument(
+        "-n",
+        "--visits",
+        type=int,
+        default=1000,
+        help="Number of visits in the database",
+    )
+    parser.add_argument(
+        "-r",
+        "--requests",
+        type=int,
+        default=1000,
+        help="Number of visit lookups to time for each method",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        session = create_database(os.path.join(tmpdir, "ispyb.sqlite"), args.visits)
+
+        def query(n: int):
+            with session() as db:
+                visits = murfey.server.ispyb.get_all_ongoing_visits("m12", db)
+            name = f"cm{30000 + n % args.visits}-1"
+            return [v for v in visits if v.name == name]
+
+        visits = murfey.server.ispyb.VisitCache("m12", session_factory=session)
+
+        def cached(n: int):
+            return visits.get(f"cm{30000 + n % args.visits}-1")
+
+        for method, lookup in (("query", query), ("cache", cached)):
+            timings = time_lookups(lookup, args.requests)
+            print(
+                f"{method:>5}: first lookup {timings[0] * 1000:.3f}ms, "
+                f"median {statistics.median(timings) * 1000:.3f}ms, "
+                f"maximum {max(timings) * 1000:.3f}ms"
+            )
+        visits.stop()
+
+
+if __name__ == "__main__":
+    run()
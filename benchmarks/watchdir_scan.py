@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from murfey.client.watchdir import DirWatcher
+
+
+def create_tree(base: Path, files: int, files_per_directory: int) -> None:
+    for n in range(files):
+        directory = base / f"GridSquare_{n // files_per_directory}" / "Data"
+        if not n % files_per_directory:
+            directory.mkdir(parents=True)
+        (directory / f"FoilHole_{n}_Data.tiff").touch()
+
+
+def time_scans(base: Path, incremental: bool, repeats: int) -> list[float]:
+    watcher = DirWatcher(base, settling_time=0, incremental=incremental)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        watcher._scan_directory()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Compare full and incremental DirWatcher scans on a synthetic tree"
+    )
+    parser.add_argument(
+        "-n",
+        "--files",
+        type=int,
+        default=500_000,
+        help="Number of files in the synthetic tree",
+    )
+    parser.add_argument(
+        "--files-per-directory",
+        type=int,
+        default=1000,
+        help="Number of files placed in each directory",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        type=int,
+        default=3,
+        help="Number of scans to time for each mode",
+    )
+    parser.add_argument(
+        "--directory",
+        type=Path,
+        default=None,
+        help="Create the tree below this directory rather than a temporary one",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmpdir:
+        base = Path(tmpdir)
+        print(f"Creating {args.files} files below {base}")
+        create_tree(base, args.files, args.files_per_directory)
+        # let directory timestamps age past the racy interval
+        time.sleep(DirWatcher._racy_interval + 1)
+
+        for incremental in (False, True):
+            timings = time_scans(base, incremental, args.repeats)
+            print(
+                f"{'incremental' if incremental else 'full':>11}: first scan {timings[0]:.2f}s, "
+                f"subsequent scans {min(timings[1:], default=timings[0]):.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    run()
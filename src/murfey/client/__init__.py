@@ -28,11 +28,14 @@ import murfey.client.watchdir
 import murfey.client.websocket
 from murfey.client.analyser import Analyser
 from murfey.client.customlogging import CustomHandler, DirectableRichHandler
+from murfey.client.dispatch import APIDispatcher
 from murfey.client.gain_ref import determine_gain_ref
 from murfey.client.instance_environment import MurfeyInstanceEnvironment
-from murfey.client.rsync import RSyncer
+from murfey.client.journal import TransferJournal
+from murfey.client.rsync import RSyncer, TransferPriority
 from murfey.client.tui.app import MurfeyTUI
 from murfey.client.tui.status_bar import StatusBar
+from murfey.client.verify import TransferVerifier
 from murfey.util.models import Visit
 
 # from asyncio import Queue
@@ -148,11 +151,59 @@ def run():
         action="store_true",
         help="Transfer all files in current directory regardless of age",
     )
+    parser.add_argument(
+        "--incremental_scan",
+        action="store_true",
+        default=False,
+        help="Only re-examine directories whose timestamps have changed when looking for new files",
+    )
+    parser.add_argument(
+        "--file_events",
+        action="store_true",
+        default=False,
+        help="Pick up new files from file system events (inotify) as well as by periodic scanning",
+    )
     parser.add_argument(
         "--no_transfer",
         action="store_true",
         help="Avoid actually transferring files",
     )
+    parser.add_argument(
+        "--rsync_workers",
+        type=int,
+        default=1,
+        help="Number of rsync processes to run in parallel",
+    )
+    parser.add_argument(
+        "--transfer_backend",
+        choices=["rsync", "http"],
+        default="rsync",
+        help="Transfer files with rsync, or stream them to the Murfey server over a persistent HTTP connection",
+    )
+    parser.add_argument(
+        "--metadata_bwlimit",
+        type=int,
+        default=0,
+        help="Limit the bandwidth of each rsync process transferring metadata files, in KiB/s",
+    )
+    parser.add_argument(
+        "--data_bwlimit",
+        type=int,
+        default=0,
+        help="Limit the bandwidth of each rsync process transferring data files, in KiB/s",
+    )
+    parser.add_argument(
+        "--verify_transfers",
+        action="store_true",
+        default=False,
+        help="Compare checksums of transferred files with the server copies and transfer files again if they differ",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        default=None,
+        help="Keep track of transferred files in this file, so that a restarted client does not transfer them again",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -249,11 +300,17 @@ def run():
     #     ws.send(json.dumps(dc_params))
 
     status_bar = StatusBar()
+    journal = TransferJournal(args.journal) if args.journal else None
     source_watcher = murfey.client.watchdir.DirWatcher(
-        args.source, settling_time=1, status_bar=status_bar
+        args.source,
+        settling_time=1,
+        status_bar=status_bar,
+        incremental=args.incremental_scan,
+        journal=journal,
     )
 
-    machine_data = requests.get(f"{murfey_url.geturl()}/machine/").json()
+    machine_response = requests.get(f"{murfey_url.geturl()}/machine/")
+    machine_data = machine_response.json()
     gain_ref: Path | None = None
     if machine_data.get("gain_reference_directory"):
         try:
@@ -261,6 +318,9 @@ def run():
         except RuntimeError:
             pass
 
+    if args.file_events:
+        source_watcher.start_events()
+
     main_loop_thread = Thread(
         target=main_loop,
         args=[source_watcher, args.appearance_time, args.transfer_all],
@@ -273,10 +333,14 @@ def run():
         software_versions=machine_data.get("software_versions", {}),
         source=Path(args.source),
         watcher=source_watcher,
+        dispatcher=APIDispatcher(),
         default_destination=args.destination
         or f"{machine_data.get('rsync_module') or 'data'}/{datetime.now().year}",
         demo=args.demo,
         processing_only_mode=server_routing_prefix_found,
+        machine_config=machine_data,
+        machine_config_etag=machine_response.headers.get("ETag", ""),
+        machine_config_checked=time.monotonic(),
     )
 
     ws.environment = instance_environment
@@ -287,8 +351,20 @@ def run():
         server_url=murfey_url,
         local=args.local or instance_environment.demo,
         do_transfer=not args.no_transfer,
+        workers=args.rsync_workers,
+        backend=args.transfer_backend,
+        journal=journal,
+        bandwidth_limits={
+            TransferPriority.METADATA: args.metadata_bwlimit,
+            TransferPriority.DATA: args.data_bwlimit,
+        },
     )
     source_watcher.subscribe(rsync_process.enqueue)
+    verifier = (
+        TransferVerifier(rsync_process)
+        if args.verify_transfers and not args.no_transfer
+        else None
+    )
 
     analyser = Analyser(
         instance_environment.source,
@@ -321,6 +397,12 @@ def run():
         #     rsync_process.stop()
         ws.close()
         log.info("Client stopped")
+    if verifier:
+        verifier.stop()
+    if instance_environment.dispatcher:
+        instance_environment.dispatcher.shutdown()
+    if journal:
+        journal.close()
 
 
 def main_loop(
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import functools
 import logging
 import queue
 import threading
+import zlib
 from pathlib import Path
+from typing import List
 
 from murfey.client.context import Context, SPAContext, TomographyContext
 from murfey.client.instance_environment import MurfeyInstanceEnvironment
@@ -20,6 +23,7 @@ class Analyser(Observer):
         basepath_local: Path,
         environment: MurfeyInstanceEnvironment | None = None,
         force_mdoc_metadata: bool = False,
+        partitions: int = 4,
     ):
         super().__init__()
         self._basepath = basepath_local.absolute()
@@ -35,6 +39,19 @@ class Analyser(Observer):
 
         self.queue: queue.Queue = queue.Queue()
         self.thread = threading.Thread(name="Analyser", target=self._analyse)
+        # once the context is known the Analyser thread only does the analysis
+        # that depends on the order of transfer, and hands the rest of it to a
+        # worker for its partition, eg. its tilt series, so that work in a
+        # partition is done in order while partitions are worked on in parallel
+        self._partitions: List[queue.Queue] = [
+            queue.Queue() for _ in range(max(partitions, 1))
+        ]
+        self._workers = [
+            threading.Thread(
+                name=f"Analyser-{n}", target=self._analyse_partition, args=(partition,)
+            )
+            for n, partition in enumerate(self._partitions)
+        ]
         self._stopping = False
         self._halt_thread = False
 
@@ -181,22 +198,72 @@ class Analyser(Observer):
                             )
                             self.notify({"form": dc_metadata})
             else:
-                _tilt_series = set(self._context._tilt_series.keys())
-                self._context.post_transfer(
-                    transferred_file, role=self._role, environment=self._environment
+                self._sequence(transferred_file, dc_metadata)
+
+    def _sequence(self, transferred_file: Path, dc_metadata: dict):
+        """
+        Do the part of the analysis of a file that depends on the order of
+        transfer, eg. deciding which tilt series are complete, on the Analyser
+        thread and hand the rest of it to the workers for its partitions
+        """
+        context = self._context
+        if not context:
+            return
+        new_tilt_series = ""
+        if isinstance(context, TomographyContext):
+            tilt_series = context.partition_key(transferred_file)
+            if tilt_series not in context._tilt_series:
+                new_tilt_series = tilt_series
+        try:
+            tasks = context.sequence_transfer(
+                transferred_file, role=self._role, environment=self._environment
+            )
+        except Exception as e:
+            logger.error(
+                f"Unhandled exception {e} analysing {transferred_file}", exc_info=True
+            )
+            return
+        if (
+            isinstance(context, TomographyContext)
+            and new_tilt_series in context._tilt_series
+            and self._role == "detector"
+        ):
+            tasks.append(
+                (
+                    new_tilt_series,
+                    functools.partial(
+                        self._notify_new_tilt_series, transferred_file, dc_metadata
+                    ),
+                )
+            )
+        for key, task in tasks:
+            partition = zlib.crc32(key.encode()) % len(self._partitions)
+            self._partitions[partition].put((transferred_file, task))
+
+    def _analyse_partition(self, partition: queue.Queue):
+        while True:
+            item = partition.get()
+            if item is None:
+                return
+            transferred_file, task = item
+            try:
+                task()
+            except Exception as e:
+                logger.error(
+                    f"Unhandled exception {e} analysing {transferred_file}",
+                    exc_info=True,
                 )
-                if (
-                    len(self._context._tilt_series.keys()) > len(_tilt_series)
-                    and self._role == "detector"
-                ):
-                    if not dc_metadata:
-                        dc_metadata = self._context.gather_metadata(
-                            transferred_file.with_suffix(".xml")
-                        )
-                    self.notify({"form": dc_metadata})
+
+    def _notify_new_tilt_series(self, transferred_file: Path, dc_metadata: dict):
+        if not dc_metadata and self._context:
+            dc_metadata = self._context.gather_metadata(
+                transferred_file.with_suffix(".xml")
+            )
+        self.notify({"form": dc_metadata})
 
     def enqueue(self, rsyncer: RSyncerUpdate):
-        if not self._stopping:
+        # files transferred again have already been analysed
+        if not self._stopping and not rsyncer.retransfer:
             absolute_path = (self._basepath / rsyncer.file_path).resolve()
             self.queue.put(absolute_path)
             # self.queue.put(file_path)
@@ -208,6 +275,8 @@ class Analyser(Observer):
             raise RuntimeError("Analyser has already stopped")
         logger.info(f"Analyser thread starting for {self}")
         self.thread.start()
+        for worker in self._workers:
+            worker.start()
 
     def stop(self):
         logger.debug("Analyser thread stop requested")
@@ -217,6 +286,11 @@ class Analyser(Observer):
             if self.thread.is_alive():
                 self.queue.put(None)
                 self.thread.join()
+            for partition in self._partitions:
+                partition.put(None)
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.join()
         except Exception as e:
             logger.debug(f"Exception encountered while stopping analyser: {e}")
         logger.debug("Analyser thread stop completed")
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+import functools
 import logging
-from pathlib import Path
-from threading import RLock
-from typing import Callable, Dict, List, OrderedDict
+import time
+from pathlib import Path, PureWindowsPath
+from threading import RLock, Timer, current_thread
+from typing import Any, Callable, Dict, List, NamedTuple, OrderedDict, Set, Tuple
 
 import requests
 import xmltodict
 from pydantic import BaseModel
 
-from murfey.client.contexts.tomo import tomo_tilt_info
+from murfey.client.contexts.tomo import (
+    TiltInfoExtraction,
+    TiltSeriesTracker,
+    tomo_tilt_info,
+)
 from murfey.client.instance_environment import (
     MovieID,
     MovieTracker,
@@ -18,7 +24,7 @@ from murfey.client.instance_environment import (
     global_env_lock,
 )
 from murfey.client.tui.forms import TUIFormValue
-from murfey.util.mdoc import get_global_data
+from murfey.util.mdoc import get_blocks, get_global_data
 
 # import time
 
@@ -47,16 +53,49 @@ class Context:
     def post_first_transfer(self, transferred_file: Path, role: str = "", **kwargs):
         self.post_transfer(transferred_file, role=role, **kwargs)
 
+    def sequence_transfer(
+        self, transferred_file: Path, role: str = "", **kwargs
+    ) -> List[Tuple[str, Callable[[], Any]]]:
+        """
+        Do the part of the analysis of a transferred file that depends on the
+        order in which files were transferred. Called for every file in that
+        order. Returns the rest of the analysis as tasks with partition keys:
+        tasks with the same key are run in order, while tasks with different
+        keys may be run in parallel
+        """
+        return [
+            (
+                self.partition_key(transferred_file),
+                functools.partial(
+                    self.post_transfer, transferred_file, role=role, **kwargs
+                ),
+            )
+        ]
+
     def gather_metadata(self, metadata_file: Path):
         raise NotImplementedError(
             f"gather_metadata must be declared in derived class to be used: {self}"
         )
 
+    def partition_key(self, transferred_file: Path) -> str:
+        """
+        Files with the same key are analysed in the order they were transferred,
+        while files with different keys may be analysed in parallel
+        """
+        return ""
+
 
 class SPAContext(Context):
     def post_transfer(self, transferred_file: Path, role: str = "", **kwargs):
         pass
 
+    def partition_key(self, transferred_file: Path) -> str:
+        # the grid square directory the file was collected in
+        for part in reversed(transferred_file.parent.parts):
+            if part.startswith("GridSquare"):
+                return part
+        return ""
+
 
 class ProcessFileIncomplete(BaseModel):
     dest: Path
@@ -67,27 +106,95 @@ class ProcessFileIncomplete(BaseModel):
     description: str = ""
 
 
+class SequencedTilt(NamedTuple):
+    tilt_series: str
+    tilt_series_num: str
+    tilt_angle: str
+    new_tilt_series: bool
+    # tilt series completed by the tilt, and those of them to be aligned
+    completed: List[str]
+    to_align: List[str]
+
+
 class TomographyContext(Context):
+    # mdoc files are appended to as tilts are acquired, so a tilt schedule is
+    # only trusted once its mdoc file has not changed for this many seconds
+    _tilt_schedule_settling_time: float = 120
+
     def __init__(self, acquisition_software: str):
         super().__init__(acquisition_software)
-        self._tilt_series: Dict[str, List[Path]] = {}
-        self._completed_tilt_series: List[str] = []
-        self._aligned_tilt_series: List[str] = []
-        self._motion_corrected_tilt_series: Dict[str, List[Path]] = {}
+        self._tilt_series = TiltSeriesTracker()
+        self._motion_corrected_tilt_series: Dict[str, Set[Path]] = {}
         self._last_transferred_file: Path | None = None
+        # tilt series and angle of the last transferred file
+        self._last_tilt: Tuple[str, str] | None = None
         self._data_collection_stash: list = []
         self._processing_job_stash: dict = {}
         self._preprocessing_triggers: dict = {}
         self._lock: RLock = RLock()
         self._extract_tilt_series: Callable[[Path], str] | None = None
         self._extract_tilt_tag: Callable[[Path], str] | None = None
+        self._extract_tilt_angle: Callable[[Path], str] | None = None
+        # tilt schedules read before the names of any movies had been seen,
+        # with the mdoc file they were read from and its modification time
+        self._pending_tilt_schedules: List[Tuple[Path, float, Tuple[str, ...]]] = []
+        # expected angles of tilt series, with the mdoc file they were read
+        # from and its modification time, until the mdoc file has settled
+        self._provisional_tilt_schedules: Dict[str, Tuple[Path, float, Set[str]]] = {}
+        # timers settling the provisional tilt schedules once they are due
+        self._tilt_schedule_timers: Dict[str, Timer] = {}
+
+    @property
+    def _completed_tilt_series(self) -> List[str]:
+        return self._tilt_series.completed
+
+    def partition_key(self, transferred_file: Path) -> str:
+        # the tilt series of the file, once the naming of tilt series is known
+        if not (self._extract_tilt_series and self._extract_tilt_tag):
+            return ""
+        try:
+            tilt_tag = self._extract_tilt_tag(transferred_file)
+            tilt_series = self._extract_tilt_series(transferred_file)
+        except Exception:
+            return ""
+        return f"{tilt_tag}_{tilt_series}" if tilt_tag else tilt_series
+
+    @staticmethod
+    def _post(
+        url: str,
+        data: dict,
+        environment: MurfeyInstanceEnvironment | None = None,
+        key: str | None = None,
+    ):
+        """
+        Send a request to the server through the environment's dispatcher,
+        without waiting for the response, if there is one. Requests with the
+        same key are sent in order.
+        """
+        if environment and environment.dispatcher:
+            environment.dispatcher.post(url, json=data, key=key)
+        else:
+            requests.post(url, json=data)
+
+    def _request_preprocessing(
+        self, url: str, data: dict, environment: MurfeyInstanceEnvironment
+    ):
+        """
+        Request preprocessing of a movie. With a dispatcher, requests made in
+        quick succession are sent to the server in batches.
+        """
+        if environment.dispatcher:
+            environment.dispatcher.post_coalesced(f"{url}_batch", data)
+        else:
+            self._post(url, data, environment=environment)
 
     def _flush_data_collections(self):
         logger.info("Flushing data collection API calls")
-        for dc_data in self._data_collection_stash:
+        with global_env_lock:
+            stash, self._data_collection_stash = self._data_collection_stash, []
+        for dc_data in stash:
             data = {**dc_data[2], **dc_data[1].data_collection_parameters}
-            requests.post(dc_data[0], json=data)
-        self._data_collection_stash = []
+            self._post(dc_data[0], data, environment=dc_data[1], key=data["tag"])
 
     def _flush_processing_job(self, tag: str):
         # logger.info(
@@ -95,7 +202,7 @@ class TomographyContext(Context):
         # )
         if proc_data := self._processing_job_stash.get(tag):
             for pd in proc_data:
-                requests.post(pd[0], json=pd[1])
+                self._post(pd[0], pd[1], environment=pd[2], key=tag)
             self._processing_job_stash.pop(tag)
 
     def _flush_preprocess(self, tag: str, app_id: int):
@@ -104,7 +211,7 @@ class TomographyContext(Context):
             for tr in tag_tr:
                 process_file = self._complete_process_file(tr[1], tr[2], app_id)
                 if process_file:
-                    requests.post(tr[0], json=process_file)
+                    self._request_preprocessing(tr[0], process_file, tr[2])
             self._preprocessing_triggers.pop(tag)
 
     def _check_for_alignment(
@@ -127,22 +234,15 @@ class TomographyContext(Context):
         else:
             return
 
-        if self._motion_corrected_tilt_series.get(
-            tilt_series
-        ) and motion_corrected_path not in self._motion_corrected_tilt_series.get(
-            tilt_series, {}
-        ):
-            self._motion_corrected_tilt_series[tilt_series].append(
-                motion_corrected_path
-            )
-        else:
-            self._motion_corrected_tilt_series[tilt_series] = [motion_corrected_path]
-        if tilt_series in self._completed_tilt_series:
+        self._motion_corrected_tilt_series.setdefault(tilt_series, set()).add(
+            motion_corrected_path
+        )
+        if self._tilt_series.is_complete(tilt_series):
             if (
                 len(self._motion_corrected_tilt_series[tilt_series])
                 == len(self._tilt_series[tilt_series])
                 and len(self._motion_corrected_tilt_series[tilt_series]) > 1
-                and tilt_series not in self._aligned_tilt_series
+                and not self._tilt_series.is_aligned(tilt_series)
             ):
                 try:
 
@@ -157,7 +257,7 @@ class TomographyContext(Context):
                     }
                     requests.post(url, json=series_data)
                     with self._lock:
-                        self._aligned_tilt_series.append(tilt_series)
+                        self._tilt_series.mark_aligned(tilt_series)
                 except Exception as e:
                     logger.warning(f"Data error {e}")
 
@@ -167,35 +267,262 @@ class TomographyContext(Context):
         environment: MurfeyInstanceEnvironment,
         app_id: int,
     ) -> dict:
+        # the environment's dictionaries are changed in place by its store, so
+        # their entries can be read without a lock
         try:
-            with global_env_lock:
-                tag = incomplete_process_file.tag
-
-                new_dict = {
-                    "path": str(incomplete_process_file.dest),
-                    "description": incomplete_process_file.description,
-                    "size": incomplete_process_file.source.stat().st_size,
-                    "timestamp": incomplete_process_file.source.stat().st_ctime,
-                    "processing_job": environment.processing_job_ids[tag][
-                        "em-tomo-preprocess"
-                    ],
-                    "data_collection_id": environment.data_collection_ids[tag],
-                    "image_number": incomplete_process_file.image_number,
-                    "pixel_size": environment.data_collection_parameters[
-                        "pixel_size_on_image"
-                    ],
-                    "autoproc_program_id": app_id,
-                    "mc_uuid": incomplete_process_file.mc_uuid,
-                    "mc_binning": environment.data_collection_parameters.get(
-                        "motion_corr_binning", 1
-                    ),
-                    "gain_ref": environment.data_collection_parameters.get("gain_ref"),
-                }
-                return new_dict
+            tag = incomplete_process_file.tag
+
+            new_dict = {
+                "path": str(incomplete_process_file.dest),
+                "description": incomplete_process_file.description,
+                "size": incomplete_process_file.source.stat().st_size,
+                "timestamp": incomplete_process_file.source.stat().st_ctime,
+                "processing_job": environment.processing_job_ids[tag][
+                    "em-tomo-preprocess"
+                ],
+                "data_collection_id": environment.data_collection_ids[tag],
+                "image_number": incomplete_process_file.image_number,
+                "pixel_size": environment.data_collection_parameters[
+                    "pixel_size_on_image"
+                ],
+                "autoproc_program_id": app_id,
+                "mc_uuid": incomplete_process_file.mc_uuid,
+                "mc_binning": environment.data_collection_parameters.get(
+                    "motion_corr_binning", 1
+                ),
+                "gain_ref": environment.data_collection_parameters.get("gain_ref"),
+            }
+            return new_dict
         except KeyError:
             logger.warning("Key error encountered in _complete_process_file")
             return {}
 
+    def _add_tilt_schedule(
+        self, mdoc_file: Path, environment: MurfeyInstanceEnvironment | None = None
+    ) -> List[str]:
+        completed = self._read_tilt_schedule(mdoc_file, environment=environment)
+        if environment:
+            for ts in completed:
+                self._align_tilt_series(ts, environment)
+        return completed
+
+    def _read_tilt_schedule(
+        self, mdoc_file: Path, environment: MurfeyInstanceEnvironment | None = None
+    ) -> List[str]:
+        """
+        Read the movies making up a tilt series from its mdoc file, so that the
+        tilt series is complete as soon as the last of them has been seen.
+        The schedule is provisional until the mdoc file has settled.
+        Returns the tilt series completed by the schedule.
+        """
+        try:
+            modification_time = mdoc_file.stat().st_mtime
+            with open(mdoc_file, "r") as md:
+                blocks = get_blocks(md)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Tilt schedule could not be read from {mdoc_file}: {e}")
+            return []
+        schedule = []
+        for block in blocks:
+            sub_frame_path = block.get("SubFramePath")
+            if sub_frame_path:
+                if isinstance(sub_frame_path, tuple):
+                    sub_frame_path = " ".join(sub_frame_path)
+                schedule.append(PureWindowsPath(sub_frame_path).name)
+        if not schedule:
+            logger.debug(f"No movies are listed in {mdoc_file}")
+            return []
+        with self._lock:
+            if not self._extract_tilt_angle:
+                self._pending_tilt_schedules.append(
+                    (mdoc_file, modification_time, tuple(schedule))
+                )
+                return []
+            self._expect_tilt_schedule(mdoc_file, modification_time, tuple(schedule))
+            completed = self._complete_scheduled_tilt_series()
+            self._settle_tilt_schedules_later(environment)
+        return completed
+
+    def _expect_tilt_schedule(
+        self, mdoc_file: Path, modification_time: float, schedule: Tuple[str, ...]
+    ) -> str | None:
+        """
+        Record the angles expected in a tilt series from the names of its movies
+        as a provisional tilt schedule. Returns the tilt series, or None if the
+        names could not be understood.
+        """
+        extract_series = self._extract_tilt_series
+        extract_angle = self._extract_tilt_angle
+        extract_tag = self._extract_tilt_tag
+        if not (extract_series and extract_angle and extract_tag):
+            return None
+        try:
+            movies = [Path(m) for m in schedule]
+            tilt_tag = extract_tag(movies[0])
+            tilt_series = (
+                f"{tilt_tag}_{extract_series(movies[0])}"
+                if tilt_tag
+                else extract_series(movies[0])
+            )
+            angles = {extract_angle(m) for m in movies}
+        except Exception:
+            logger.warning(
+                f"Tilt series and angles could not be determined from the tilt schedule including {schedule[0]}"
+            )
+            return None
+        timer = self._tilt_schedule_timers.pop(tilt_series, None)
+        if timer:
+            timer.cancel()
+        self._provisional_tilt_schedules[tilt_series] = (
+            mdoc_file,
+            modification_time,
+            angles,
+        )
+        logger.info(
+            f"Tilt series {tilt_series} has {len(angles)} tilts so far according to {mdoc_file}"
+        )
+        return tilt_series
+
+    def _settle_tilt_schedules(self) -> List[str]:
+        """
+        Set the expected angles of the tilt series whose provisional tilt
+        schedules are final, as their mdoc files have not changed since they
+        were read, nor for the settling time. Until then completion of these
+        tilt series is guessed like that of tilt series without a schedule.
+        Returns the tilt series whose schedules were settled.
+        """
+        settled = []
+        now = time.time()
+        for tilt_series, (mdoc_file, modification_time, angles) in list(
+            self._provisional_tilt_schedules.items()
+        ):
+            try:
+                if mdoc_file.stat().st_mtime != modification_time:
+                    # a newer version of the mdoc file is on its way
+                    continue
+            except OSError:
+                pass
+            if now - modification_time < self._tilt_schedule_settling_time:
+                continue
+            del self._provisional_tilt_schedules[tilt_series]
+            timer = self._tilt_schedule_timers.pop(tilt_series, None)
+            if timer:
+                timer.cancel()
+            self._tilt_series.expect(tilt_series, angles)
+            logger.info(
+                f"Tilt series {tilt_series} is expected to have {len(angles)} tilts"
+            )
+            settled.append(tilt_series)
+        return settled
+
+    def _settle_tilt_schedules_later(
+        self, environment: MurfeyInstanceEnvironment | None = None
+    ):
+        """
+        Settle each provisional tilt schedule once its settling time has
+        passed, even if no more files are transferred, as is the case for the
+        last tilt series of a session
+        """
+        for tilt_series, (_, modification_time, _) in list(
+            self._provisional_tilt_schedules.items()
+        ):
+            if tilt_series in self._tilt_schedule_timers:
+                continue
+            delay = modification_time + self._tilt_schedule_settling_time - time.time()
+            timer = Timer(
+                max(delay, 0),
+                self._settle_tilt_schedule,
+                args=(tilt_series,),
+                kwargs={"environment": environment},
+            )
+            timer.daemon = True
+            self._tilt_schedule_timers[tilt_series] = timer
+            timer.start()
+
+    def _settle_tilt_schedule(
+        self, tilt_series: str, environment: MurfeyInstanceEnvironment | None = None
+    ) -> List[str]:
+        """
+        Settle a provisional tilt schedule that is due, completing and aligning
+        the tilt series if all its expected tilts have been seen
+        """
+        with self._lock:
+            if self._tilt_schedule_timers.get(tilt_series) is current_thread():
+                del self._tilt_schedule_timers[tilt_series]
+            completed = self._complete_scheduled_tilt_series()
+            provisional = self._provisional_tilt_schedules.get(tilt_series)
+            if (
+                provisional
+                and provisional[1] + self._tilt_schedule_settling_time > time.time()
+            ):
+                # the timer went off early, whereas a schedule whose mdoc file
+                # has changed since waits for the newer version to be read
+                self._settle_tilt_schedules_later(environment)
+        if completed:
+            logger.info(
+                f"The following tilt series are considered complete: {completed}"
+            )
+        if environment:
+            for ts in completed:
+                self._align_tilt_series(ts, environment)
+        return completed
+
+    def _complete_scheduled_tilt_series(self, *tilt_series: str) -> List[str]:
+        """
+        Settle provisional tilt schedules and mark the given tilt series and
+        those with newly settled schedules as complete if all their expected
+        tilts have been seen
+        """
+        completed = []
+        for ts in dict.fromkeys((*self._settle_tilt_schedules(), *tilt_series)):
+            if self._tilt_series.is_complete(ts):
+                continue
+            if self._tilt_series.all_expected_seen(ts):
+                self._tilt_series.mark_complete(ts)
+                logger.info(f"All expected tilts of tilt series {ts} have been seen")
+                completed.append(ts)
+        return completed
+
+    def _align_tilt_series(
+        self, tilt_series: str, environment: MurfeyInstanceEnvironment
+    ):
+        """
+        Check whether a complete tilt series can be aligned, which is otherwise
+        only checked as its movies are motion corrected
+        """
+        file_tilt_list = []
+        motion_corrected = None
+        movie: str
+        angle: str
+        for movie, angle in environment.tilt_angles.get(tilt_series, []):
+            if environment.motion_corrected_movies.get(Path(movie)):
+                motion_corrected = Path(movie)
+                file_tilt_list.append(
+                    [
+                        str(environment.motion_corrected_movies[motion_corrected][0]),
+                        angle,
+                        str(environment.motion_corrected_movies[motion_corrected][1]),
+                    ]
+                )
+        if motion_corrected is None:
+            return
+        try:
+            dcid = environment.data_collection_ids[tilt_series]
+            pjid = environment.processing_job_ids[tilt_series]["em-tomo-align"]
+            appid = environment.autoproc_program_ids[tilt_series]["em-tomo-align"]
+        except KeyError:
+            return
+        self._check_for_alignment(
+            motion_corrected,
+            Path(environment.motion_corrected_movies[motion_corrected][0]),
+            environment.url.geturl(),
+            dcid,
+            pjid,
+            appid,
+            int(environment.motion_corrected_movies[motion_corrected][1]),
+            file_tilt_list,
+        )
+
     def _add_tilt(
         self,
         file_path: Path,
@@ -204,10 +531,45 @@ class TomographyContext(Context):
         extract_tilt_tag: Callable[[Path], str],
         environment: MurfeyInstanceEnvironment | None = None,
     ) -> List[str]:
-        if not self._extract_tilt_series:
-            self._extract_tilt_series = extract_tilt_series
-        if not self._extract_tilt_tag:
-            self._extract_tilt_tag = extract_tilt_tag
+        sequenced = self._sequence_tilt(
+            file_path,
+            extract_tilt_series,
+            extract_tilt_angle,
+            extract_tilt_tag,
+            environment=environment,
+        )
+        if not sequenced:
+            return []
+        if environment:
+            self._request_tilt(file_path, sequenced, environment)
+            for ts in sequenced.to_align:
+                self._align_tilt_series(ts, environment)
+        return sequenced.completed
+
+    def _sequence_tilt(
+        self,
+        file_path: Path,
+        extract_tilt_series: Callable[[Path], str],
+        extract_tilt_angle: Callable[[Path], str],
+        extract_tilt_tag: Callable[[Path], str],
+        environment: MurfeyInstanceEnvironment | None = None,
+    ) -> SequencedTilt | None:
+        """
+        Add a tilt to its tilt series and decide which tilt series are complete.
+        Completion depends on the order in which the tilts of all tilt series
+        are seen, so this has to be done for each tilt in the order in which
+        they were transferred. Returns None if the tilt is not understood.
+        """
+        with self._lock:
+            if not self._extract_tilt_series:
+                self._extract_tilt_series = extract_tilt_series
+            if not self._extract_tilt_tag:
+                self._extract_tilt_tag = extract_tilt_tag
+            if not self._extract_tilt_angle:
+                self._extract_tilt_angle = extract_tilt_angle
+            for mdoc_file, modification_time, schedule in self._pending_tilt_schedules:
+                self._expect_tilt_schedule(mdoc_file, modification_time, schedule)
+            self._pending_tilt_schedules = []
         try:
             tilt_series_num = extract_tilt_series(file_path)
             tilt_angle = extract_tilt_angle(file_path)
@@ -216,7 +578,7 @@ class TomographyContext(Context):
                 float(tilt_series_num)
                 float(tilt_angle)
             except ValueError:
-                return []
+                return None
             tilt_series = (
                 f"{tilt_tag}_{tilt_series_num}" if tilt_tag else tilt_series_num
             )
@@ -225,262 +587,236 @@ class TomographyContext(Context):
             logger.info(
                 f"Tilt series and angle could not be determined for {file_path}"
             )
-            return []
+            return None
 
-        if environment:
-            machine_config = (
-                {}
-                if environment.demo
-                else requests.get(f"{str(environment.url.geturl())}/machine/").json()
-            )
-            if environment.visit in environment.default_destination:
-                file_transferred_to = (
-                    Path(machine_config.get("rsync_basepath", ""))
-                    / Path(environment.default_destination)
-                    / file_path.name
-                )
-            else:
-                file_transferred_to = (
-                    Path(machine_config.get("rsync_basepath", ""))
-                    / Path(environment.default_destination)
-                    / environment.visit
-                    / file_path.name
-                )
-            environment.movies[file_transferred_to] = MovieTracker(
-                movie_number=next(MovieID),
-                motion_correction_uuid=next(MurfeyID),
-            )
-            environment.movie_tilt_pair[file_transferred_to] = tilt_series
-            if environment.tilt_angles.get(tilt_series):
-                environment.tilt_angles[tilt_series].append(
-                    [str(file_transferred_to), tilt_angle]
+        with self._lock:
+            if self._tilt_series.is_complete(tilt_series):
+                logger.info(
+                    f"Tilt series {tilt_series} was previously thought complete but now {file_path} has been seen"
                 )
-            else:
-                environment.tilt_angles[tilt_series] = [
-                    [str(file_transferred_to), tilt_angle]
-                ]
-        if tilt_series in self._completed_tilt_series:
+                self._tilt_series.reopen(tilt_series)
+            new_tilt_series = tilt_series not in self._tilt_series
+            self._tilt_series.add(tilt_series, file_path, tilt_angle)
+
+            newly_completed_series = self._complete_scheduled_tilt_series(tilt_series)
+            to_align = list(newly_completed_series)
+            last_tilt = self._last_tilt
+            self._last_tilt = (tilt_series, tilt_angle)
+            if self._last_transferred_file and last_tilt:
+                last_tilt_series, last_tilt_angle = last_tilt
+                if (
+                    last_tilt_series != tilt_series and last_tilt_angle != tilt_angle
+                ) or self._tilt_series.completed_count:
+                    # tilt series without a known tilt schedule are taken to be
+                    # complete once they are as large as the largest tilt series
+                    # and another tilt series has started
+                    if (
+                        not self._tilt_series.is_scheduled(tilt_series)
+                        and len(self._tilt_series[tilt_series])
+                        >= self._tilt_series.largest
+                    ):
+                        self._tilt_series.mark_complete(tilt_series)
+                        newly_completed_series.append(tilt_series)
+                    for ts in self._tilt_series.incomplete_largest():
+                        newly_completed_series.append(ts)
+                        self._tilt_series.mark_complete(ts)
+                        to_align.append(ts)
+            self._last_transferred_file = file_path
+            self._settle_tilt_schedules_later(environment)
+        if new_tilt_series:
+            logger.info(f"New tilt series found: {tilt_series}")
+        if newly_completed_series:
             logger.info(
-                f"Tilt series {tilt_series} was previously thought complete but now {file_path} has been seen"
+                f"The following tilt series are considered complete: {newly_completed_series}"
             )
-            self._completed_tilt_series.remove(tilt_series)
-            if tilt_series in self._aligned_tilt_series:
-                with self._lock:
-                    self._aligned_tilt_series.remove(tilt_series)
+        return SequencedTilt(
+            tilt_series,
+            tilt_series_num,
+            tilt_angle,
+            new_tilt_series,
+            newly_completed_series,
+            to_align,
+        )
 
-        if not self._tilt_series.get(tilt_series):
-            logger.info(f"New tilt series found: {tilt_series}")
-            self._tilt_series[tilt_series] = [file_path]
+    def _request_tilt(
+        self,
+        file_path: Path,
+        sequenced: SequencedTilt,
+        environment: MurfeyInstanceEnvironment,
+    ):
+        """
+        Record a tilt in the environment, register its tilt series if it is
+        new and request preprocessing of the tilt
+        """
+        tilt_series = sequenced.tilt_series
+        machine_config = {} if environment.demo else environment.get_machine_config()
+        if environment.visit in environment.default_destination:
+            file_transferred_to = (
+                Path(machine_config.get("rsync_basepath", ""))
+                / Path(environment.default_destination)
+                / file_path.name
+            )
+        else:
+            file_transferred_to = (
+                Path(machine_config.get("rsync_basepath", ""))
+                / Path(environment.default_destination)
+                / environment.visit
+                / file_path.name
+            )
+        environment.movies[file_transferred_to] = MovieTracker(
+            movie_number=next(MovieID),
+            motion_correction_uuid=next(MurfeyID),
+        )
+        environment.movie_tilt_pair[file_transferred_to] = tilt_series
+        if environment.tilt_angles.get(tilt_series):
+            environment.tilt_angles[tilt_series].append(
+                [str(file_transferred_to), sequenced.tilt_angle]
+            )
+        else:
+            environment.tilt_angles[tilt_series] = [
+                [str(file_transferred_to), sequenced.tilt_angle]
+            ]
+
+        if sequenced.new_tilt_series:
             try:
-                if environment:
-                    url = f"{str(environment.url.geturl())}/visits/{environment.visit}/start_data_collection"
-                    data = {
-                        "experiment_type": "tomography",
-                        "tilt": tilt_series_num,
-                        "file_extension": file_path.suffix,
-                        "acquisition_software": self._acquisition_software,
-                        "image_directory": str(file_path.parent),
-                        "tag": tilt_series,
-                    }
-                    if environment.data_collection_parameters:
-                        data.update(
-                            {
-                                "voltage": environment.data_collection_parameters[
-                                    "voltage"
-                                ],
-                                "pixel_size_on_image": environment.data_collection_parameters[
-                                    "pixel_size_on_image"
-                                ],
-                                "image_size_x": environment.data_collection_parameters[
-                                    "image_size_x"
-                                ],
-                                "image_size_y": environment.data_collection_parameters[
-                                    "image_size_y"
-                                ],
-                            }
-                        )
-                    if environment.data_collection_group_id is None:
+                url = f"{str(environment.url.geturl())}/visits/{environment.visit}/start_data_collection"
+                data = {
+                    "experiment_type": "tomography",
+                    "tilt": sequenced.tilt_series_num,
+                    "file_extension": file_path.suffix,
+                    "acquisition_software": self._acquisition_software,
+                    "image_directory": str(file_path.parent),
+                    "tag": tilt_series,
+                }
+                if environment.data_collection_parameters:
+                    data.update(
+                        {
+                            "voltage": environment.data_collection_parameters[
+                                "voltage"
+                            ],
+                            "pixel_size_on_image": environment.data_collection_parameters[
+                                "pixel_size_on_image"
+                            ],
+                            "image_size_x": environment.data_collection_parameters[
+                                "image_size_x"
+                            ],
+                            "image_size_y": environment.data_collection_parameters[
+                                "image_size_y"
+                            ],
+                        }
+                    )
+                with global_env_lock:
+                    stash = environment.data_collection_group_id is None
+                    if stash:
                         self._data_collection_stash.append((url, environment, data))
-                    else:
-                        requests.post(url, json=data)
-                    proc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/register_processing_job"
+                if not stash:
+                    self._post(url, data, environment=environment, key=tilt_series)
+                proc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/register_processing_job"
+                with environment.tag_lock(tilt_series):
                     if environment.data_collection_ids.get(tilt_series) is None:
                         self._processing_job_stash[tilt_series] = [
                             (
                                 proc_url,
-                                {"tag": tilt_series, "recipe": "em-tomo-preprocess"},
+                                {
+                                    "tag": tilt_series,
+                                    "recipe": "em-tomo-preprocess",
+                                },
+                                environment,
                             )
                         ]
                         self._processing_job_stash[tilt_series].append(
-                            (proc_url, {"tag": tilt_series, "recipe": "em-tomo-align"})
+                            (
+                                proc_url,
+                                {"tag": tilt_series, "recipe": "em-tomo-align"},
+                                environment,
+                            )
                         )
                     else:
                         if self._processing_job_stash.get(tilt_series):
                             self._flush_processing_job(tilt_series)
-                        requests.post(
+                        self._post(
                             proc_url,
-                            json={"tag": tilt_series, "recipe": "em-tomo-preprocess"},
+                            {"tag": tilt_series, "recipe": "em-tomo-preprocess"},
+                            environment=environment,
+                            key=tilt_series,
                         )
-                        requests.post(
+                        self._post(
                             proc_url,
-                            json={"tag": tilt_series, "recipe": "em-tomo-align"},
+                            {"tag": tilt_series, "recipe": "em-tomo-align"},
+                            environment=environment,
+                            key=tilt_series,
                         )
             except Exception as e:
                 logger.error(f"ERROR {e}")
-        else:
-            if file_path not in self._tilt_series[tilt_series]:
-                for p in self._tilt_series[tilt_series]:
-                    if tilt_angle == extract_tilt_angle(p):
-                        break
-                else:
-                    self._tilt_series[tilt_series].append(file_path)
-
-        if environment and environment.autoproc_program_ids.get(tilt_series):
-            preproc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/tomography_preprocess"
-            preproc_data = {
-                "path": str(file_transferred_to),
-                "description": "",
-                "size": file_path.stat().st_size,
-                "timestamp": file_path.stat().st_ctime,
-                "processing_job": environment.processing_job_ids[tilt_series][
-                    "em-tomo-preprocess"
-                ],
-                "data_collection_id": environment.data_collection_ids[tilt_series],
-                "image_number": environment.movies[file_transferred_to].movie_number,
-                "pixel_size": environment.data_collection_parameters[
-                    "pixel_size_on_image"
-                ],
-                "autoproc_program_id": environment.autoproc_program_ids[tilt_series][
-                    "em-tomo-preprocess"
-                ],
-                "mc_uuid": environment.movies[
-                    file_transferred_to
-                ].motion_correction_uuid,
-                "mc_binning": environment.data_collection_parameters.get(
-                    "motion_corr_binning", 1
-                ),
-                "gain_ref": environment.data_collection_parameters.get("gain_ref"),
-            }
-            requests.post(preproc_url, json=preproc_data)
-        elif environment:
-            preproc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/tomography_preprocess"
-            pfi = ProcessFileIncomplete(
-                dest=file_transferred_to,
-                source=environment.source,
-                image_number=environment.movies[file_transferred_to].movie_number,
-                mc_uuid=environment.movies[file_transferred_to].motion_correction_uuid,
-                tag=tilt_series,
-            )
-            if (
-                environment.autoproc_program_ids is None
-                or environment.processing_job_ids is None
-            ) or (
-                environment.autoproc_program_ids.get(tilt_series) is None
-                or environment.processing_job_ids.get(tilt_series) is None
-            ):
-                if self._preprocessing_triggers.get(tilt_series):
-                    self._preprocessing_triggers[tilt_series].append(
-                        (
-                            preproc_url,
-                            pfi,
-                            environment,
-                        )
-                    )
-                else:
-                    self._preprocessing_triggers[tilt_series] = [
-                        (
-                            preproc_url,
-                            pfi,
-                            environment,
-                        )
-                    ]
 
-        if self._last_transferred_file:
-            last_tilt_series = (
-                f"{extract_tilt_tag(self._last_transferred_file)}_{extract_tilt_series(self._last_transferred_file)}"
-                if extract_tilt_tag(self._last_transferred_file)
-                else extract_tilt_series(self._last_transferred_file)
-            )
-            last_tilt_angle = extract_tilt_angle(self._last_transferred_file)
-            self._last_transferred_file = file_path
-            if (
-                last_tilt_series != tilt_series and last_tilt_angle != tilt_angle
-            ) or self._completed_tilt_series:
-                newly_completed_series = []
-                if self._tilt_series:
-                    tilt_series_size = max(len(ts) for ts in self._tilt_series.values())
-                else:
-                    tilt_series_size = 0
-                this_tilt_series_size = len(self._tilt_series[tilt_series])
-                if this_tilt_series_size >= tilt_series_size:
-                    self._completed_tilt_series.append(tilt_series)
-                    newly_completed_series.append(tilt_series)
-                for ts, ta in self._tilt_series.items():
-                    if (
-                        len(ta) >= tilt_series_size
-                        and ts not in self._completed_tilt_series
-                    ):
-                        newly_completed_series.append(ts)
-                        self._completed_tilt_series.append(ts)
-                        if environment:
-                            file_tilt_list = []
-                            movie: str
-                            angle: str
-                            for movie, angle in environment.tilt_angles[ts]:
-                                if environment.motion_corrected_movies.get(Path(movie)):
-                                    file_tilt_list.append(
-                                        [
-                                            str(
-                                                environment.motion_corrected_movies[
-                                                    Path(movie)
-                                                ][0]
-                                            ),
-                                            angle,
-                                            str(
-                                                environment.motion_corrected_movies[
-                                                    Path(movie)
-                                                ][1]
-                                            ),
-                                        ]
-                                    )
-                                if environment.motion_corrected_movies.get(
-                                    file_transferred_to
-                                ):
-                                    self._check_for_alignment(
-                                        file_transferred_to,
-                                        Path(
-                                            environment.motion_corrected_movies[  # key error PosixPath
-                                                file_transferred_to
-                                            ][
-                                                0
-                                            ]
-                                        ),
-                                        environment.url.geturl(),
-                                        environment.data_collection_ids[ts],
-                                        environment.processing_job_ids[ts][
-                                            "em-tomo-align"
-                                        ],
-                                        environment.autoproc_program_ids[ts][
-                                            "em-tomo-align"
-                                        ],
-                                        int(
-                                            environment.motion_corrected_movies[
-                                                file_transferred_to
-                                            ][1]
-                                        ),
-                                        file_tilt_list,
-                                    )
-                if newly_completed_series:
-                    logger.info(
-                        f"The following tilt series are considered complete: {newly_completed_series}"
-                    )
-                return newly_completed_series
-        self._last_transferred_file = file_path
-        return []
+        with environment.tag_lock(tilt_series):
+            if environment.autoproc_program_ids.get(tilt_series):
+                preproc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/tomography_preprocess"
+                preproc_data = {
+                    "path": str(file_transferred_to),
+                    "description": "",
+                    "size": file_path.stat().st_size,
+                    "timestamp": file_path.stat().st_ctime,
+                    "processing_job": environment.processing_job_ids[tilt_series][
+                        "em-tomo-preprocess"
+                    ],
+                    "data_collection_id": environment.data_collection_ids[tilt_series],
+                    "image_number": environment.movies[
+                        file_transferred_to
+                    ].movie_number,
+                    "pixel_size": environment.data_collection_parameters[
+                        "pixel_size_on_image"
+                    ],
+                    "autoproc_program_id": environment.autoproc_program_ids[
+                        tilt_series
+                    ]["em-tomo-preprocess"],
+                    "mc_uuid": environment.movies[
+                        file_transferred_to
+                    ].motion_correction_uuid,
+                    "mc_binning": environment.data_collection_parameters.get(
+                        "motion_corr_binning", 1
+                    ),
+                    "gain_ref": environment.data_collection_parameters.get("gain_ref"),
+                }
+                self._request_preprocessing(preproc_url, preproc_data, environment)
+            else:
+                preproc_url = f"{str(environment.url.geturl())}/visits/{environment.visit}/tomography_preprocess"
+                pfi = ProcessFileIncomplete(
+                    dest=file_transferred_to,
+                    source=environment.source,
+                    image_number=environment.movies[file_transferred_to].movie_number,
+                    mc_uuid=environment.movies[
+                        file_transferred_to
+                    ].motion_correction_uuid,
+                    tag=tilt_series,
+                )
+                if (
+                    environment.autoproc_program_ids is None
+                    or environment.processing_job_ids is None
+                ) or (
+                    environment.autoproc_program_ids.get(tilt_series) is None
+                    or environment.processing_job_ids.get(tilt_series) is None
+                ):
+                    if self._preprocessing_triggers.get(tilt_series):
+                        self._preprocessing_triggers[tilt_series].append(
+                            (
+                                preproc_url,
+                                pfi,
+                                environment,
+                            )
+                        )
+                    else:
+                        self._preprocessing_triggers[tilt_series] = [
+                            (
+                                preproc_url,
+                                pfi,
+                                environment,
+                            )
+                        ]
 
-    def _add_tomo_tilt(
-        self, file_path: Path, environment: MurfeyInstanceEnvironment | None = None
-    ) -> List[str]:
+    def _tomo_tilt_info(
+        self, environment: MurfeyInstanceEnvironment | None = None
+    ) -> TiltInfoExtraction:
         if environment:
             if tomo_version := environment.software_versions.get("tomo"):
                 tilt_info_extraction = tomo_tilt_info.get(tomo_version)
@@ -492,17 +828,9 @@ class TomographyContext(Context):
                 tilt_info_extraction = tomo_tilt_info["5.7"]
         else:
             tilt_info_extraction = tomo_tilt_info["5.7"]
-        return self._add_tilt(
-            file_path,
-            tilt_info_extraction.series,
-            tilt_info_extraction.angle,
-            tilt_info_extraction.tag,
-            environment=environment,
-        )
+        return tilt_info_extraction
 
-    def _add_serialem_tilt(
-        self, file_path: Path, environment: MurfeyInstanceEnvironment | None = None
-    ) -> List[str]:
+    def _serialem_tilt_info(self, file_path: Path) -> TiltInfoExtraction:
         delimiters = ("_", "-")
         for d in delimiters:
             if file_path.name.count(d) > 1:
@@ -520,12 +848,32 @@ class TomographyContext(Context):
                 f"No digits found in {p.name} after splitting on {delimiter}"
             )
 
-        return self._add_tilt(
-            file_path,
+        return TiltInfoExtraction(
             _extract_tilt_series,
             lambda x: ".".join(x.name.split(delimiter)[-1].split(".")[:-1]),
             lambda x: "",
-            environment=environment,
+        )
+
+    def _add_tomo_tilt(
+        self, file_path: Path, environment: MurfeyInstanceEnvironment | None = None
+    ) -> List[str]:
+        return self._add_tilt(
+            file_path, *self._tomo_tilt_info(environment), environment=environment
+        )
+
+    def _add_serialem_tilt(
+        self, file_path: Path, environment: MurfeyInstanceEnvironment | None = None
+    ) -> List[str]:
+        return self._add_tilt(
+            file_path, *self._serialem_tilt_info(file_path), environment=environment
+        )
+
+    @staticmethod
+    def _is_tilt(transferred_file: Path, role: str) -> bool:
+        return (
+            role == "detector"
+            and transferred_file.suffix in (".mrc", ".tiff", ".tif", ".eer")
+            and "gain" not in transferred_file.name
         )
 
     def post_transfer(
@@ -535,13 +883,12 @@ class TomographyContext(Context):
         environment: MurfeyInstanceEnvironment | None = None,
         **kwargs,
     ) -> List[str]:
-        data_suffixes = (".mrc", ".tiff", ".tif", ".eer")
         completed_tilts = []
-        if (
-            role == "detector"
-            and transferred_file.suffix in data_suffixes
-            and "gain" not in transferred_file.name
-        ):
+        if transferred_file.suffix == ".mdoc":
+            completed_tilts = self._add_tilt_schedule(
+                transferred_file, environment=environment
+            )
+        elif self._is_tilt(transferred_file, role):
             if self._acquisition_software == "tomo":
                 completed_tilts = self._add_tomo_tilt(
                     transferred_file, environment=environment
@@ -552,6 +899,56 @@ class TomographyContext(Context):
                 )
         return completed_tilts
 
+    def sequence_transfer(
+        self,
+        transferred_file: Path,
+        role: str = "",
+        environment: MurfeyInstanceEnvironment | None = None,
+        **kwargs,
+    ) -> List[Tuple[str, Callable[[], Any]]]:
+        """
+        Add tilts to their tilt series, and tilt schedules, deciding which tilt
+        series are complete in the order in which files were transferred.
+        Requests for each tilt, and alignment of completed tilt series, are
+        left as tasks partitioned by tilt series, so that a tilt series is only
+        aligned after the requests for all its tilts.
+        """
+        tasks: List[Tuple[str, Callable[[], Any]]] = []
+        if transferred_file.suffix == ".mdoc":
+            to_align = self._read_tilt_schedule(
+                transferred_file, environment=environment
+            )
+        elif self._is_tilt(transferred_file, role):
+            if self._acquisition_software == "tomo":
+                tilt_info = self._tomo_tilt_info(environment)
+            elif self._acquisition_software == "serialem":
+                tilt_info = self._serialem_tilt_info(transferred_file)
+            else:
+                return []
+            sequenced = self._sequence_tilt(
+                transferred_file, *tilt_info, environment=environment
+            )
+            if not sequenced:
+                return []
+            to_align = sequenced.to_align
+            if environment:
+                tasks.append(
+                    (
+                        sequenced.tilt_series,
+                        functools.partial(
+                            self._request_tilt, transferred_file, sequenced, environment
+                        ),
+                    )
+                )
+        else:
+            return []
+        if environment:
+            tasks.extend(
+                (ts, functools.partial(self._align_tilt_series, ts, environment))
+                for ts in to_align
+            )
+        return tasks
+
     def post_first_transfer(
         self,
         transferred_file: Path,
@@ -1,7 +1,16 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Callable, List, NamedTuple
+from typing import (
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Set,
+)
 
 
 class TiltInfoExtraction(NamedTuple):
@@ -94,3 +103,127 @@ tomo_tilt_info = {
         _get_tilt_tag_v5_12,
     ),
 }
+
+
+class TiltSeriesTracker(Mapping[str, List[Path]]):
+    """
+    The movies seen for each tilt series, in the order in which they were
+    seen, together with indexes that keep the queries made for every new
+    movie independent of the number and size of tilt series: the angles
+    seen in each series, the size of the largest series, the incomplete
+    series of that size, and which series are complete or aligned.
+
+    Sizes of tilt series only ever grow, so the largest size is a running
+    maximum.
+
+    Tilt series can be given the angles they are expected to contain, eg. from
+    their tilt schedule. Such a tilt series is complete once all its expected
+    angles have been seen, and it is not counted among the incomplete largest
+    series, whose completion has to be guessed.
+    """
+
+    def __init__(self):
+        self._movies: Dict[str, List[Path]] = {}
+        self._known_movies: Set[Path] = set()
+        self._angles: Dict[str, Set[str]] = {}
+        # order in which the tilt series were first seen
+        self._order: Dict[str, int] = {}
+        self._largest = 0
+        self._incomplete_largest: Set[str] = set()
+        # completed tilt series, in the order in which they were completed
+        self._completed: Dict[str, None] = {}
+        self._aligned: Set[str] = set()
+        # expected angles not yet seen in tilt series with known tilt schedules
+        self._missing: Dict[str, Set[str]] = {}
+
+    def __repr__(self) -> str:
+        return f"<TiltSeriesTracker {len(self._movies)} tilt series, {len(self._completed)} complete>"
+
+    def __getitem__(self, tilt_series: str) -> List[Path]:
+        return self._movies[tilt_series]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._movies)
+
+    def __len__(self) -> int:
+        return len(self._movies)
+
+    @property
+    def largest(self) -> int:
+        """The number of movies in the largest tilt series"""
+        return self._largest
+
+    @property
+    def completed(self) -> List[str]:
+        return list(self._completed)
+
+    @property
+    def completed_count(self) -> int:
+        return len(self._completed)
+
+    def add(self, tilt_series: str, movie: Path, angle: str) -> bool:
+        """
+        Add a movie to a tilt series, unless it has been added before or the
+        tilt series already has a movie at the same angle. Returns whether
+        the movie was added.
+        """
+        if movie in self._known_movies:
+            return False
+        angles = self._angles.setdefault(tilt_series, set())
+        if angle in angles:
+            return False
+        angles.add(angle)
+        self._known_movies.add(movie)
+        if tilt_series not in self._movies:
+            self._order[tilt_series] = len(self._order)
+        movies = self._movies.setdefault(tilt_series, [])
+        movies.append(movie)
+        if len(movies) > self._largest:
+            self._largest = len(movies)
+            self._incomplete_largest = set()
+        if tilt_series in self._missing:
+            self._missing[tilt_series].discard(angle)
+        elif len(movies) == self._largest and tilt_series not in self._completed:
+            self._incomplete_largest.add(tilt_series)
+        return True
+
+    def expect(self, tilt_series: str, angles: Collection[str]):
+        """Set the angles which a tilt series is expected to contain"""
+        self._missing[tilt_series] = set(angles) - self._angles.get(tilt_series, set())
+        self._incomplete_largest.discard(tilt_series)
+
+    def is_scheduled(self, tilt_series: str) -> bool:
+        """Whether the angles expected in a tilt series are known"""
+        return tilt_series in self._missing
+
+    def all_expected_seen(self, tilt_series: str) -> bool:
+        """Whether all angles expected in a tilt series have been seen"""
+        return tilt_series in self._missing and not self._missing[tilt_series]
+
+    def incomplete_largest(self) -> List[str]:
+        """
+        The incomplete tilt series that are as large as the largest series,
+        in the order in which they were first seen
+        """
+        return sorted(self._incomplete_largest, key=self._order.__getitem__)
+
+    def is_complete(self, tilt_series: str) -> bool:
+        return tilt_series in self._completed
+
+    def mark_complete(self, tilt_series: str):
+        self._completed[tilt_series] = None
+        self._incomplete_largest.discard(tilt_series)
+
+    def reopen(self, tilt_series: str):
+        """Mark a tilt series as neither complete nor aligned"""
+        self._completed.pop(tilt_series, None)
+        self._aligned.discard(tilt_series)
+        movies = self._movies.get(tilt_series)
+        if movies and len(movies) == self._largest and tilt_series not in self._missing:
+            self._incomplete_largest.add(tilt_series)
+
+    def is_aligned(self, tilt_series: str) -> bool:
+        return tilt_series in self._aligned
+
+    def mark_aligned(self, tilt_series: str):
+        self._aligned.add(tilt_series)
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+import requests
+
+logger = logging.getLogger("murfey.client.dispatch")
+
+
+class DispatcherStatistics(NamedTuple):
+    queued: int
+    in_flight: int
+    completed: int
+    failed: int
+    mean_latency: float
+    max_latency: float
+
+
+class _Request(NamedTuple):
+    url: str
+    json: Any
+    key: str | None
+    future: Future
+    queue_time: float
+
+
+class _Batch(NamedTuple):
+    items: list
+    timer: threading.Timer
+
+
+class APIDispatcher:
+    """
+    Send POST requests to the Murfey server in the background over a pool of
+    keep-alive connections, so that callers do not wait for the server.
+
+    Requests sharing a key are sent one at a time in the order they were made,
+    as the server may depend on that order (eg. a data collection has to be
+    registered before its processing jobs). Requests with different keys, or
+    without a key, are sent in parallel. Once max_queued requests are
+    outstanding further calls to post() block until requests complete.
+    Failed requests are retried with exponential backoff.
+
+    Items passed to post_coalesced() are collected for up to coalesce_window
+    seconds, or until coalesce_max items have been collected, and sent to
+    the server together as a list.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queued: int = 10000,
+        retries: int = 3,
+        backoff: float = 0.5,
+        coalesce_window: float = 0.5,
+        coalesce_max: int = 100,
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="APIDispatcher"
+        )
+        self._window = threading.BoundedSemaphore(max_queued)
+        self._retries = retries
+        self._backoff = backoff
+        self._coalesce_window = coalesce_window
+        self._coalesce_max = coalesce_max
+        self._batches: dict[tuple[str, str | None], _Batch] = {}
+        self._sessions = threading.local()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # requests waiting for an earlier request with the same key to complete
+        self._lanes: dict[str, collections.deque[_Request]] = {}
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_latency: float = 0
+        self._max_latency: float = 0
+
+    def __repr__(self) -> str:
+        return f"<APIDispatcher {self.statistics}>"
+
+    @property
+    def statistics(self) -> DispatcherStatistics:
+        with self._lock:
+            finished = self._completed + self._failed
+            return DispatcherStatistics(
+                queued=self._queued,
+                in_flight=self._in_flight,
+                completed=self._completed,
+                failed=self._failed,
+                mean_latency=self._total_latency / finished if finished else 0,
+                max_latency=self._max_latency,
+            )
+
+    def post(self, url: str, json: Any = None, key: str | None = None) -> Future:
+        """
+        Queue a POST request. Returns a future for the response, which raises
+        if the request failed after all retries.
+        """
+        self._window.acquire()
+        request = _Request(url, json, key, Future(), time.perf_counter())
+        with self._lock:
+            self._queued += 1
+            if key is not None:
+                if key in self._lanes:
+                    self._lanes[key].append(request)
+                    return request.future
+                self._lanes[key] = collections.deque()
+        self._executor.submit(self._send, request)
+        return request.future
+
+    def post_coalesced(self, url: str, item: Any, key: str | None = None):
+        """
+        Queue an item to be sent to url in a list together with other items
+        for the same url and key.
+        """
+        with self._lock:
+            batch = self._batches.get((url, key))
+            if batch is None:
+                items: list = []
+                timer = threading.Timer(
+                    self._coalesce_window, self._flush_batch, args=(url, key, items)
+                )
+                timer.daemon = True
+                batch = self._batches[(url, key)] = _Batch(items, timer)
+                timer.start()
+            batch.items.append(item)
+            full = len(batch.items) >= self._coalesce_max
+        if full:
+            self._flush_batch(url, key)
+
+    def _flush_batch(self, url: str, key: str | None, items: list | None = None):
+        """
+        Send the items collected for url and key. If items is given they are
+        only sent if they are still the current batch, so that the timer of a
+        batch that was sent early cannot cut the following batch short.
+        """
+        with self._lock:
+            batch = self._batches.get((url, key))
+            if batch is None or (items is not None and batch.items is not items):
+                return
+            del self._batches[(url, key)]
+        batch.timer.cancel()
+        if batch.items:
+            self.post(url, json=batch.items, key=key)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._sessions.session = session
+        return session
+
+    def _send(self, request: _Request):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        response: requests.Response | None = None
+        error: Exception | None = None
+        for attempt in range(self._retries + 1):
+            if attempt:
+                time.sleep(self._backoff * 2 ** (attempt - 1))
+            try:
+                response = self._session().post(request.url, json=request.json)
+            except requests.RequestException as e:
+                logger.warning(f"Request to {request.url} failed: {e}")
+                response, error = None, e
+                continue
+            except Exception as e:
+                logger.error(
+                    f"Unhandled exception {e} sending request to {request.url}",
+                    exc_info=True,
+                )
+                response, error = None, e
+                break
+            if response.status_code < 500:
+                break
+            logger.warning(
+                f"Request to {request.url} failed with status {response.status_code}"
+            )
+        latency = time.perf_counter() - request.queue_time
+        succeeded = response is not None and response.ok
+
+        with self._lock:
+            self._in_flight -= 1
+            if succeeded:
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+            next_request = None
+            if request.key is not None:
+                if self._lanes[request.key]:
+                    next_request = self._lanes[request.key].popleft()
+                else:
+                    del self._lanes[request.key]
+            if not (self._queued or self._in_flight):
+                self._idle.notify_all()
+        self._window.release()
+        if next_request is not None:
+            self._executor.submit(self._send, next_request)
+
+        if response is None:
+            logger.error(f"Giving up on request to {request.url}")
+            request.future.set_exception(
+                error or RuntimeError(f"Request to {request.url} failed")
+            )
+            return
+        if not succeeded:
+            logger.error(
+                f"Request to {request.url} was not successful: {response.status_code} {response.text}"
+            )
+        request.future.set_result(response)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait for all queued requests to complete"""
+        with self._lock:
+            pending = list(self._batches)
+        for url, key in pending:
+            self._flush_batch(url, key)
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: not (self._queued or self._in_flight), timeout=timeout
+            )
+
+    def shutdown(self):
+        self.join()
+        self._executor.shutdown(wait=True)
+        logger.info(f"API requests completed: {self.statistics}")
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import enum
+import logging
+import threading
+from typing import Any, Callable, ContextManager, Dict, List, Mapping, NamedTuple
+
+logger = logging.getLogger("murfey.client.environment_store")
+
+
+class Change(enum.Enum):
+    ADDED = "added"
+    UPDATED = "updated"
+    REMOVED = "removed"
+
+
+class EnvironmentChange(NamedTuple):
+    attribute: str
+    key: Any
+    change: Change
+    # the new value of the entry, or the value it had when it was removed
+    value: Any
+
+
+class EnvironmentStore:
+    """
+    Dictionaries of the instance environment that change one entry at a time.
+    Every change of an entry becomes an EnvironmentChange event, which is
+    passed to the listeners subscribed to that dictionary. Changes are never
+    found by comparing whole dictionaries, so the cost of a change does not
+    depend on the number of entries, except when a whole dictionary is
+    replaced.
+
+    The dictionaries are changed in place, so that references to them stay
+    valid, and can be read without taking the lock, as the lock only keeps
+    concurrent changes apart. Listeners are called after the change has been
+    made, outside of the lock.
+    """
+
+    def __init__(self, data: Dict[str, dict], lock: ContextManager | None = None):
+        self._data = data
+        self._listeners: Dict[str, List[Callable[[EnvironmentChange], Any]]] = {
+            attribute: [] for attribute in data
+        }
+        self._lock = lock or threading.RLock()
+        self.events = 0
+
+    def __repr__(self) -> str:
+        entries = ", ".join(f"{a}: {len(d)}" for a, d in self._data.items())
+        return f"<EnvironmentStore {entries}; {self.events} events>"
+
+    def __contains__(self, attribute: object) -> bool:
+        return attribute in self._data
+
+    def __getitem__(self, attribute: str) -> dict:
+        return self._data[attribute]
+
+    def subscribe(self, attribute: str, fn: Callable[[EnvironmentChange], Any]):
+        self._listeners[attribute].append(fn)
+
+    def unsubscribe(self, attribute: str, fn: Callable[[EnvironmentChange], Any]):
+        if fn in self._listeners[attribute]:
+            self._listeners[attribute].remove(fn)
+
+    def put(self, attribute: str, key: Any, value: Any):
+        self.update(attribute, {key: value})
+
+    def update(self, attribute: str, entries: Mapping):
+        """Add or update the given entries of a dictionary"""
+        with self._lock:
+            changes = self._update(attribute, entries)
+        self._dispatch(attribute, changes)
+
+    def remove(self, attribute: str, key: Any):
+        current = self._data[attribute]
+        with self._lock:
+            if key not in current:
+                return
+            change = EnvironmentChange(attribute, key, Change.REMOVED, current.pop(key))
+        self._dispatch(attribute, [change])
+
+    def replace(self, attribute: str, entries: Mapping):
+        """
+        Replace all entries of a dictionary, with events for the entries that
+        were removed, added or changed
+        """
+        current = self._data[attribute]
+        with self._lock:
+            changes = [
+                EnvironmentChange(attribute, key, Change.REMOVED, current.pop(key))
+                for key in [k for k in current if k not in entries]
+            ]
+            changes.extend(self._update(attribute, entries))
+        self._dispatch(attribute, changes)
+
+    def _update(self, attribute: str, entries: Mapping) -> List[EnvironmentChange]:
+        current = self._data[attribute]
+        changes = []
+        for key, value in entries.items():
+            if key not in current:
+                changes.append(EnvironmentChange(attribute, key, Change.ADDED, value))
+            elif current[key] != value:
+                changes.append(EnvironmentChange(attribute, key, Change.UPDATED, value))
+            else:
+                continue
+            current[key] = value
+        return changes
+
+    def _dispatch(self, attribute: str, changes: List[EnvironmentChange]):
+        if not changes:
+            return
+        self.events += len(changes)
+        for change in changes:
+            for fn in self._listeners[attribute]:
+                try:
+                    fn(change)
+                except Exception as e:
+                    logger.error(
+                        f"Unhandled exception {e} in listener for {attribute} change of {change.key}",
+                        exc_info=True,
+                    )
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+from functools import lru_cache
+
+log = logging.getLogger("murfey.client.inotify")
+
+# Constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+@lru_cache(maxsize=1)
+def _libc() -> ctypes.CDLL | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1") or not hasattr(libc, "inotify_add_watch"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def inotify_available() -> bool:
+    return _libc() is not None
+
+
+class InotifyEventSource:
+    """
+    Recursively watch a directory tree using inotify. New subdirectories are
+    watched as they appear, and files already present in them are reported as
+    changed, so that nothing created before the watch was set up is missed.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        libc = _libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available on this system")
+        self._libc = libc
+        self._basepath = os.fspath(path)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches: dict[int, str] = {}
+        self._add_tree(self._basepath)
+
+    def __repr__(self) -> str:
+        return f"<InotifyEventSource ({self._basepath}, {len(self._watches)} watches)>"
+
+    def _add_watch(self, path: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                log.warning(
+                    f"inotify watch limit reached, changes below {path!r} will only be found by polling"
+                )
+            elif err not in (errno.ENOENT, errno.ENOTDIR):
+                log.warning(f"Could not watch {path!r}: {os.strerror(err)}")
+            return False
+        self._watches[wd] = path
+        return True
+
+    def _add_tree(self, path: str) -> list[str]:
+        # Set up the watch before listing the directory, so that files created
+        # in between are reported at least once
+        if not self._add_watch(path):
+            return []
+        files: list[str] = []
+        try:
+            directory_contents = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return files
+        for entry in directory_contents:
+            if entry.is_dir(follow_symlinks=False):
+                files.extend(self._add_tree(entry.path))
+            else:
+                files.append(entry.path)
+        return files
+
+    def read(self, timeout: float) -> list[str] | None:
+        """
+        Wait up to timeout seconds for file system events and return the paths
+        of files that may have changed. Returns None if the kernel event queue
+        overflowed, in which case a full rescan is required.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return []
+
+        changed: list[str] = []
+        overflow = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[
+                offset + _EVENT_HEADER.size : offset + _EVENT_HEADER.size + length
+            ].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # the watched directory has been removed
+                del self._watches[wd]
+                continue
+            if not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend(self._add_tree(path))
+                continue
+            changed.append(path)
+        if overflow:
+            return None
+        return list(dict.fromkeys(changed))
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._watches = {}
@@ -1,15 +1,19 @@
 from __future__ import annotations
 
 import logging
+import time
 from itertools import count
 from pathlib import Path
-from threading import RLock
-from typing import Callable, Dict, List, NamedTuple, Optional, Set
+from typing import Callable, ClassVar, Dict, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import ParseResult
 
-from pydantic import BaseModel, validator
+import requests
+from pydantic import BaseModel, PrivateAttr, parse_obj_as
 
+from murfey.client.dispatch import APIDispatcher
+from murfey.client.environment_store import Change, EnvironmentChange, EnvironmentStore
 from murfey.client.watchdir import DirWatcher
+from murfey.util.locks import KeyedLocks, LockStatistics, MeasuredLock
 
 logger = logging.getLogger("murfey.client.instance_environment")
 
@@ -22,7 +26,9 @@ class MovieTracker(NamedTuple):
     motion_correction_uuid: int
 
 
-global_env_lock = RLock()
+# lock for the environment as a whole, eg. the data collection group, while
+# the entries for each tilt series have their own locks
+global_env_lock = MeasuredLock("environment")
 
 
 class MurfeyInstanceEnvironment(BaseModel):
@@ -31,6 +37,7 @@ class MurfeyInstanceEnvironment(BaseModel):
     source: Optional[Path] = None
     default_destination: str = ""
     watcher: Optional[DirWatcher] = None
+    dispatcher: Optional[APIDispatcher] = None
     demo: bool = False
     data_collection_group_id: Optional[int] = None
     data_collection_ids: Dict[str, int] = {}
@@ -45,105 +52,192 @@ class MurfeyInstanceEnvironment(BaseModel):
     visit: str = ""
     processing_only_mode: bool = False
     gain_ref: Optional[Path] = None
+    machine_config: dict = {}
+    machine_config_etag: str = ""
+    machine_config_checked: float = 0
+
+    # seconds before a cached machine configuration is checked with the server
+    machine_config_max_age: ClassVar[float] = 60
+    # dictionaries whose entries are changed through the environment store
+    stored_attributes: ClassVar[Tuple[str, ...]] = (
+        "data_collection_ids",
+        "processing_job_ids",
+        "autoproc_program_ids",
+        "motion_corrected_movies",
+    )
+
+    _store: EnvironmentStore = PrivateAttr()
+    _store_lock: MeasuredLock = PrivateAttr(
+        default_factory=lambda: MeasuredLock("store")
+    )
+    _tag_locks: KeyedLocks = PrivateAttr(default_factory=lambda: KeyedLocks("tag"))
+    # motion corrected movies by the name of the movie
+    _motion_corrected_names: Dict[str, List[str]] = PrivateAttr(default_factory=dict)
 
     class Config:
         validate_assignment: bool = True
         arbitrary_types_allowed: bool = True
 
-    @validator("data_collection_group_id")
-    def dcg_callback(cls, v, values):
-        with global_env_lock:
-            for l in values.get("listeners", {}).get("data_collection_group_id", []):
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._store = EnvironmentStore(
+            {
+                attribute: getattr(self, attribute)
+                for attribute in self.stored_attributes
+            },
+            lock=self._store_lock,
+        )
+        for attribute in self.stored_attributes:
+            self._store.subscribe(attribute, self._call_listeners)
+        self._motion_corrected_names.update(
+            (str(movie), value) for movie, value in self.motion_corrected_movies.items()
+        )
+
+    def __setattr__(self, name, value):
+        # assigning a whole dictionary replaces its entries in the store, which
+        # only tells listeners about the entries that changed
+        if name in self.stored_attributes:
+            self._store.replace(
+                name, parse_obj_as(self.__fields__[name].outer_type_, value)
+            )
+            return
+        if name == "data_collection_group_id":
+            # listeners are called once the new value is visible, so that
+            # anything stashed by a thread which saw no value under the lock is
+            # flushed by the listeners
+            with global_env_lock:
+                super().__setattr__(name, value)
+            for l in self.listeners.get("data_collection_group_id", []):
                 l()
-        return v
-
-    @validator("data_collection_ids")
-    def dc_callback(cls, v, values):
-        with global_env_lock:
-            for l in values.get("listeners", {}).get("data_collection_ids", []):
-                if values.get("data_collection_ids"):
-                    for k in set(values["data_collection_ids"].keys()) ^ set(v.keys()):
-                        l(k)
-                else:
-                    for k in v.keys():
-                        l(k)
-        return v
-
-    @validator("autoproc_program_ids")
-    def app_callback(cls, v, values):
-        # logger.info(f"autoproc program ids validator: {v}")
-        with global_env_lock:
-            for l in values.get("listeners", {}).get("autoproc_program_ids", []):
-                if values.get("autoproc_program_ids"):
-                    for k in set(values["autoproc_program_ids"].keys()) ^ set(v.keys()):
-                        if v[k].get("em-tomo-preprocess"):
-                            l(k, v[k]["em-tomo-preprocess"])
-                else:
-                    for k in v.keys():
-                        if v[k].get("em-tomo-preprocess"):
-                            l(k, v[k]["em-tomo-preprocess"])
-        return v
-
-    @validator("motion_corrected_movies")
-    def motion_corrected_callback(cls, v, values):
-        # logger.info("motion corrected callback")
-        _url = f"{str(values['url'].geturl())}/visits/{values['visit']}/align"
-        for l in values.get("listeners", {}).get("motion_corrected_movies", []):
-            if values.get("motion_corrected_movies"):
-                for k in set(values["motion_corrected_movies"].keys()) ^ set(
-                    v.keys()
-                ):  # k is a path (key), v[k] is the value matching the key
-                    tilt = values["movie_tilt_pair"][k]
+            return
+        super().__setattr__(name, value)
+
+    @property
+    def store(self) -> EnvironmentStore:
+        return self._store
+
+    def tag_lock(self, tag: str) -> MeasuredLock:
+        """
+        The lock for the entries of a tilt series (or other tag). Listeners for
+        changes of those entries are called while holding it.
+        """
+        return self._tag_locks[tag]
+
+    def lock_statistics(self) -> Dict[str, LockStatistics]:
+        return {
+            "environment": global_env_lock.statistics,
+            "store": self._store_lock.statistics,
+            "tags": self._tag_locks.statistics,
+        }
+
+    def get_machine_config(self) -> dict:
+        """
+        Return the machine configuration of the server. The configuration is
+        cached, and revalidated with a conditional request once it is older than
+        machine_config_max_age seconds.
+        """
+        now = time.monotonic()
+        if (
+            self.machine_config
+            and now - self.machine_config_checked < self.machine_config_max_age
+        ):
+            return self.machine_config
+        headers = (
+            {"If-None-Match": self.machine_config_etag}
+            if self.machine_config and self.machine_config_etag
+            else {}
+        )
+        try:
+            response = requests.get(f"{self.url.geturl()}/machine/", headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+                self.machine_config = response.json()
+                self.machine_config_etag = response.headers.get("ETag", "")
+        except requests.RequestException as e:
+            if not self.machine_config:
+                raise
+            logger.warning(f"Could not refresh machine configuration: {e}")
+        self.machine_config_checked = now
+        return self.machine_config
+
+    def apply_state_delta(self, attribute: str, op: str, value):
+        """
+        Apply a change of the server state to the matching attribute. Entries
+        added to a dictionary are added in place, and listeners are only told
+        about the added entries, so that the cost does not grow with the size
+        of the dictionary.
+        """
+        if attribute not in self.__fields__:
+            return
+        if op == "set":
+            setattr(self, attribute, value)
+        elif op == "remove":
+            setattr(self, attribute, self.__fields__[attribute].get_default())
+        elif op == "add":
+            current = getattr(self, attribute)
+            if not isinstance(current, dict):
+                setattr(self, attribute, value)
+                return
+            entries = parse_obj_as(self.__fields__[attribute].outer_type_, value)
+            if attribute in self._store:
+                self._store.update(attribute, entries)
+            else:
+                with global_env_lock:
+                    current.update(entries)
+
+    def _call_listeners(self, change: EnvironmentChange):
+        """
+        Call the listeners for a dictionary attribute of the environment with
+        an entry that was added or updated
+        """
+        if change.attribute == "motion_corrected_movies":
+            if change.change is Change.REMOVED:
+                self._motion_corrected_names.pop(str(change.key), None)
+            else:
+                self._motion_corrected_names[str(change.key)] = change.value
+        if change.change is Change.REMOVED:
+            return
+        listeners = self.listeners.get(change.attribute)
+        if not listeners:
+            return
+        k, v = change.key, change.value
+        if change.attribute == "data_collection_ids":
+            with self.tag_lock(k):
+                for l in listeners:
+                    l(k)
+        elif change.attribute == "autoproc_program_ids":
+            with self.tag_lock(k):
+                for l in listeners:
+                    if v.get("em-tomo-preprocess"):
+                        l(k, v["em-tomo-preprocess"])
+        elif change.attribute == "motion_corrected_movies":
+            _url = f"{str(self.url.geturl())}/visits/{self.visit}/align"
+            for l in listeners:
+                try:
+                    # possible race condition here where values accessing by [k] sometimes aren't ready when we
+                    # try to access them - it throws a key error for a value which has just been set.
+                    tilt = self.movie_tilt_pair[k]
                     file_tilt_list = []
-                    for movie, angle in values["tilt_angles"][tilt]:
-                        if movie in v:  # values["motion_corrected_movies"]:
-                            # file_tilt_list.append(
-                            #    [values["motion_corrected_movies"][movie], angle]
-                            # )
+                    for movie, angle in self.tilt_angles[tilt]:
+                        if motion_corrected := self._motion_corrected_names.get(movie):
                             file_tilt_list.append(
                                 [
-                                    str(v[Path(movie)][0]),
+                                    str(motion_corrected[0]),
                                     angle,
-                                    str(v[Path(movie)][1]),
+                                    str(motion_corrected[1]),
                                 ]
                             )
                     l(
                         k,
-                        v[k][0],
+                        v[0],
                         _url,
-                        values["processing_job_ids"][k]["em-tomo-align"],
-                        values["autoproc_program_ids"][k]["em-tomo-align"],
-                        v[k][1],
+                        self.data_collection_ids[tilt],
+                        self.processing_job_ids[tilt]["em-tomo-align"],
+                        self.autoproc_program_ids[tilt]["em-tomo-align"],
+                        v[1],
                         file_tilt_list,
                     )
-            else:
-                for k in v.keys():
-                    try:
-                        # possible race condition here where values accessing by [k] sometimes aren't ready when we
-                        # try to access them - it throws a key error for a value which has just been set.
-                        tilt = values["movie_tilt_pair"][k]
-                        file_tilt_list = []
-                        for movie, angle in values["tilt_angles"][tilt]:
-                            # file_tilt_list.append([str(movie), angle])
-                            file_tilt_list.append(
-                                [
-                                    str(v[Path(movie)][0]),
-                                    angle,
-                                    str(v[Path(movie)][1]),
-                                ]
-                            )  # or v(k)
-                        l(
-                            k,
-                            v[k][0],
-                            _url,
-                            values["data_collection_ids"][tilt],
-                            values["processing_job_ids"][tilt]["em-tomo-align"],
-                            values["autoproc_program_ids"][tilt]["em-tomo-align"],
-                            v[k][1],
-                            file_tilt_list,
-                        )
-                    except KeyError:
-                        pass
-                    except Exception as e:
-                        logger.warning(f"ERROR {e}")
-        return v
+                except KeyError:
+                    pass
+                except Exception as e:
+                    logger.warning(f"ERROR {e}")
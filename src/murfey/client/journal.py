@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import enum
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+log = logging.getLogger("murfey.client.journal")
+
+
+class FileState(enum.IntEnum):
+    SETTLED = 1
+    QUEUED = 2
+    TRANSFERRED = 3
+
+
+class JournalEntry(NamedTuple):
+    size: int | None
+    modification_time: float | None
+    state: FileState
+
+
+class TransferJournal:
+    """
+    Durable record of the files a client has settled, queued and transferred,
+    kept in an SQLite database so that a restarted client can resume a session
+    without offering every file for transfer again. File paths are stored
+    relative to the watched directory.
+
+    Writes are buffered and committed in groups, at the latest after the
+    flush interval. Records lost in a crash only cause the affected files to
+    be transferred again.
+    """
+
+    _flush_records = 1000
+    _flush_interval: float = 1
+
+    def __init__(self, path: str | os.PathLike):
+        self._path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, modification_time REAL, "
+            "state INTEGER NOT NULL)"
+        )
+        self._connection.commit()
+        self._pending: list[tuple[str, int | None, float | None, int]] = []
+        self._last_flush = time.monotonic()
+        # flushes buffered records if no further record comes along to do so
+        self._flush_timer: threading.Timer | None = None
+
+    def __repr__(self) -> str:
+        return f"<TransferJournal ({self._path})>"
+
+    def record(
+        self,
+        file_path: str,
+        state: FileState,
+        size: int | None = None,
+        modification_time: float | None = None,
+    ):
+        """
+        Record a change of state of a file. Size and modification time are
+        kept from earlier records unless given.
+        """
+        with self._lock:
+            self._pending.append((file_path, size, modification_time, state))
+            if (
+                len(self._pending) >= self._flush_records
+                or time.monotonic() - self._last_flush > self._flush_interval
+            ):
+                self._flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._pending:
+            self._connection.executemany(
+                "INSERT INTO files (path, size, modification_time, state) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                "size = coalesce(excluded.size, size), "
+                "modification_time = coalesce(excluded.modification_time, modification_time), "
+                "state = excluded.state",
+                self._pending,
+            )
+            self._connection.commit()
+            log.debug(f"{len(self._pending)} records written to {self}")
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def entries(self, state: FileState | None = None) -> dict[str, JournalEntry]:
+        with self._lock:
+            self._flush()
+            if state is None:
+                rows = self._connection.execute(
+                    "SELECT path, size, modification_time, state FROM files"
+                )
+            else:
+                rows = self._connection.execute(
+                    "SELECT path, size, modification_time, state FROM files WHERE state = ?",
+                    (state,),
+                )
+            return {
+                path: JournalEntry(size, modification_time, FileState(file_state))
+                for path, size, modification_time, file_state in rows
+            }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._connection.close()
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import heapq
+import itertools
 import logging
 import os
 import queue
+import re
 import threading
 import time
-from enum import Enum
+from enum import Enum, IntEnum
+from functools import lru_cache
 from pathlib import Path
-from typing import NamedTuple
+from typing import Callable, NamedTuple
 from urllib.parse import ParseResult
 
 import procrunner
+import requests
 
+from murfey.client.journal import FileState, TransferJournal
 from murfey.client.tui.status_bar import StatusBar
 from murfey.util import Observer
 
@@ -27,6 +33,41 @@ logger = logging.getLogger("murfey.client.rsync")
 #
 # sent 3,785 bytes  received 355 bytes  2,760.00 bytes/sec
 # total size is 314,923,092  speedup is 76,068.38 (DRY RUN)
+#
+# With machine-readable output rsync instead writes one line per file, once
+# the file has been handled, in the format given by _OUT_FORMAT:
+# murfey:<f+++++++++:3136:3136:tests/server/test_main.py
+# murfey:.f.........:1024:0:README.md
+
+# item changes, file length, bytes transferred and file name. The name comes
+# last so that it may contain the separator
+_OUT_FORMAT = "murfey:%i:%l:%b:%n"
+_OUT_PREFIX = "murfey:"
+
+_RSYNC_VERSION = re.compile(r"rsync\s+version\s+v?(\d+)\.(\d+)")
+
+
+@lru_cache(maxsize=1)
+def _rsync_has_machine_readable_output() -> bool:
+    """
+    Whether the local rsync supports --info=name2, which is needed for
+    machine-readable output. It was added in rsync 3.1, so older versions
+    such as the 2.6.9 shipped with macOS have to be parsed verbosely.
+    """
+    try:
+        result = procrunner.run(
+            ["rsync", "--version"], print_stdout=False, print_stderr=False
+        )
+    except OSError as e:
+        logger.warning(f"Could not run rsync to determine its version: {e}")
+        return False
+    version = _RSYNC_VERSION.search(result.stdout.decode(errors="replace"))
+    if result.returncode or not version:
+        logger.warning("Could not determine the rsync version")
+        return False
+    major, minor = int(version.group(1)), int(version.group(2))
+    logger.info(f"Found rsync version {major}.{minor}")
+    return (major, minor) >= (3, 1)
 
 
 class TransferResult(Enum):
@@ -41,9 +82,127 @@ class RSyncerUpdate(NamedTuple):
     transfer_total: int
     queue_size: int
     base_path: Path | None = None
+    # the file was transferred again on request, after an earlier success
+    retransfer: bool = False
+
+
+class TransferPriority(IntEnum):
+    # small files gating processing, such as .xml, .mdoc and gain references
+    METADATA = 0
+    DATA = 1
+
+
+_data_suffixes = (".mrc", ".tiff", ".tif", ".eer")
+
+
+def transfer_priority(file_path: Path) -> TransferPriority:
+    if file_path.suffix.lower() in _data_suffixes:
+        return TransferPriority.DATA
+    return TransferPriority.METADATA
+
+
+class _TransferQueue(queue.Queue):
+    """
+    A queue handing out files by transfer priority, and in the order they
+    were queued within each priority. None, used to stop the RSyncer thread,
+    comes last.
+    """
+
+    def _init(self, maxsize):
+        self._heap: list[tuple[int, int, Path | None]] = []
+        self._count = itertools.count()
+
+    def _qsize(self):
+        return len(self._heap)
+
+    def _put(self, item: Path | None):
+        priority = len(TransferPriority) if item is None else transfer_priority(item)
+        heapq.heappush(self._heap, (priority, next(self._count), item))
+
+    def _get(self) -> Path | None:
+        return heapq.heappop(self._heap)[2]
+
+
+def _file_size(file_path: Path) -> int:
+    try:
+        return file_path.stat().st_size
+    except OSError:
+        return 0
+
+
+class _OutFormatLine(NamedTuple):
+    changes: str
+    file_size: int
+    bytes_transferred: int
+    file_path: Path
+
+
+def _parse_out_format(line: str) -> _OutFormatLine | None:
+    """
+    Parse a line of rsync output written with _OUT_FORMAT. Returns None for
+    any other output and for items that are not regular files.
+    """
+    if not line.startswith(_OUT_PREFIX):
+        return None
+    try:
+        changes, length, transferred, name = line[len(_OUT_PREFIX) :].split(":", 3)
+        if changes[1:2] != "f":
+            return None
+        return _OutFormatLine(changes, int(length), int(transferred), Path(name))
+    except ValueError:
+        logger.warning(f"Could not parse rsync output line {line!r}")
+        return None
+
+
+class BatchStatistics:
+    """
+    Running totals and the distribution of batch sizes (in files) of the rsync
+    invocations made by an RSyncer
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.files = 0
+        self.bytes = 0
+        self.duration: float = 0
+        # number of batches by size, binned by the next power of two
+        self.histogram: dict[int, int] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"<BatchStatistics {self.batches} batches, "
+            f"{self.mean_files:.1f} files / {self.mean_bytes:.0f} bytes per batch, "
+            f"{self.throughput:.0f} bytes/s>"
+        )
+
+    def record(self, files: int, size: int, duration: float):
+        self.batches += 1
+        self.files += files
+        self.bytes += size
+        self.duration += duration
+        size_bin = 1 << max(files - 1, 0).bit_length()
+        self.histogram[size_bin] = self.histogram.get(size_bin, 0) + 1
+
+    @property
+    def mean_files(self) -> float:
+        return self.files / self.batches if self.batches else 0
+
+    @property
+    def mean_bytes(self) -> float:
+        return self.bytes / self.batches if self.batches else 0
+
+    @property
+    def throughput(self) -> float:
+        return self.bytes / self.duration if self.duration else 0
 
 
 class RSyncer(Observer):
+    # With adaptive batching, batch limits are set so that a batch takes
+    # roughly this many seconds to transfer at the observed throughput
+    _batch_target_duration: float = 5
+    _batch_min_files = 10
+    _batch_min_bytes = 100 * 1024 * 1024
+
     def __init__(
         self,
         basepath_local: Path,
@@ -52,10 +211,56 @@ class RSyncer(Observer):
         local: bool = False,
         status_bar: StatusBar | None = None,
         do_transfer: bool = True,
+        workers: int = 1,
+        batch_max_files: int = 5000,
+        batch_max_bytes: int = 10 * 1024**3,
+        batch_max_wait: float = 1,
+        batch_idle_wait: float = 0.1,
+        adaptive_batching: bool = True,
+        backend: str = "rsync",
+        machine_readable_output: bool | None = None,
+        journal: TransferJournal | None = None,
+        bandwidth_limits: dict[TransferPriority, int] | None = None,
+        metadata_max_delay: float = 0.25,
     ):
         super().__init__()
         self._basepath = basepath_local.absolute()
         self._do_transfer = do_transfer
+        if workers < 1:
+            raise ValueError(f"RSyncer needs at least one worker, not {workers}")
+        self._workers = workers
+        self._batch_max_files = batch_max_files
+        self._batch_max_bytes = batch_max_bytes
+        self._batch_max_wait = batch_max_wait
+        self._batch_idle_wait = batch_idle_wait
+        self._adaptive_batching = adaptive_batching
+        self.batch_file_limit = batch_max_files
+        self.batch_byte_limit = batch_max_bytes
+        self.batch_statistics = BatchStatistics()
+        self._bytes_per_second: float | None = None
+        self._files_per_second: float | None = None
+        if backend not in ("rsync", "http"):
+            raise ValueError(f"Unknown transfer backend {backend!r}")
+        self._backend = backend
+        # unless asked for explicitly, machine-readable rsync output is used
+        # whenever the local rsync supports it
+        if machine_readable_output is None:
+            machine_readable_output = (
+                backend == "rsync" and _rsync_has_machine_readable_output()
+            )
+        self._machine_readable_output = machine_readable_output
+        self._journal = journal
+        # rsync --bwlimit in KiB/s for each transfer priority
+        self._bandwidth_limits = bandwidth_limits or {}
+        # how long metadata arriving while a batch of data files is put
+        # together may wait before the data batch is cut short
+        self._metadata_max_delay = metadata_max_delay
+        if journal:
+            self.subscribe(self._record_in_journal)
+        self._server_url = server_url
+        self._basepath_remote = basepath_remote
+        # one keep-alive HTTP session per transferring thread
+        self._http_sessions = threading.local()
         if local:
             self._remote = str(basepath_remote)
         else:
@@ -67,13 +272,32 @@ class RSyncer(Observer):
         self._bytes_transferred = 0
 
         # self.queue = queue.Queue[Optional[Path]]()
-        self.queue: queue.Queue[Path | None] = queue.Queue()
+        self.queue: queue.Queue[Path | None] = _TransferQueue()
+        # files queued to be transferred again regardless of the destination
+        self._retransfers: set[Path] = set()
+        # files taken from the queue that did not fit into the previous batch
+        self._held_back: list[Path] = []
         self.thread = threading.Thread(
             name=f"RSync {self._basepath}:{self._remote}", target=self._process
         )
         self._stopping = False
         self._halt_thread = False
         self._statusbar = status_bar
+        self._counter_lock = threading.Lock()
+
+        # Used when transferring with more than one worker: batches are split
+        # into chunks which are handed to the worker threads, and completed
+        # transfers are reported in the order the files were queued
+        self._worker_threads: list[threading.Thread] = []
+        self._worker_queues: list[
+            queue.Queue[tuple[int, list[tuple[int, Path]]] | None]
+        ] = [queue.Queue() for _ in range(workers)]
+        self._worker_load = [0] * workers
+        self._dispatch_lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._completed: dict[int, list[RSyncerUpdate] | None] = {}
+        self._next_notification = 0
+        self._notification_lock = threading.Lock()
 
     def __repr__(self) -> str:
         return f"<RSyncer {self._basepath} → {self._remote} ({self.status})"
@@ -112,64 +336,384 @@ class RSyncer(Observer):
             self.thread.join()
         logger.debug("RSync thread stop completed")
 
-    def enqueue(self, file_path: Path):
+    def enqueue(self, file_path: Path, retransfer: bool = False):
+        """
+        Queue a file for transfer. A retransfer is sent even if the destination
+        looks up to date to rsync, eg. because it was found to be corrupt, and
+        its outcome is reported with retransfer set.
+        """
         if not self._stopping:
             absolute_path = (self._basepath / file_path).resolve()
+            if retransfer:
+                with self._counter_lock:
+                    self._retransfers.add(absolute_path)
+            if self._journal:
+                try:
+                    relative_path = (self._basepath / file_path).relative_to(
+                        self._basepath
+                    )
+                except ValueError:
+                    pass
+                else:
+                    self._journal.record(relative_path.as_posix(), FileState.QUEUED)
             self.queue.put(absolute_path)
 
+    def _record_in_journal(self, update: RSyncerUpdate):
+        if self._journal and update.outcome is TransferResult.SUCCESS:
+            self._journal.record(update.file_path.as_posix(), FileState.TRANSFERRED)
+
     def _process(self):
         logger.info("RSync thread starting")
         files_to_transfer: list[Path]
         backoff = 0
+        if self._workers > 1:
+            self._start_workers()
         while not self._halt_thread:
-            first = self.queue.get()
+            if self._held_back:
+                first = min(self._held_back, key=transfer_priority)
+                self._held_back.remove(first)
+            else:
+                first = self.queue.get()
             if not first:
                 # allow leaving thread when 'None' is passed
                 self.queue.task_done()
                 continue
 
-            files_to_transfer = [first]
+            files_to_transfer, sizes = self._collect_batch(first)
+
+            if self._worker_threads:
+                self._dispatch(files_to_transfer, sizes)
+            else:
+                backoff = self._transfer_batch(
+                    files_to_transfer, backoff, size=sum(sizes.values())
+                )
+                self._back_off(backoff)
+
+        for worker_queue in self._worker_queues:
+            worker_queue.put(None)
+        for worker_thread in self._worker_threads:
+            worker_thread.join()
+        logger.info("RSync thread finished")
+
+    def _collect_batch(self, first: Path) -> tuple[list[Path], dict[Path, int]]:
+        """
+        Gather further files from the queue to be transferred together with the
+        first one, until either the file or byte limit for a batch is reached,
+        no file has arrived for the idle wait time or the maximum wait time has
+        passed. Batches only contain files of one transfer priority, so that
+        metadata is not held up by large data files.
+
+        Metadata arriving while a batch of data files is put together is held
+        back for the next batch. The data batch carries on growing until the
+        oldest held back file has waited for metadata_max_delay, so that
+        interleaved streams of metadata and data files do not break the data
+        into batches of single files. Data files arriving while a metadata
+        batch is put together end that batch straight away.
+        """
+        priority = transfer_priority(first)
+        files = [first]
+        held_back: list[Path] = []
+        for f in self._held_back:
+            (files if transfer_priority(f) == priority else held_back).append(f)
+        self._held_back = held_back
+        sizes = {f: _file_size(f) for f in files}
+        batch_bytes = sum(sizes.values())
+        deadline = time.monotonic() + self._batch_max_wait
+        while (
+            len(files) < self.batch_file_limit and batch_bytes < self.batch_byte_limit
+        ):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                while True:
-                    next_file = self.queue.get(block=True, timeout=0.1)
-                    if next_file:
-                        files_to_transfer.append(next_file)
-                    else:
-                        self.queue.task_done()
-                        break
+                next_file = self.queue.get(
+                    block=True, timeout=min(remaining, self._batch_idle_wait)
+                )
             except queue.Empty:
-                pass
+                break
+            if not next_file:
+                self.queue.task_done()
+                break
+            if transfer_priority(next_file) != priority:
+                self._held_back.append(next_file)
+                if priority is TransferPriority.METADATA:
+                    break
+                deadline = min(deadline, time.monotonic() + self._metadata_max_delay)
+                continue
+            files.append(next_file)
+            sizes[next_file] = _file_size(next_file)
+            batch_bytes += sizes[next_file]
+        return files, sizes
 
-            logger.info(f"Preparing to transfer {len(files_to_transfer)} files")
-            if self._do_transfer:
-                try:
-                    success = self._transfer(files_to_transfer)
-                except Exception as e:
-                    logger.error(
-                        f"Unhandled exception {e} in RSync thread", exc_info=True
-                    )
-                    success = False
+    def _record_batch(self, files: int, size: int, duration: float):
+        """
+        Keep statistics on completed transfers and, with adaptive batching,
+        scale the batch limits to the observed transfer rates.
+        """
+        with self._counter_lock:
+            self.batch_statistics.record(files, size, duration)
+            if not self._adaptive_batching or duration <= 0:
+                return
+            smoothing = 0.3
+            bytes_per_second = size / duration
+            files_per_second = files / duration
+            if self._bytes_per_second is None or self._files_per_second is None:
+                self._bytes_per_second = bytes_per_second
+                self._files_per_second = files_per_second
             else:
-                success = self._fake_transfer(files_to_transfer)
+                self._bytes_per_second += smoothing * (
+                    bytes_per_second - self._bytes_per_second
+                )
+                self._files_per_second += smoothing * (
+                    files_per_second - self._files_per_second
+                )
+            # Rates are measured per rsync process, batches are shared by all
+            target = self._batch_target_duration * self._workers
+            self.batch_byte_limit = int(
+                min(
+                    self._batch_max_bytes,
+                    max(self._batch_min_bytes, self._bytes_per_second * target),
+                )
+            )
+            self.batch_file_limit = int(
+                min(
+                    self._batch_max_files,
+                    max(self._batch_min_files, self._files_per_second * target),
+                )
+            )
 
-            logger.info(f"Completed transfer of {len(files_to_transfer)} files")
-            for _ in files_to_transfer:
-                self.queue.task_done()
-            logger.debug(
-                f"{self.queue.unfinished_tasks} files remain in queue for processing"
+    def _transfer_batch(
+        self,
+        files: list[Path],
+        backoff: int,
+        notify: Callable[[RSyncerUpdate], None] | None = None,
+        size: int = 0,
+    ) -> int:
+        """
+        Transfer a batch of files and mark them as done in the queue. Returns
+        the updated backoff time, which the caller should wait for with
+        _back_off once the outcomes of the transfer have been passed on.
+        """
+        logger.info(f"Preparing to transfer {len(files)} files")
+        transfer_start = time.perf_counter()
+        retransfers = self._take_retransfers(files)
+        if retransfers:
+            notify = self._mark_retransfers(notify or self.notify, retransfers)
+        if self._do_transfer:
+            # both the HTTP backend and machine-readable rsync output report
+            # the bytes actually sent for every file, so use those rather than
+            # the sizes seen when the batch was put together, which include
+            # files that were already up to date
+            exact_sizes = self._backend == "http" or self._machine_readable_output
+            bytes_sent = 0
+
+            def count_bytes(sent: int):
+                nonlocal bytes_sent
+                bytes_sent += sent
+
+            try:
+                if self._backend == "http":
+                    success = self._upload(
+                        files, notify=notify, count_bytes=count_bytes
+                    )
+                else:
+                    # rsync would skip retransfers whose destination has the
+                    # same size and modification time, so they are sent on
+                    # their own with --ignore-times
+                    success = True
+                    for group, ignore_times in (
+                        ([f for f in files if f not in retransfers], False),
+                        ([f for f in files if f in retransfers], True),
+                    ):
+                        if group:
+                            success &= self._transfer(
+                                group,
+                                notify=notify,
+                                count_bytes=count_bytes,
+                                ignore_times=ignore_times,
+                            )
+            except Exception as e:
+                logger.error(f"Unhandled exception {e} in RSync thread", exc_info=True)
+                success = False
+            if exact_sizes:
+                size = bytes_sent
+        else:
+            success = self._fake_transfer(files, notify=notify)
+
+        logger.info(f"Completed transfer of {len(files)} files")
+        if success:
+            self._record_batch(len(files), size, time.perf_counter() - transfer_start)
+        for _ in files:
+            self.queue.task_done()
+        logger.debug(
+            f"{self.queue.unfinished_tasks} files remain in queue for processing"
+        )
+
+        if success:
+            return 0
+        return min(backoff * 2 + 1, 120)
+
+    def _take_retransfers(self, files: list[Path]) -> set[Path]:
+        if not self._retransfers:
+            return set()
+        with self._counter_lock:
+            retransfers = self._retransfers.intersection(files)
+            self._retransfers -= retransfers
+        return retransfers
+
+    def _mark_retransfers(
+        self, notify: Callable[[RSyncerUpdate], None], retransfers: set[Path]
+    ) -> Callable[[RSyncerUpdate], None]:
+        relative_paths = {f.relative_to(self._basepath) for f in retransfers}
+
+        def mark(update: RSyncerUpdate):
+            if update.file_path in relative_paths:
+                update = update._replace(retransfer=True)
+            notify(update)
+
+        return mark
+
+    def _back_off(self, backoff: int):
+        if backoff:
+            logger.info(f"Waiting {backoff} seconds before next rsync attempt")
+            time.sleep(backoff)
+
+    def _start_workers(self):
+        for index in range(self._workers):
+            worker_thread = threading.Thread(
+                name=f"RSync worker {index} {self._basepath}:{self._remote}",
+                target=self._worker,
+                args=(index,),
+                daemon=True,
             )
+            worker_thread.start()
+            self._worker_threads.append(worker_thread)
 
-            if success:
-                backoff = 0
-            else:
-                backoff = min(backoff * 2 + 1, 120)
-                logger.info(f"Waiting {backoff} seconds before next rsync attempt")
-                time.sleep(backoff)
+    def _dispatch(self, files: list[Path], sizes: dict[Path, int]):
+        """
+        Split a batch into chunks of files from the same directory, sized so
+        that the batch is spread evenly across the workers, and hand each chunk
+        to the worker with the fewest bytes outstanding.
+        """
+        chunk_target = max(sum(sizes.values()) // self._workers, 1)
+
+        directories: dict[Path, list[tuple[int, Path]]] = {}
+        with self._notification_lock:
+            for f in files:
+                sequence_number = next(self._sequence)
+                self._completed[sequence_number] = None
+                directories.setdefault(f.parent, []).append((sequence_number, f))
+
+        chunks: list[tuple[int, list[tuple[int, Path]]]] = []
+        for directory_files in directories.values():
+            chunk: list[tuple[int, Path]] = []
+            chunk_size = 0
+            for sequence_number, f in directory_files:
+                chunk.append((sequence_number, f))
+                chunk_size += sizes[f]
+                if chunk_size >= chunk_target:
+                    chunks.append((chunk_size, chunk))
+                    chunk, chunk_size = [], 0
+            if chunk:
+                chunks.append((chunk_size, chunk))
+
+        with self._dispatch_lock:
+            for chunk_size, chunk in sorted(chunks, key=lambda c: -c[0]):
+                worker = min(range(self._workers), key=lambda w: self._worker_load[w])
+                self._worker_load[worker] += chunk_size
+                self._worker_queues[worker].put((chunk_size, chunk))
+        logger.debug(f"Split {len(files)} files into {len(chunks)} transfers")
+
+    def _worker(self, index: int):
+        logger.debug(f"RSync worker {index} starting")
+        backoff = 0
+        while True:
+            work = self._worker_queues[index].get()
+            if work is None:
+                break
+            chunk_size, chunk = work
+            updates: dict[Path, list[RSyncerUpdate]] = {}
+            files = [f for _, f in chunk]
+            backoff = self._transfer_batch(
+                files,
+                backoff,
+                notify=lambda update: updates.setdefault(update.file_path, []).append(
+                    update
+                ),
+                size=chunk_size,
+            )
+            reported: set[Path] = set()
+            outcomes = [
+                (sequence_number, self._outcomes(f, updates, reported))
+                for sequence_number, f in chunk
+            ]
+            for file_path, unmatched in updates.items():
+                logger.warning(
+                    f"Transfer outcome reported for {file_path}, which was not queued for this transfer"
+                )
+                outcomes[-1][1].extend(unmatched)
+            for sequence_number, file_updates in outcomes:
+                self._complete(sequence_number, file_updates)
+            # back off after passing on the outcomes, so that they do not hold
+            # up the notifications for files transferred by other workers,
+            # while still counting this chunk's load to steer new chunks away
+            self._back_off(backoff)
+            with self._dispatch_lock:
+                self._worker_load[index] -= chunk_size
+        logger.debug(f"RSync worker {index} finished")
+
+    def _outcomes(
+        self,
+        file_path: Path,
+        updates: dict[Path, list[RSyncerUpdate]],
+        reported: set[Path],
+    ) -> list[RSyncerUpdate]:
+        """
+        Take the updates reported for a file out of those collected during a
+        transfer. A file without any update is reported as failed, unless it
+        appeared earlier in the same transfer.
+        """
+        relative_path = file_path.relative_to(self._basepath)
+        if relative_path in reported:
+            return []
+        reported.add(relative_path)
+        file_updates = updates.pop(relative_path, [])
+        if not file_updates:
+            logger.warning(f"No transfer outcome reported for {relative_path}")
+            file_updates.append(
+                RSyncerUpdate(
+                    file_path=relative_path,
+                    file_size=0,
+                    outcome=TransferResult.FAILURE,
+                    transfer_total=0,
+                    queue_size=self.queue.unfinished_tasks,
+                    base_path=self._basepath,
+                )
+            )
+        return file_updates
 
-        logger.info("RSync thread finished")
+    def _complete(self, sequence_number: int, updates: list[RSyncerUpdate]):
+        """
+        Record the outcome of a transfer done by a worker, and pass on all
+        outcomes that are no longer waiting for an earlier file.
+        """
+        with self._notification_lock:
+            self._completed[sequence_number] = updates
+            while (
+                released := self._completed.get(self._next_notification)
+            ) is not None:
+                for update in released:
+                    self.notify(update)
+                del self._completed[self._next_notification]
+                self._next_notification += 1
 
-    def _fake_transfer(self, files: list[Path]) -> bool:
-        previously_transferred = self._files_transferred
+    def _fake_transfer(
+        self,
+        files: list[Path],
+        notify: Callable[[RSyncerUpdate], None] | None = None,
+    ) -> bool:
+        notify = notify or self.notify
+        transferred_in_batch = 0
 
         relative_filenames = []
         for f in files:
@@ -179,28 +723,114 @@ class RSyncer(Observer):
                 raise ValueError(f"File '{f}' is outside of {self._basepath}") from None
 
         for f in set(relative_filenames):
-            self._files_transferred += 1
+            with self._counter_lock:
+                self._files_transferred += 1
+            transferred_in_batch += 1
             update = RSyncerUpdate(
                 file_path=f,
                 file_size=0,
                 outcome=TransferResult.SUCCESS,
-                transfer_total=self._files_transferred - previously_transferred,
+                transfer_total=transferred_in_batch,
                 queue_size=0,
             )
-            self.notify(update)
+            notify(update)
         return True
 
-    def _transfer(self, files: list[Path]) -> bool:
+    def _upload(
+        self,
+        files: list[Path],
+        notify: Callable[[RSyncerUpdate], None] | None = None,
+        count_bytes: Callable[[int], None] | None = None,
+    ) -> bool:
         """
-        Actually transfer files in an rsync subprocess
+        Transfer files by streaming them to the Murfey server upload endpoint
+        over a persistent HTTP connection instead of starting an rsync process.
+        count_bytes is called with the number of bytes sent for each file.
         """
-        previously_transferred = self._files_transferred
+        notify = notify or self.notify
+        session = getattr(self._http_sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._http_sessions.session = session
+        upload_url = f"{self._server_url.geturl()}/upload/{self._basepath_remote}"
+
+        success = True
+        transferred_in_batch = 0
+        for f in files:
+            try:
+                relative_filename = f.relative_to(self._basepath)
+            except ValueError:
+                raise ValueError(f"File '{f}' is outside of {self._basepath}") from None
+            file_size = 0
+            try:
+                with open(f, "rb") as upload:
+                    file_stat = os.fstat(upload.fileno())
+                    file_size = file_stat.st_size
+                    response = session.put(
+                        f"{upload_url}/{relative_filename.as_posix()}",
+                        data=upload,
+                        headers={"X-Murfey-Modification-Time": str(file_stat.st_mtime)},
+                    )
+                uploaded = (
+                    response.status_code == 200
+                    and response.json().get("size") == file_size
+                )
+                if not uploaded:
+                    logger.error(
+                        f"Upload of {relative_filename} failed: {response.status_code} {response.text}"
+                    )
+            except (OSError, ValueError, requests.RequestException) as e:
+                logger.error(f"Upload of {relative_filename} failed: {e}")
+                uploaded = False
+
+            with self._counter_lock:
+                self._files_transferred += 1
+                if uploaded:
+                    self._bytes_transferred += file_size
+            if uploaded and count_bytes:
+                count_bytes(file_size)
+            transferred_in_batch += 1
+            if uploaded and self._statusbar:
+                with self._statusbar.lock:
+                    self._statusbar.transferred = [
+                        self._statusbar.transferred[0] + 1,
+                        self._statusbar.transferred[1],
+                    ]
+            notify(
+                RSyncerUpdate(
+                    file_path=relative_filename,
+                    file_size=file_size if uploaded else 0,
+                    outcome=TransferResult.SUCCESS
+                    if uploaded
+                    else TransferResult.FAILURE,
+                    transfer_total=transferred_in_batch,
+                    queue_size=self.queue.unfinished_tasks - transferred_in_batch,
+                    base_path=None if uploaded else self._basepath,
+                )
+            )
+            success = success and uploaded
+        return success
+
+    def _transfer(
+        self,
+        files: list[Path],
+        notify: Callable[[RSyncerUpdate], None] | None = None,
+        count_bytes: Callable[[int], None] | None = None,
+        ignore_times: bool = False,
+    ) -> bool:
+        """
+        Actually transfer files in an rsync subprocess. With machine-readable
+        output count_bytes is called with the number of bytes sent for each file.
+        With ignore_times files are sent even if they look up to date.
+        """
+        notify = notify or self.notify
+        transferred_in_batch = 0
 
         next_file: RSyncerUpdate | None = None
         transfer_success: set[Path] = set()
 
         def parse_stdout(line: str):
-            nonlocal next_file
+            nonlocal next_file, transferred_in_batch
 
             if not line:
                 return
@@ -222,7 +852,7 @@ class RSyncer(Observer):
                     return
                 transfer_success.add(next_file.file_path)
                 size_bytes = int(xfer_line.split()[0].replace(",", ""))
-                self.notify(next_file._replace(file_size=size_bytes))
+                notify(next_file._replace(file_size=size_bytes))
                 next_file = None
                 return
             if line.startswith(("building file list", "created directory", "sending")):
@@ -243,7 +873,9 @@ class RSyncer(Observer):
                     logger.warning(f"Invalid state {line=}, {next_file=}")
                     return
 
-                self._files_transferred += 1
+                with self._counter_lock:
+                    self._files_transferred += 1
+                transferred_in_batch += 1
                 if self._statusbar:
                     logger.debug("Incrementing number of transferred files")
                     with self._statusbar.lock:
@@ -251,20 +883,18 @@ class RSyncer(Observer):
                             self._statusbar.transferred[0] + 1,
                             self._statusbar.transferred[1],
                         ]
-                current_outstanding = self.queue.unfinished_tasks - (
-                    self._files_transferred - previously_transferred
-                )
+                current_outstanding = self.queue.unfinished_tasks - transferred_in_batch
                 update = RSyncerUpdate(
                     file_path=Path(line[12:].replace(" ", "")),
                     file_size=0,
                     outcome=TransferResult.SUCCESS,
-                    transfer_total=self._files_transferred - previously_transferred,
+                    transfer_total=transferred_in_batch,
                     queue_size=current_outstanding,
                 )
                 if line[0] == ".":
                     # No transfer happening
                     transfer_success.add(update.file_path)
-                    self.notify(update)
+                    notify(update)
                 else:
                     # This marks the start of a transfer, wait for the progress line
                     next_file = update
@@ -273,6 +903,35 @@ class RSyncer(Observer):
             if line.startswith(("cd", ".d")):
                 return
 
+        def parse_out_format(line: str):
+            nonlocal transferred_in_batch
+
+            item = _parse_out_format(line)
+            if item is None:
+                return
+            with self._counter_lock:
+                self._files_transferred += 1
+                self._bytes_transferred += item.bytes_transferred
+            if count_bytes:
+                count_bytes(item.bytes_transferred)
+            transferred_in_batch += 1
+            if self._statusbar:
+                with self._statusbar.lock:
+                    self._statusbar.transferred = [
+                        self._statusbar.transferred[0] + 1,
+                        self._statusbar.transferred[1],
+                    ]
+            transfer_success.add(item.file_path)
+            notify(
+                RSyncerUpdate(
+                    file_path=item.file_path,
+                    file_size=item.file_size,
+                    outcome=TransferResult.SUCCESS,
+                    transfer_total=transferred_in_batch,
+                    queue_size=self.queue.unfinished_tasks - transferred_in_batch,
+                )
+            )
+
         def parse_stderr(line: str):
             logger.error(line)
 
@@ -284,12 +943,21 @@ class RSyncer(Observer):
                 raise ValueError(f"File '{f}' is outside of {self._basepath}") from None
         rsync_stdin = b"\n".join(os.fsencode(f) for f in relative_filenames)
 
+        if self._machine_readable_output:
+            # --info=name2 also lists files that were already up to date
+            rsync_options = ["--info=name2", f"--out-format={_OUT_FORMAT}"]
+        else:
+            rsync_options = ["-iiv", "--progress"]
+        bandwidth_limit = self._bandwidth_limits.get(transfer_priority(files[0]))
+        if bandwidth_limit:
+            rsync_options.append(f"--bwlimit={bandwidth_limit}")
+        if ignore_times:
+            rsync_options.append("--ignore-times")
         result = procrunner.run(
             [
                 "rsync",
-                "-iiv",
+                *rsync_options,
                 "--times",
-                "--progress",
                 "--outbuf=line",
                 "--files-from=-",
                 "-o",  # preserve ownership
@@ -297,7 +965,9 @@ class RSyncer(Observer):
                 ".",
                 self._remote,
             ],
-            callback_stdout=parse_stdout,
+            callback_stdout=parse_out_format
+            if self._machine_readable_output
+            else parse_stdout,
             callback_stderr=parse_stderr,
             working_directory=str(self._basepath),
             stdin=rsync_stdin,
@@ -307,10 +977,10 @@ class RSyncer(Observer):
         success = result.returncode == 0
 
         for f in set(relative_filenames) - transfer_success:
-            self._files_transferred += 1
-            current_outstanding = self.queue.unfinished_tasks - (
-                self._files_transferred - previously_transferred
-            )
+            with self._counter_lock:
+                self._files_transferred += 1
+            transferred_in_batch += 1
+            current_outstanding = self.queue.unfinished_tasks - transferred_in_batch
             update = RSyncerUpdate(
                 file_path=f,
                 file_size=0,
@@ -319,7 +989,7 @@ class RSyncer(Observer):
                 queue_size=current_outstanding,
                 base_path=self._basepath,
             )
-            self.notify(update)
+            notify(update)
             success = False
 
         logger.log(
@@ -121,9 +121,7 @@ class HoverVisit(Widget):
                 self.app.input_box.lock = False
                 self.app._visit = self._text
                 self.app._environment.visit = self._text
-                machine_data = requests.get(
-                    f"{self.app._environment.url.geturl()}/machine/"
-                ).json()
+                machine_data = self.app._environment.get_machine_config()
                 _default = ""
                 visit_path = ""
                 if self.app._default_destination:
@@ -559,6 +557,7 @@ class MurfeyTUI(App):
             else:
                 _remote = f"{self._url.hostname}::{destination}"
             self.rsync_process._remote = _remote
+            self.rsync_process._basepath_remote = Path(destination)
             self.thread = threading.Thread(
                 name=f"RSync {self._source.absolute()}:{_remote}",
                 target=self.rsync_process._process,
@@ -576,7 +575,9 @@ class MurfeyTUI(App):
                 pass
             else:
                 log.warning(f"Failed to transfer file {str(update.file_path)!r}")
-                self.rsync_process.enqueue(update.file_path)
+                self.rsync_process.enqueue(
+                    update.file_path, retransfer=update.retransfer
+                )
 
         if self.rsync_process:
             self.rsync_process.subscribe(rsync_result)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from murfey.client.rsync import RSyncer, RSyncerUpdate, TransferResult
+from murfey.util.checksum import FileChecksum, file_checksum
+
+logger = logging.getLogger("murfey.client.verify")
+
+
+class TransferVerifier:
+    """
+    Compare checksums of files reported as transferred by an RSyncer with
+    checksums calculated by the server on the destination files, and enqueue
+    files that differ to be transferred again regardless of the destination.
+
+    Local checksums are calculated in a process pool and the server is queried
+    from a thread pool, so that verification does not hold up the RSyncer or
+    any other listeners.
+    """
+
+    _max_attempts = 3
+
+    def __init__(self, rsyncer: RSyncer, processes: int = 2):
+        self._rsyncer = rsyncer
+        self._checksum_pool = ProcessPoolExecutor(max_workers=processes)
+        self._request_pool = ThreadPoolExecutor(
+            max_workers=processes, thread_name_prefix="TransferVerifier"
+        )
+        self._sessions = threading.local()
+        self._lock = threading.Lock()
+        self._attempts: dict[Path, int] = {}
+        self.verified = 0
+        self.mismatched = 0
+        rsyncer.subscribe(self.enqueue)
+
+    def __repr__(self) -> str:
+        return f"<TransferVerifier for {self._rsyncer} ({self.verified} verified, {self.mismatched} mismatched)>"
+
+    def enqueue(self, update: RSyncerUpdate):
+        if update.outcome is not TransferResult.SUCCESS:
+            return
+        local_path = self._rsyncer._basepath / update.file_path
+        remote_path = (self._rsyncer._basepath_remote / update.file_path).as_posix()
+        local_checksum = self._checksum_pool.submit(file_checksum, local_path)
+        self._request_pool.submit(self._verify, local_path, remote_path, local_checksum)
+
+    def _remote_checksum(self, remote_path: str) -> FileChecksum | None:
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._sessions.session = session
+        response = session.get(
+            f"{self._rsyncer._server_url.geturl()}/checksum/{remote_path}"
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return FileChecksum(**response.json())
+
+    def _verify(
+        self, local_path: Path, remote_path: str, local_checksum: Future[FileChecksum]
+    ):
+        try:
+            remote_checksum = self._remote_checksum(remote_path)
+            checksum = local_checksum.result()
+        except (OSError, requests.RequestException) as e:
+            logger.warning(f"Could not verify transfer of {local_path}: {e}")
+            return
+        except Exception as e:
+            logger.error(
+                f"Unhandled exception {e} verifying transfer of {local_path}",
+                exc_info=True,
+            )
+            return
+
+        with self._lock:
+            if remote_checksum == checksum:
+                self.verified += 1
+                self._attempts.pop(local_path, None)
+                return
+            self.mismatched += 1
+            attempts = self._attempts.get(local_path, 0) + 1
+            self._attempts[local_path] = attempts
+        if attempts > self._max_attempts:
+            logger.error(
+                f"Transferred file {remote_path} still differs from {local_path} after {self._max_attempts} attempts, giving up"
+            )
+            return
+        logger.warning(
+            f"Transferred file {remote_path} ({remote_checksum}) differs from {local_path} ({checksum}), transferring again"
+        )
+        self._rsyncer.enqueue(local_path, retransfer=True)
+
+    def stop(self):
+        self._request_pool.shutdown(wait=True)
+        self._checksum_pool.shutdown(wait=True)
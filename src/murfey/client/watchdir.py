@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import heapq
 import logging
 import os
+import stat
+import threading
 import time
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import Dict, List, NamedTuple, Optional
 
+import murfey.client.inotify
 import murfey.util
+from murfey.client.journal import FileState, TransferJournal
 from murfey.client.tui.status_bar import StatusBar
 
 log = logging.getLogger("murfey.client.watchdir")
@@ -18,26 +23,69 @@ class _FileInfo(NamedTuple):
     settling_time: Optional[float] = None
 
 
+class _DirInfo(NamedTuple):
+    modification_time: float
+    scan_time: float
+    files: Dict[str, _FileInfo]
+    subdirectories: List[str]
+
+
+class ScanStatistics(NamedTuple):
+    duration: float
+    files: int
+    candidates: int
+    settle_checks: int
+
+
 class DirWatcher(murfey.util.Observer):
+    # Directory timestamps closer than this to the time of the listing are not
+    # trusted, as further changes within the same timestamp tick would go
+    # unnoticed on file systems with coarse timestamp resolution (FAT, SMB)
+    _racy_interval: float = 2
+    # Maximum time between checks of settling candidates when file system
+    # events are used
+    _event_interval: float = 0.2
+
     def __init__(
         self,
         path: str | os.PathLike,
         settling_time: float = 60,
         status_bar: StatusBar | None = None,
+        incremental: bool = False,
+        journal: TransferJournal | None = None,
     ):
         super().__init__()
         self._basepath = os.fspath(path)
         self._lastscan: dict[str, _FileInfo] | None = {}
         self._file_candidates: dict[str, _FileInfo] = {}
+        # heap of (settle deadline, modification time, settling time, file path)
+        self._settle_queue: list[tuple[float, float, float, str]] = []
+        self.scan_statistics: ScanStatistics | None = None
         self._statusbar = status_bar
         self.settling_time = settling_time
         self._modification_overwrite: float | None = None
         self._init_time: float = time.time()
+        self._incremental = incremental
+        self._dir_index: dict[str, _DirInfo] = {}
+        self._lock = threading.RLock()
+        self._scan_parameters: tuple[float | None, bool] | None = None
+        self._event_source = None
+        self._event_thread: threading.Thread | None = None
+        self._stopping = False
+        self._journal = journal
+        if journal:
+            self._resume_from_journal()
 
     def __repr__(self) -> str:
         return f"<DirWatcher ({self._basepath})>"
 
     def scan(self, modification_time: float | None = None, transfer_all: bool = False):
+        with self._lock:
+            self._scan_parameters = (modification_time, transfer_all)
+            self._scan(modification_time=modification_time, transfer_all=transfer_all)
+
+    def _scan(self, modification_time: float | None = None, transfer_all: bool = False):
+        scan_start = time.perf_counter()
         try:
             filelist = self._scan_directory(
                 modification_time=self._modification_overwrite or modification_time
@@ -48,72 +96,242 @@ class DirWatcher(murfey.util.Observer):
                 if self._lastscan is not None and entry_info != self._lastscan.get(
                     entry
                 ):
-                    self._file_candidates[entry] = entry_info._replace(
-                        settling_time=scan_completion
-                    )
-
-            for x in sorted(
-                self._file_candidates,
-                key=lambda _x: self._file_candidates[_x].modification_time,
-            ):
-                if x not in filelist:
-                    log.info(f"Previously seen file {x!r} has disappeared")
-                    del self._file_candidates[x]
-                    continue
+                    if entry not in self._lastscan:
+                        log.debug(
+                            f"Found file {Path(entry).name!r} for potential future transfer"
+                        )
+                    self._add_candidate(entry, entry_info, scan_completion)
 
-                if (
-                    self._file_candidates[x].settling_time + self.settling_time  # type: ignore
-                    < time.time()
-                ):
-                    try:
-                        file_stat = os.stat(x)
-                        if (
-                            file_stat.st_size == self._file_candidates[x].size
-                            and file_stat.st_mtime
-                            <= self._file_candidates[x].modification_time
-                            and file_stat.st_ctime
-                            <= self._file_candidates[x].modification_time
-                        ):
-                            if (
-                                not modification_time
-                                and not self._modification_overwrite
-                                and not transfer_all
-                            ):
-                                if file_stat.st_mtime >= self._init_time:
-                                    top_level_dir = (
-                                        Path(self._basepath)
-                                        / Path(x).relative_to(self._basepath).parts[0]
-                                    )
-                                    if top_level_dir.is_dir():
-                                        # touch the changing directory so that when _modification_overwrite is set
-                                        # we don't potentially catch old directories that aren't changing
-                                        # this means it will only autodetect new directories from this point
-                                        top_level_dir.touch(exist_ok=True)
-                                        filelist.update(
-                                            self._scan_directory(
-                                                path=str(top_level_dir)
-                                            )
-                                        )
-                                        self._modification_overwrite = max(
-                                            top_level_dir.stat().st_mtime,
-                                            top_level_dir.stat().st_ctime,
-                                        )
-                            else:
-                                self._notify_for_transfer(x)
-                            continue
-                    except Exception as e:
-                        log.error(f"Exception encountered: {e}", exc_info=True)
-                        return
-
-                if self._lastscan is not None and x not in self._lastscan:
-                    log.debug(
-                        f"Found file {Path(x).name!r} for potential future transfer"
-                    )
+            settle_checks = self._settle_due_candidates(
+                modification_time, transfer_all, filelist=filelist
+            )
 
             self._lastscan = filelist
+            self.scan_statistics = ScanStatistics(
+                duration=time.perf_counter() - scan_start,
+                files=len(filelist),
+                candidates=len(self._file_candidates),
+                settle_checks=settle_checks,
+            )
+            log.debug(f"{self} scan completed: {self.scan_statistics}")
         except Exception as e:
             log.error(f"Exception encountered: {e}")
 
+    def _add_candidate(
+        self, file_path: str, file_info: _FileInfo, settling_time: float
+    ):
+        self._file_candidates[file_path] = file_info._replace(
+            settling_time=settling_time
+        )
+        heapq.heappush(
+            self._settle_queue,
+            (
+                settling_time + self.settling_time,
+                file_info.modification_time,
+                settling_time,
+                file_path,
+            ),
+        )
+
+    def _due_candidates(self) -> list[str]:
+        """
+        Take all candidates whose settling window has expired off the settle
+        queue, ordered by settle deadline and then modification time. Queue
+        entries of candidates that have since been updated or removed are
+        discarded.
+        """
+        due = []
+        now = time.time()
+        while self._settle_queue and self._settle_queue[0][0] < now:
+            _, _, settling_time, file_path = heapq.heappop(self._settle_queue)
+            candidate_info = self._file_candidates.get(file_path)
+            if candidate_info and candidate_info.settling_time == settling_time:
+                due.append(file_path)
+        return due
+
+    def _settle(
+        self,
+        file_candidate: str,
+        filelist: dict[str, _FileInfo],
+        modification_time: float | None,
+        transfer_all: bool,
+    ) -> bool:
+        """
+        Check whether a candidate whose settling time has expired is unchanged,
+        and if so pass it on for transfer. Returns True if the candidate was
+        settled.
+        """
+        candidate_info = self._file_candidates[file_candidate]
+        file_stat = os.stat(file_candidate)
+        if not (
+            file_stat.st_size == candidate_info.size
+            and file_stat.st_mtime <= candidate_info.modification_time
+            and file_stat.st_ctime <= candidate_info.modification_time
+        ):
+            # The file is still changing, restart its settling window
+            self._add_candidate(
+                file_candidate,
+                _FileInfo(
+                    size=file_stat.st_size,
+                    modification_time=max(file_stat.st_mtime, file_stat.st_ctime),
+                ),
+                time.time(),
+            )
+            return False
+        if (
+            not modification_time
+            and not self._modification_overwrite
+            and not transfer_all
+        ):
+            if file_stat.st_mtime >= self._init_time:
+                top_level_dir = (
+                    Path(self._basepath)
+                    / Path(file_candidate).relative_to(self._basepath).parts[0]
+                )
+                if top_level_dir.is_dir():
+                    # touch the changing directory so that when _modification_overwrite is set
+                    # we don't potentially catch old directories that aren't changing
+                    # this means it will only autodetect new directories from this point
+                    top_level_dir.touch(exist_ok=True)
+                    filelist.update(self._scan_directory(path=str(top_level_dir)))
+                    self._modification_overwrite = max(
+                        top_level_dir.stat().st_mtime,
+                        top_level_dir.stat().st_ctime,
+                    )
+        else:
+            self._notify_for_transfer(file_candidate)
+        return True
+
+    def start_events(self, event_source=None) -> bool:
+        """
+        Start picking up changes from file system events in a background thread
+        rather than waiting for the next scan. Any object with .read(timeout)
+        and .close() methods behaving like InotifyEventSource can be used as an
+        event source. Periodic scans are still required to reconcile changes
+        that the event source missed. Returns False if no event source is
+        available, in which case only scanning is used.
+        """
+        if self._event_thread:
+            raise RuntimeError(f"{self} is already receiving file system events")
+        if event_source is None:
+            if not murfey.client.inotify.inotify_available():
+                log.info(
+                    f"File system events are not available for {self}, relying on polling"
+                )
+                return False
+            try:
+                event_source = murfey.client.inotify.InotifyEventSource(self._basepath)
+            except OSError as e:
+                log.warning(
+                    f"Could not set up file system events for {self}, relying on polling: {e}"
+                )
+                return False
+        self._event_source = event_source
+        self._event_thread = threading.Thread(
+            target=self._watch_events,
+            name=f"DirWatcher events {self._basepath}",
+            daemon=True,
+        )
+        self._event_thread.start()
+        return True
+
+    def stop_events(self):
+        self._stopping = True
+        if self._event_thread and self._event_thread.is_alive():
+            self._event_thread.join()
+        if self._event_source:
+            self._event_source.close()
+
+    def _watch_events(self):
+        log.info(f"Receiving file system events for {self}")
+        while not self._stopping:
+            try:
+                changed_files = self._event_source.read(timeout=self._event_interval)
+            except OSError as e:
+                log.error(
+                    f"Reading file system events failed, relying on polling: {e}",
+                    exc_info=True,
+                )
+                return
+            with self._lock:
+                if changed_files is None:
+                    log.warning(
+                        "File system events were lost, changes will be picked up by the next scan"
+                    )
+                else:
+                    for changed_file in changed_files:
+                        self._register_change(changed_file)
+                if self._scan_parameters is not None:
+                    self._settle_due_candidates(*self._scan_parameters)
+
+    def _register_change(self, file_path: str):
+        # use the same form of path as _scan_directory
+        file_path = str(Path(file_path))
+        # avoid textual log
+        if "textual" in file_path:
+            return
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            if self._file_candidates.pop(file_path, None):
+                log.info(f"Previously seen file {file_path!r} has disappeared")
+            return
+        if stat.S_ISDIR(file_stat.st_mode):
+            return
+        file_info = _FileInfo(
+            size=file_stat.st_size,
+            modification_time=max(file_stat.st_mtime, file_stat.st_ctime),
+        )
+        if self._lastscan is None or file_info == self._lastscan.get(file_path):
+            return
+        self._add_candidate(file_path, file_info, time.time())
+        # Record the change as seen so that the next scan does not offer the
+        # file again once it has been transferred
+        self._lastscan[file_path] = file_info
+        directory = os.path.relpath(
+            os.path.dirname(os.path.abspath(file_path)),
+            os.path.abspath(self._basepath),
+        )
+        cached_directory = self._dir_index.get("" if directory == "." else directory)
+        if cached_directory:
+            cached_directory.files[file_path] = file_info
+
+    def _settle_due_candidates(
+        self,
+        modification_time: float | None,
+        transfer_all: bool,
+        filelist: dict[str, _FileInfo] | None = None,
+    ) -> int:
+        """
+        Settle all candidates whose settling window has expired. Candidates
+        missing from a given fresh file listing are dropped without a check.
+        A candidate whose check fails is kept and checked again next time, so
+        that one failure does not lose the other due candidates. Returns the
+        number of candidates checked.
+        """
+        listed = filelist is not None
+        if filelist is None:
+            filelist = self._lastscan if self._lastscan is not None else {}
+        settle_checks = 0
+        for x in self._due_candidates():
+            if listed and x not in filelist:
+                log.info(f"Previously seen file {x!r} has disappeared")
+                del self._file_candidates[x]
+                continue
+            settle_checks += 1
+            try:
+                self._settle(x, filelist, modification_time, transfer_all)
+            except FileNotFoundError:
+                log.info(f"Previously seen file {x!r} has disappeared")
+                self._file_candidates.pop(x, None)
+            except Exception as e:
+                log.error(f"Exception encountered: {e}", exc_info=True)
+                candidate_info = self._file_candidates.get(x)
+                if candidate_info and candidate_info.settling_time is not None:
+                    # keep the expired deadline so that it is due again
+                    self._add_candidate(x, candidate_info, candidate_info.settling_time)
+        return settle_checks
+
     def _notify_for_transfer(self, file_candidate: str):
         log.debug(f"File {Path(file_candidate).name!r} is ready to be transferred")
         if self._statusbar:
@@ -124,13 +342,38 @@ class DirWatcher(murfey.util.Observer):
                     self._statusbar.transferred[1] + 1,
                 ]
 
+        candidate_info = self._file_candidates.pop(file_candidate)
         if not Path(file_candidate).name.startswith("."):
+            if self._journal:
+                self._journal.record(
+                    Path(os.path.relpath(file_candidate, self._basepath)).as_posix(),
+                    FileState.SETTLED,
+                    size=candidate_info.size,
+                    modification_time=candidate_info.modification_time,
+                )
             self.notify(Path(file_candidate))
-        del self._file_candidates[file_candidate]
+
+    def _resume_from_journal(self):
+        """
+        Treat files the journal records as transferred as already seen, so
+        that they are only offered again if they have changed since.
+        """
+        transferred = self._journal.entries(FileState.TRANSFERRED)
+        for relative_path, entry in transferred.items():
+            if entry.size is None or entry.modification_time is None:
+                continue
+            self._lastscan[str(Path(self._basepath) / relative_path)] = _FileInfo(
+                size=entry.size, modification_time=entry.modification_time
+            )
+        log.info(f"{self} resumed with {len(transferred)} previously transferred files")
 
     def _scan_directory(
         self, path: str = "", modification_time: float | None = None
     ) -> dict[str, _FileInfo]:
+        if self._incremental:
+            return self._scan_directory_incremental(
+                path=path, modification_time=modification_time
+            )
         result: dict[str, _FileInfo] = {}
         try:
             directory_contents = os.scandir(os.path.join(self._basepath, path))
@@ -173,3 +416,108 @@ class DirWatcher(murfey.util.Observer):
                         modification_time=max(file_stat.st_mtime, file_stat.st_ctime),
                     )
         return result
+
+    def _scan_directory_incremental(
+        self, path: str = "", modification_time: float | None = None
+    ) -> dict[str, _FileInfo]:
+        """
+        Equivalent to _scan_directory, but directories whose timestamps have not
+        changed since the previous scan are not listed again. Only files that
+        are still waiting to settle are re-examined in those directories, as
+        writing to an existing file does not touch the directory timestamps.
+        """
+        result: dict[str, _FileInfo] = {}
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self._basepath)
+        try:
+            scan_time = time.time()
+            dir_stat = os.stat(os.path.join(self._basepath, path))
+        except FileNotFoundError:
+            if path:
+                self._drop_from_index(path)
+                return result
+            raise
+        dir_modification_time = max(dir_stat.st_mtime, dir_stat.st_ctime)
+
+        cached = self._dir_index.get(path)
+        if (
+            cached
+            and cached.modification_time == dir_modification_time
+            and cached.scan_time - dir_modification_time > self._racy_interval
+        ):
+            files = cached.files
+            for file_name in files:
+                if file_name in self._file_candidates:
+                    try:
+                        file_stat = os.stat(file_name)
+                    except FileNotFoundError:
+                        continue
+                    files[file_name] = _FileInfo(
+                        size=file_stat.st_size,
+                        modification_time=max(file_stat.st_mtime, file_stat.st_ctime),
+                    )
+            subdirectories = cached.subdirectories
+        else:
+            files = {}
+            subdirectories = []
+            try:
+                directory_contents = os.scandir(os.path.join(self._basepath, path))
+            except FileNotFoundError:
+                if path:
+                    self._drop_from_index(path)
+                    return result
+                raise
+            for entry in directory_contents:
+                entry_name = os.path.join(path, entry.name)
+                if entry.is_dir():
+                    subdirectories.append(entry_name)
+                    continue
+                # avoid textual log
+                if "textual" in str(entry):
+                    continue
+                try:
+                    file_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files[str(Path(self._basepath) / entry_name)] = _FileInfo(
+                    size=file_stat.st_size,
+                    modification_time=max(file_stat.st_mtime, file_stat.st_ctime),
+                )
+            if cached:
+                for vanished in set(cached.subdirectories) - set(subdirectories):
+                    self._drop_from_index(vanished)
+            self._dir_index[path] = _DirInfo(
+                modification_time=dir_modification_time,
+                scan_time=scan_time,
+                files=files,
+                subdirectories=subdirectories,
+            )
+
+        for subdirectory in subdirectories:
+            if modification_time is not None:
+                try:
+                    subdirectory_stat = os.stat(
+                        os.path.join(self._basepath, subdirectory)
+                    )
+                except FileNotFoundError:
+                    self._drop_from_index(subdirectory)
+                    continue
+                if subdirectory_stat.st_ctime < modification_time:
+                    continue
+            result.update(self._scan_directory_incremental(subdirectory))
+        if modification_time:
+            result.update(
+                (f, info)
+                for f, info in files.items()
+                if info.modification_time >= modification_time
+            )
+        else:
+            result.update(files)
+        return result
+
+    def _drop_from_index(self, path: str):
+        prefix = os.path.join(path, "")
+        for indexed in [
+            p for p in self._dir_index if p == path or p.startswith(prefix)
+        ]:
+            del self._dir_index[indexed]
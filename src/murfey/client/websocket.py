@@ -44,6 +44,9 @@ class WSApp:
         )
         self._feeder_thread.start()
         self.environment: MurfeyInstanceEnvironment | None = None
+        # number of the last state change applied, None until the full state
+        # has been received
+        self._sequence: int | None = None
 
     def __repr__(self):
         if self.alive:
@@ -102,26 +105,34 @@ class WSApp:
         # log.info(f"Received message: {message!r}")
         try:
             data = json.loads(message)
-            if data.get("message") == "state-update":
-                self._register_id(data["attribute"], data["value"])
-            elif data.get("message") == "state-update-partial":
-                self._register_id_partial(data["attribute"], data["value"])
+            if data.get("message") == "state-delta":
+                self._apply_delta(data)
+            elif data.get("message") == "state-full":
+                self._sequence = data.get("sequence")
+                if self.environment:
+                    for attribute, value in data["state"].items():
+                        self.environment.apply_state_delta(attribute, "set", value)
         except Exception:
             pass
 
-    def _register_id(self, attribute: str, value):
-        if self.environment and hasattr(self.environment, attribute):
-            setattr(self.environment, attribute, value)
-
-    def _register_id_partial(self, attribute: str, value):
-        if self.environment and hasattr(self.environment, attribute):
-            if isinstance(value, dict):
-                new_value = {**getattr(self.environment, attribute), **value}
-                setattr(
-                    self.environment,
-                    attribute,
-                    new_value,
-                )
+    def _apply_delta(self, delta: dict):
+        if self._sequence is None:
+            # waiting for the full state
+            return
+        if delta["sequence"] <= self._sequence:
+            return
+        if delta["sequence"] != self._sequence + 1:
+            log.warning(
+                f"Missed state changes {self._sequence + 1} to {delta['sequence'] - 1}, requesting the full state"
+            )
+            self._sequence = None
+            self.send(json.dumps({"type": "state-resync"}))
+            return
+        self._sequence = delta["sequence"]
+        if self.environment:
+            self.environment.apply_state_delta(
+                delta["attribute"], delta["op"], delta["value"]
+            )
 
     def on_error(self, ws: websocket.WebSocketApp, error: websocket.WebSocketException):
         log.error(str(error))
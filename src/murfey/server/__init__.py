@@ -1,17 +1,22 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import hashlib
+import json
 import logging
 import os
 import socket
 from functools import lru_cache, singledispatch
 from pathlib import Path
-from threading import Thread
-from typing import Any
+from typing import Any, NamedTuple
 
 import uvicorn
 import workflows
 import zocalo.configuration
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from ispyb.sqlalchemy._auto_db_schema import (
     AutoProcProgram,
@@ -28,10 +33,10 @@ import murfey.server.websocket
 from murfey.server.config import MachineConfig, from_file
 
 try:
-    from murfey.server.ispyb import TransportManager  # Session
+    from murfey.server.ispyb import Session, TransportManager
 except AttributeError:
     pass
-from murfey.util.state import global_state
+from murfey.util.state import GlobalStateValues, global_state
 
 try:
     from importlib.resources import files  # type: ignore
@@ -59,6 +64,22 @@ def respond_with_template(filename: str, parameters: dict[str, Any] | None = Non
     return templates.TemplateResponse(filename, template_parameters)
 
 
+def json_etag(content: Any) -> str:
+    return '"{}"'.format(
+        hashlib.sha1(
+            json.dumps(content, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+    )
+
+
+def conditional_json_response(request: Request, content: Any, etag: str) -> Response:
+    """Respond with 304 Not Modified if the client already holds this version
+    of the content, otherwise send it along with its ETag"""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=content, headers={"ETag": etag})
+
+
 class LogFilter(logging.Filter):
     """A filter to limit messages going to Graylog"""
 
@@ -115,6 +136,12 @@ def run():
         "--feedback",
         action="store_true",
     )
+    parser.add_argument(
+        "--feedback-batch-window",
+        help="Collect data collection and processing job registrations for this many seconds and insert them together with direct table inserts instead of the ISPyB stored procedures (default: 0, disabled)",
+        type=float,
+        default=0,
+    )
 
     verbosity = parser.add_mutually_exclusive_group()
     verbosity.add_argument(
@@ -166,14 +193,11 @@ def run():
         microscope = get_microscope()
         machine_config = from_file(Path(murfey_machine_configuration), microscope)
 
-    rabbit_thread = Thread(
-        target=feedback_listen,
-        kwargs={"feedback_queue": machine_config.feedback_queue},
-        daemon=True,
-    )
-    logger.info("Starting Murfey RabbitMQ thread")
+    global _feedback_consumer
     if args.feedback:
-        rabbit_thread.start()
+        _feedback_consumer = FeedbackConsumer(
+            machine_config.feedback_queue, batch_window=args.feedback_batch_window
+        )
 
     logger.info(
         f"Starting Murfey server version {murfey.__version__} for beamline {get_microscope()}, listening on {args.host}:{args.port}"
@@ -277,39 +301,16 @@ def _set_up_transport(transport_type):
 
 
 async def feedback_callback_async(header: dict, message: dict) -> None:
-    logger.info(f"feedback_callback_async called with {header}, {message}")
-    if message["register"] == "motion_corrected":
-        if murfey.server.websocket.manager:
-            if global_state.get("motion_corrected_movies") and isinstance(
-                global_state["motion_corrected_movies"], dict
-            ):
-                await global_state.aupdate(
-                    "motion_corrected_movies",
-                    {
-                        message.get("movie"): [
-                            message.get("mrc_out"),
-                            message.get("movie_id"),
-                        ],
-                    },
-                )
-            else:
-                await global_state.aupdate(
-                    "motion_corrected_movies",
-                    {
-                        message.get("movie"): [
-                            message.get("mrc_out"),
-                            message.get("movie_id"),
-                        ]
-                    },
-                )
-
-
-def feedback_callback(header: dict, message: dict) -> None:
-    record = None
+    """
+    Process a message from the feedback queue. This runs on the server's event
+    loop, so that changes to the global state are broadcast to the websocket
+    clients connected to the server. Blocking ISPyB calls are made from the
+    thread pool.
+    """
     if "environment" in message:
         message = message["payload"]
     if message["register"] == "motion_corrected":
-        global_state.update(
+        await global_state.aupdate(
             "motion_corrected_movies",
             {
                 message.get("movie"): [
@@ -317,9 +318,7 @@ def feedback_callback(header: dict, message: dict) -> None:
                     message.get("movie_id"),
                 ]
             },
-            perform_state_update=False,
         )
-
         if _transport_object:
             _transport_object.transport.ack(header)
         return None
@@ -329,15 +328,13 @@ def feedback_callback(header: dict, message: dict) -> None:
             experimentType=message["experiment_type"],
             experimentTypeId=message["experiment_type_id"],
         )
-        print(record)
-        dcgid = _register(record, header)
-        print(dcgid)
+        dcgid = await run_in_threadpool(_register, record, header)
         if _transport_object:
             if dcgid is None:
                 _transport_object.transport.nack(header)
                 return None
-            global_state["data_collection_group_id"] = dcgid
-        _transport_object.transport.ack(header)
+            await global_state.set("data_collection_group_id", dcgid)
+            _transport_object.transport.ack(header)
         return None
     elif message["register"] == "data_collection":
         record = DataCollection(
@@ -348,20 +345,15 @@ def feedback_callback(header: dict, message: dict) -> None:
             voltage=message["voltage"],
             dataCollectionGroupId=global_state.get("data_collection_group_id"),
         )
-        dcid = _register(record, header)
+        dcid = await run_in_threadpool(_register, record, header)
         if dcid is None and _transport_object:
             _transport_object.transport.nack(header)
             return None
         logger.debug(f"registered: {message.get('tag')}")
-        if global_state.get("data_collection_ids") and isinstance(
-            global_state["data_collection_ids"], dict
-        ):
-            global_state["data_collection_ids"] = {
-                **global_state["data_collection_ids"],
-                message.get("tag"): dcid,
-            }
-        else:
-            global_state["data_collection_ids"] = {message.get("tag"): dcid}
+        await global_state.set(
+            "data_collection_ids",
+            {**_state_dict("data_collection_ids"), message.get("tag"): dcid},
+        )
         if _transport_object:
             _transport_object.transport.ack(header)
         return None
@@ -369,39 +361,37 @@ def feedback_callback(header: dict, message: dict) -> None:
         assert isinstance(global_state["data_collection_ids"], dict)
         _dcid = global_state["data_collection_ids"][message["tag"]]
         record = ProcessingJob(dataCollectionId=_dcid, recipe=message["recipe"])
-        pid = _register(record, header)
+        pid = await run_in_threadpool(_register, record, header)
         if pid is None and _transport_object:
             _transport_object.transport.nack(header)
             return None
-        if global_state.get("processing_job_ids"):
-            global_state["processing_job_ids"] = {
-                **global_state["processing_job_ids"],  # type: ignore
-                message.get("tag"): {
-                    **global_state["processing_job_ids"].get(message.get("tag"), {}),  # type: ignore
+        processing_job_ids = _state_dict("processing_job_ids")
+        await global_state.set(
+            "processing_job_ids",
+            {
+                **processing_job_ids,
+                message["tag"]: {
+                    **processing_job_ids.get(message["tag"], {}),
                     message["recipe"]: pid,
                 },
-            }
-        else:
-            prids = {message["tag"]: {message["recipe"]: pid}}
-            global_state["processing_job_ids"] = prids
+            },
+        )
         record = AutoProcProgram(processingJobId=pid)
-        appid = _register(record, header)
+        appid = await run_in_threadpool(_register, record, header)
         if appid is None and _transport_object:
             _transport_object.transport.nack(header)
             return None
-        if global_state.get("autoproc_program_ids"):
-            assert isinstance(global_state["autoproc_program_ids"], dict)
-            global_state["autoproc_program_ids"] = {
-                **global_state["autoproc_program_ids"],
-                message.get("tag"): {
-                    **global_state["processing_job_ids"].get(message.get("tag"), {}),  # type: ignore
+        autoproc_program_ids = _state_dict("autoproc_program_ids")
+        await global_state.set(
+            "autoproc_program_ids",
+            {
+                **autoproc_program_ids,
+                message["tag"]: {
+                    **autoproc_program_ids.get(message["tag"], {}),
                     message["recipe"]: appid,
                 },
-            }
-        else:
-            global_state["autoproc_program_ids"] = {
-                message["tag"]: {message["recipe"]: appid}
-            }
+            },
+        )
         if _transport_object:
             _transport_object.transport.ack(header)
         return None
@@ -452,8 +442,283 @@ def _(record: Base, header: dict):
         return None
 
 
-def feedback_listen(feedback_queue: str = "murfey_feedback"):
-    if _transport_object:
-        _transport_object.transport.subscribe(
-            feedback_queue, feedback_callback, acknowledgement=True
+class FeedbackConsumer:
+    """
+    Receive messages from the feedback queue and process them with
+    feedback_callback_async on the server's event loop. The transport
+    delivers messages on its own thread, from which they are only handed
+    over to the event loop through a queue.
+
+    With a positive batch_window, data collection and processing job
+    registration messages are collected for up to batch_window seconds, or
+    until max_messages have arrived, and registered together in a single
+    database transaction. The messages are only acknowledged once the
+    transaction has been committed. Any other message causes the collected
+    messages to be registered first, so that messages are processed in the
+    order in which they arrived.
+
+    Batched records are inserted into the ISPyB tables directly rather than
+    through the stored procedures used for single messages, so batching is
+    only enabled where the database user may insert into those tables.
+    """
+
+    batched_messages = ("data_collection", "processing_job")
+
+    def __init__(
+        self,
+        feedback_queue: str = "murfey_feedback",
+        batch_window: float = 0,
+        max_messages: int = 100,
+    ):
+        self.feedback_queue = feedback_queue
+        self.batch_window = batch_window
+        self.max_messages = max_messages
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[tuple[dict, dict]] | None = None
+        self._task: asyncio.Task | None = None
+        self._pending: list[tuple[dict, dict]] = []
+        self._deadline: float = 0
+
+    def __repr__(self) -> str:
+        return f"<FeedbackConsumer for {self.feedback_queue} ({len(self._pending)} messages pending)>"
+
+    async def start(self):
+        """Start consuming messages on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._consume())
+        if _transport_object:
+            # allow enough unacknowledged messages to fill a batch
+            await run_in_threadpool(
+                _transport_object.transport.subscribe,
+                self.feedback_queue,
+                self,
+                acknowledgement=True,
+                prefetch_count=self.max_messages,
+            )
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def __call__(self, header: dict, message: dict) -> None:
+        # called on the transport thread
+        assert self._loop and self._queue
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (header, message))
+
+    async def _consume(self):
+        assert self._loop and self._queue
+        while True:
+            timeout = None
+            if self._pending:
+                timeout = max(self._deadline - self._loop.time(), 0)
+            try:
+                header, message = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self.flush()
+                continue
+            await self.process(header, message)
+
+    async def process(self, header: dict, message: dict):
+        if "environment" in message:
+            message = message["payload"]
+        if self.batch_window > 0 and message.get("register") in self.batched_messages:
+            if not self._pending:
+                self._deadline = asyncio.get_running_loop().time() + self.batch_window
+            self._pending.append((header, message))
+            if len(self._pending) >= self.max_messages:
+                await self.flush()
+            return
+        await self.flush()
+        try:
+            await feedback_callback_async(header, message)
+        except Exception as e:
+            logger.error(
+                f"Processing of feedback message {message} failed: {e}", exc_info=True
+            )
+            if _transport_object:
+                _transport_object.transport.nack(header)
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if batch:
+            try:
+                await _register_batch(batch)
+            except Exception as e:
+                logger.error(
+                    f"Registration of {len(batch)} feedback messages failed: {e}",
+                    exc_info=True,
+                )
+                if _transport_object:
+                    for header, _ in batch:
+                        _transport_object.transport.nack(header)
+
+
+_feedback_consumer: FeedbackConsumer | None = None
+
+
+async def start_feedback_consumer():
+    if _feedback_consumer:
+        await _feedback_consumer.start()
+
+
+async def stop_feedback_consumer():
+    if _feedback_consumer:
+        await _feedback_consumer.stop()
+
+
+def _state_dict(key: str) -> dict:
+    value = global_state.get(key)
+    return dict(value) if isinstance(value, dict) else {}
+
+
+class _BatchRegistration(NamedTuple):
+    data_collection_ids: dict
+    processing_jobs: list[tuple[dict, int, int]]
+    acknowledge: list[dict]
+    reject: list[dict]
+
+
+def _insert_batch(
+    batch: list[tuple[dict, dict]],
+    data_collection_group_id: GlobalStateValues,
+    known_data_collection_ids: dict,
+) -> _BatchRegistration:
+    """
+    Insert the ISPyB records for a batch of data collection and processing job
+    registration messages in one transaction.
+    """
+    dc_messages = [
+        (header, message)
+        for header, message in batch
+        if message["register"] == "data_collection"
+    ]
+    pj_messages = [
+        (header, message)
+        for header, message in batch
+        if message["register"] == "processing_job"
+    ]
+    rejected: list[dict] = []
+
+    db = Session()
+    try:
+        dc_records = [
+            DataCollection(
+                SESSIONID=message["session_id"],
+                experimenttype=message["experiment_type"],
+                imageDirectory=message["image_directory"],
+                imageSuffix=message["image_suffix"],
+                voltage=message["voltage"],
+                dataCollectionGroupId=data_collection_group_id,
+                comments="Created for Murfey",
+            )
+            for _, message in dc_messages
+        ]
+        db.add_all(dc_records)
+        db.flush()
+        data_collection_ids = {
+            message.get("tag"): record.dataCollectionId
+            for (_, message), record in zip(dc_messages, dc_records)
+        }
+
+        known_data_collection_ids = {
+            **known_data_collection_ids,
+            **data_collection_ids,
+        }
+        accepted_pj_messages = []
+        for header, message in pj_messages:
+            if message["tag"] in known_data_collection_ids:
+                accepted_pj_messages.append((header, message))
+            else:
+                # the client only registers processing jobs for registered data
+                # collections, so the data collection is not going to turn up
+                logger.error(
+                    f"No data collection registered for processing job {message}"
+                )
+                rejected.append(header)
+        pj_records = [
+            ProcessingJob(
+                dataCollectionId=known_data_collection_ids[message["tag"]],
+                recipe=message["recipe"],
+            )
+            for _, message in accepted_pj_messages
+        ]
+        db.add_all(pj_records)
+        db.flush()
+        app_records = [
+            AutoProcProgram(processingJobId=record.processingJobId)
+            for record in pj_records
+        ]
+        db.add_all(app_records)
+        db.flush()
+        db.commit()
+        processing_jobs = [
+            (message, pj_record.processingJobId, app_record.autoProcProgramId)
+            for (_, message), pj_record, app_record in zip(
+                accepted_pj_messages, pj_records, app_records
+            )
+        ]
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(
+        f"Registered {len(dc_records)} data collections and {len(pj_records)} processing jobs"
+    )
+    return _BatchRegistration(
+        data_collection_ids=data_collection_ids,
+        processing_jobs=processing_jobs,
+        acknowledge=[header for header, _ in dc_messages + accepted_pj_messages],
+        reject=rejected,
+    )
+
+
+async def _register_batch(batch: list[tuple[dict, dict]]):
+    """
+    Register a batch of data collection and processing job registration
+    messages in one transaction, then record the new IDs in the global state
+    and acknowledge the messages.
+    """
+    registration = await run_in_threadpool(
+        _insert_batch,
+        batch,
+        global_state.get("data_collection_group_id"),
+        _state_dict("data_collection_ids"),
+    )
+
+    if registration.data_collection_ids:
+        await global_state.set(
+            "data_collection_ids",
+            {
+                **_state_dict("data_collection_ids"),
+                **registration.data_collection_ids,
+            },
         )
+    if registration.processing_jobs:
+        new_processing_job_ids = _state_dict("processing_job_ids")
+        new_autoproc_program_ids = _state_dict("autoproc_program_ids")
+        for message, pid, appid in registration.processing_jobs:
+            tag = message["tag"]
+            new_processing_job_ids[tag] = {
+                **new_processing_job_ids.get(tag, {}),
+                message["recipe"]: pid,
+            }
+            new_autoproc_program_ids[tag] = {
+                **new_autoproc_program_ids.get(tag, {}),
+                message["recipe"]: appid,
+            }
+        await global_state.set("processing_job_ids", new_processing_job_ids)
+        await global_state.set("autoproc_program_ids", new_autoproc_program_ids)
+
+    if _transport_object:
+        for header in registration.acknowledge:
+            _transport_object.transport.ack(header)
+        for header in registration.reject:
+            _transport_object.transport.nack(header, requeue=False)
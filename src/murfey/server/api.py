@@ -2,23 +2,34 @@ from __future__ import annotations
 
 import datetime
 import logging
+import math
+import os
 from functools import lru_cache
 from pathlib import Path
 from typing import List
 
 import packaging.version
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import HTMLResponse
-from ispyb.sqlalchemy import BLSession, Proposal
 from pydantic import BaseSettings
 
 import murfey.server.bootstrap
 import murfey.server.ispyb
 import murfey.server.websocket as ws
-from murfey.server import _transport_object, get_hostname, get_microscope
+import murfey.util.checksum
+from murfey.server import (
+    _transport_object,
+    conditional_json_response,
+    get_hostname,
+    get_microscope,
+    json_etag,
+)
 from murfey.server import shutdown as _shutdown
 from murfey.server import templates
 from murfey.server.config import MachineConfig, from_file
+from murfey.util.directories import DirectoryCache
 from murfey.util.models import (
     ContextInfo,
     DCGroupParameters,
@@ -34,6 +45,9 @@ from murfey.util.models import (
 
 log = logging.getLogger("murfey.server.api")
 
+# output directories on the shared file system known to exist
+known_directories = DirectoryCache()
+
 
 class Settings(BaseSettings):
     murfey_machine_configuration: str = ""
@@ -68,12 +82,18 @@ async def root(request: Request):
 
 
 @lru_cache(maxsize=1)
+def _machine_info() -> tuple[dict, str]:
+    content = (
+        jsonable_encoder(machine_config)
+        if settings.murfey_machine_configuration
+        else {}
+    )
+    return content, json_etag(content)
+
+
 @router.get("/machine/")
-def machine_info():
-    if settings.murfey_machine_configuration:
-        microscope = get_microscope()
-        return from_file(settings.murfey_machine_configuration, microscope)
-    return {}
+def machine_info(request: Request):
+    return conditional_json_response(request, *_machine_info())
 
 
 @router.get("/microscope/")
@@ -83,9 +103,9 @@ def get_mic():
 
 
 @router.get("/visits/")
-def all_visit_info(request: Request, db=murfey.server.ispyb.DB):
+def all_visit_info(request: Request):
     microscope = get_microscope()
-    visits = murfey.server.ispyb.get_all_ongoing_visits(microscope, db)
+    visits = murfey.server.ispyb.get_visit_cache(microscope).visits()
 
     if visits:
         return_query = [
@@ -112,54 +132,41 @@ def all_visit_info(request: Request, db=murfey.server.ispyb.DB):
         )
 
 
+@router.post("/visits/refresh")
+def refresh_visits():
+    """Reload the ongoing visits from ISPyB, eg. after a visit was scheduled"""
+    murfey.server.ispyb.get_visit_cache(get_microscope()).invalidate()
+    return {"success": True}
+
+
 @router.get("/demo/visits_raw", response_model=List[Visit])
-def get_current_visits_demo(db=murfey.server.ispyb.DB):
+def get_current_visits_demo():
     microscope = "m12"
-    return murfey.server.ispyb.get_all_ongoing_visits(microscope, db)
+    return murfey.server.ispyb.get_visit_cache(microscope).visits()
 
 
 @router.get("/visits_raw", response_model=List[Visit])
-def get_current_visits(db=murfey.server.ispyb.DB):
+def get_current_visits():
     microscope = get_microscope()
-    return murfey.server.ispyb.get_all_ongoing_visits(microscope, db)
+    return murfey.server.ispyb.get_visit_cache(microscope).visits()
 
 
 @router.get("/visits/{visit_name}")
-def visit_info(request: Request, visit_name: str, db=murfey.server.ispyb.DB):
-    microscope = get_microscope()
-    query = (
-        db.query(BLSession)
-        .join(Proposal)
-        .filter(
-            BLSession.proposalId == Proposal.proposalId,
-            BLSession.beamLineName == microscope,
-            BLSession.endDate > datetime.datetime.now(),
-            BLSession.startDate < datetime.datetime.now(),
-        )
-        .add_columns(
-            BLSession.startDate,
-            BLSession.endDate,
-            BLSession.beamLineName,
-            Proposal.proposalCode,
-            Proposal.proposalNumber,
-            BLSession.visit_number,
-            Proposal.title,
-        )
-        .all()
-    )
-    if query:
-        return_query = [
-            {
-                "Start date": id.startDate,
-                "End date": id.endDate,
-                "Beamline name": id.beamLineName,
-                "Visit name": visit_name,
-                "Time remaining": str(id.endDate - datetime.datetime.now()),
-            }
-            for id in query
-            if id.proposalCode + str(id.proposalNumber) + "-" + str(id.visit_number)
-            == visit_name
-        ]  # "Proposal title": id.title
+def visit_info(request: Request, visit_name: str):
+    visits = murfey.server.ispyb.get_visit_cache(get_microscope())
+    if visits.visits():
+        return_query = []
+        visit = visits.get(visit_name)
+        if visit:
+            return_query.append(
+                {
+                    "Start date": visit.start,
+                    "End date": visit.end,
+                    "Beamline name": visit.beamline,
+                    "Visit name": visit_name,
+                    "Time remaining": str(visit.end - datetime.datetime.now()),
+                }
+            )  # "Proposal title": visit.proposal_title
         return templates.TemplateResponse(
             "visit.html",
             {"request": request, "visit": return_query},
@@ -196,8 +203,9 @@ async def send_murfey_message(msg: RegistrationMessage):
         )
 
 
-@router.post("/visits/{visit_name}/tomography_preprocess")
-async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFile):
+def _preprocessing_outputs(
+    visit_name: str, proc_file: ProcessFile
+) -> tuple[Path, Path]:
     visit_idx = Path(proc_file.path).parts.index(visit_name)
     core = Path(*Path(proc_file.path).parts[: visit_idx + 1])
     ppath = Path(proc_file.path)
@@ -216,11 +224,13 @@ async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFi
         / "CTF"
         / str(ppath.stem + "_ctf.mrc")
     )
-    if not mrc_out.parent.exists():
-        mrc_out.parent.mkdir(parents=True)
-    if not ctf_out.parent.exists():
-        ctf_out.parent.mkdir(parents=True)
-    zocalo_message = {
+    return mrc_out, ctf_out
+
+
+def _preprocessing_message(
+    proc_file: ProcessFile, mrc_out: Path, ctf_out: Path
+) -> dict:
+    return {
         "recipes": ["em-tomo-preprocess"],
         "parameters": {
             "feedback_queue": machine_config.feedback_queue,
@@ -237,18 +247,66 @@ async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFi
             "gain_ref": proc_file.gain_ref,
         },
     }
+
+
+@router.post("/visits/{visit_name}/tomography_preprocess")
+async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFile):
+    mrc_out, ctf_out = _preprocessing_outputs(visit_name, proc_file)
+    known_directories.ensure(mrc_out.parent, ctf_out.parent)
+    zocalo_message = _preprocessing_message(proc_file, mrc_out, ctf_out)
     # log.info(f"Sending Zocalo message {zocalo_message}")
     if _transport_object:
         _transport_object.transport.send("processing_recipe", zocalo_message)
     else:
         log.error(
-            f"Pe-processing was requested for {ppath.name} but no Zocalo transport object was found"
+            f"Pe-processing was requested for {Path(proc_file.path).name} but no Zocalo transport object was found"
         )
         return proc_file
     # await ws.manager.broadcast(f"Pre-processing requested for {ppath.name}")
     return proc_file
 
 
+@router.post("/visits/{visit_name}/tomography_preprocess_batch")
+def request_tomography_preprocessing_batch(
+    visit_name: str, proc_files: List[ProcessFile]
+):
+    """Request preprocessing of several movies at once. Output directories are
+    created once for each sub-dataset, and all Zocalo messages are sent in a
+    single transaction. Movies whose outputs cannot be determined are skipped,
+    and only the movies for which preprocessing was requested are returned."""
+    accepted: List[ProcessFile] = []
+    outputs: List[tuple[Path, Path]] = []
+    for proc_file in proc_files:
+        try:
+            outputs.append(_preprocessing_outputs(visit_name, proc_file))
+        except ValueError:
+            log.error(
+                f"Pre-processing was requested for {Path(proc_file.path).name} which is not in visit {visit_name}"
+            )
+            continue
+        accepted.append(proc_file)
+    proc_files = accepted
+    known_directories.ensure(*(o.parent for output in outputs for o in output))
+    if not _transport_object:
+        log.error(
+            f"Pre-processing was requested for {len(proc_files)} movies but no Zocalo transport object was found"
+        )
+        return proc_files
+    transaction = _transport_object.transport.transaction_begin()
+    try:
+        for proc_file, (mrc_out, ctf_out) in zip(proc_files, outputs):
+            _transport_object.transport.send(
+                "processing_recipe",
+                _preprocessing_message(proc_file, mrc_out, ctf_out),
+                transaction=transaction,
+            )
+    except Exception:
+        _transport_object.transport.transaction_abort(transaction)
+        raise
+    _transport_object.transport.transaction_commit(transaction)
+    return proc_files
+
+
 @router.post("/visits/{visit_name}/align")
 async def request_tilt_series_alignment(tilt_series: TiltSeries):
     stack_file = (
@@ -256,8 +314,7 @@ async def request_tilt_series_alignment(tilt_series: TiltSeries):
         / "align_output"
         / f"{tilt_series.name}_stack.mrc"
     )
-    if not stack_file.parent.exists():
-        stack_file.parent.mkdir(parents=True)
+    known_directories.ensure(stack_file.parent)
     zocalo_message = {
         "recipes": ["em-tomo-align"],
         "parameters": {
@@ -301,6 +358,11 @@ def get_version(client_version: str = ""):
     return result
 
 
+@router.get("/ispyb/pool")
+def ispyb_pool_statistics():
+    return murfey.server.ispyb.pool_statistics()._asdict()
+
+
 @router.get("/shutdown", include_in_schema=False)
 def shutdown():
     """A method to stop the server. This should be removed before Murfey is
@@ -326,6 +388,63 @@ def suggest_path(visit_name, params: SuggestedPathParameters):
     return {"suggested_path": check_path.relative_to(machine_config.rsync_basepath)}
 
 
+def _transfer_destination(destination: str) -> Path:
+    basepath = machine_config.rsync_basepath.resolve()
+    target = (basepath / destination).resolve()
+    if basepath not in target.parents:
+        log.warning(f"Rejected access to {destination!r} outside of {basepath}")
+        raise HTTPException(status_code=403, detail="Destination not permitted")
+    return target
+
+
+@router.put("/upload/{destination:path}")
+async def upload_file(destination: str, request: Request):
+    """Receive a file streamed by a client using the HTTP transfer backend.
+    The file is written next to its destination and only moved into place
+    once it is complete, so that partial files are never picked up."""
+    mtime: float | None = None
+    modification_time = request.headers.get("X-Murfey-Modification-Time")
+    if modification_time:
+        try:
+            mtime = float(modification_time)
+        except ValueError:
+            mtime = math.nan
+        if not math.isfinite(mtime):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid modification time {modification_time!r}",
+            )
+    target = _transfer_destination(destination)
+    await run_in_threadpool(known_directories.ensure, target.parent)
+    partial = target.parent / f".{target.name}.part"
+    size = 0
+    upload = await run_in_threadpool(open, partial, "wb")
+    try:
+        try:
+            async for chunk in request.stream():
+                await run_in_threadpool(upload.write, chunk)
+                size += len(chunk)
+        finally:
+            upload.close()
+        if mtime is not None:
+            os.utime(partial, (mtime, mtime))
+        partial.replace(target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return {"size": size}
+
+
+@router.get("/checksum/{destination:path}")
+def transferred_file_checksum(destination: str):
+    """Checksum a transferred file, so that clients can verify their transfers"""
+    target = _transfer_destination(destination)
+    try:
+        return murfey.util.checksum.file_checksum(target)._asdict()
+    except (FileNotFoundError, IsADirectoryError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+
 @router.post("/visits/{visit_name}/register_data_collection_group")
 def register_dc_group(visit_name, dcg_params: DCGroupParameters):
     ispyb_proposal_code = visit_name[:2]
@@ -333,12 +452,11 @@ def register_dc_group(visit_name, dcg_params: DCGroupParameters):
     ispyb_visit_number = visit_name.split("-")[-1]
     log.info(f"Registering data collection group on microscope {get_microscope()}")
     dcg_parameters = {
-        "session_id": murfey.server.ispyb.get_session_id(
+        "session_id": murfey.server.ispyb.get_cached_session_id(
             microscope=get_microscope(),
             proposal_code=ispyb_proposal_code,
             proposal_number=ispyb_proposal_number,
             visit_number=ispyb_visit_number,
-            db=murfey.server.ispyb.Session(),
         ),
         "start_time": str(datetime.datetime.now()),
         "experiment_type": dcg_params.experiment_type,
@@ -360,12 +478,11 @@ def start_dc(visit_name, dc_params: DCParameters):
     log.info(f"Starting data collection on microscope {get_microscope()}")
     dc_parameters = {
         "visit": visit_name,
-        "session_id": murfey.server.ispyb.get_session_id(
+        "session_id": murfey.server.ispyb.get_cached_session_id(
             microscope=get_microscope(),
             proposal_code=ispyb_proposal_code,
             proposal_number=ispyb_proposal_number,
             visit_number=ispyb_visit_number,
-            db=murfey.server.ispyb.Session(),
         ),
         "image_directory": dc_params.image_directory,
         "start_time": str(datetime.datetime.now()),
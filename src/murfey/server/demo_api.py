@@ -8,16 +8,24 @@ from typing import List
 
 import packaging.version
 from fastapi import APIRouter, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import HTMLResponse
 from ispyb.sqlalchemy import BLSession
 from pydantic import BaseSettings
 
 import murfey.server.bootstrap
 import murfey.server.websocket as ws
-from murfey.server import feedback_callback_async, get_hostname, get_microscope
+from murfey.server import (
+    conditional_json_response,
+    feedback_callback_async,
+    get_hostname,
+    get_microscope,
+    json_etag,
+)
 from murfey.server import shutdown as _shutdown
 from murfey.server import templates
 from murfey.server.config import from_file
+from murfey.util.directories import DirectoryCache
 from murfey.util.models import (
     ContextInfo,
     DCGroupParameters,
@@ -34,6 +42,9 @@ from murfey.util.state import global_state
 
 log = logging.getLogger("murfey.server.demo_api")
 
+# output directories on the shared file system known to exist
+known_directories = DirectoryCache()
+
 tags_metadata = [murfey.server.bootstrap.tag]
 
 router = APIRouter()
@@ -67,12 +78,14 @@ async def root(request: Request):
 
 
 @lru_cache(maxsize=1)
+def _machine_info() -> tuple[dict, str]:
+    content = jsonable_encoder(machine_config)
+    return content, json_etag(content)
+
+
 @router.get("/machine/")
-def machine_info():
-    if settings.murfey_machine_configuration:
-        microscope = get_microscope()
-        return from_file(settings.murfey_machine_configuration, microscope)
-    return {}
+def machine_info(request: Request):
+    return conditional_json_response(request, *_machine_info())
 
 
 @router.get("/microscope/")
@@ -187,8 +200,7 @@ async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFi
         / "MotionCorr"
         / str(ppath.stem + "_motion_corrected.mrc")
     )
-    if not mrc_out.parent.exists():
-        mrc_out.parent.mkdir(parents=True)
+    known_directories.ensure(mrc_out.parent)
     await feedback_callback_async(
         {},
         {
@@ -203,6 +215,15 @@ async def request_tomography_preprocessing(visit_name: str, proc_file: ProcessFi
     return proc_file
 
 
+@router.post("/visits/{visit_name}/tomography_preprocess_batch")
+async def request_tomography_preprocessing_batch(
+    visit_name: str, proc_files: List[ProcessFile]
+):
+    for proc_file in proc_files:
+        await request_tomography_preprocessing(visit_name, proc_file)
+    return proc_files
+
+
 @router.post("/visits/{visit_name}/align")
 async def request_tilt_series_alignment(tilt_series: TiltSeries):
     stack_file = (
@@ -210,8 +231,7 @@ async def request_tilt_series_alignment(tilt_series: TiltSeries):
         / "align_output"
         / f"aligned_file_{tilt_series.name}.mrc"
     )
-    if not stack_file.parent.exists():
-        stack_file.parent.mkdir(parents=True)
+    known_directories.ensure(stack_file.parent)
     await ws.manager.broadcast(
         f"Processing requested for tilt series {tilt_series.name}"
     )
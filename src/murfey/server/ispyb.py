@@ -2,6 +2,10 @@ from __future__ import annotations
 
 import datetime
 import logging
+import os
+import threading
+import time
+from typing import NamedTuple
 
 import ispyb
 
@@ -30,9 +34,70 @@ from murfey.util.models import Visit
 
 log = logging.getLogger("murfey.server.ispyb")
 
-Session = sqlalchemy.orm.sessionmaker(
-    bind=sqlalchemy.create_engine(url(), connect_args={"use_pure": True})
+_pool_size = int(os.getenv("MURFEY_ISPYB_POOL_SIZE", 10))
+_pool_max_overflow = int(os.getenv("MURFEY_ISPYB_POOL_OVERFLOW", 10))
+
+engine = sqlalchemy.create_engine(
+    url(),
+    connect_args={"use_pure": True},
+    pool_size=_pool_size,
+    max_overflow=_pool_max_overflow,
+    pool_timeout=30,
+    pool_recycle=3600,
+    pool_pre_ping=True,
 )
+Session = sqlalchemy.orm.sessionmaker(bind=engine)
+
+
+class PoolStatistics(NamedTuple):
+    capacity: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    peak_checked_out: int
+    checkouts: int
+
+
+class _PoolMonitor:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, *args):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            exhausted = self.checked_out >= self.capacity
+        if exhausted:
+            log.warning(
+                f"All {self.capacity} ISPyB database connections are in use, further requests will wait for a connection"
+            )
+
+    def checkin(self, *args):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+
+_pool_monitor = _PoolMonitor(_pool_size + _pool_max_overflow)
+sqlalchemy.event.listen(engine, "checkout", _pool_monitor.checkout)
+sqlalchemy.event.listen(engine, "checkin", _pool_monitor.checkin)
+
+
+def pool_statistics() -> PoolStatistics:
+    """Report the utilisation of the ISPyB database connection pool"""
+    pool = engine.pool
+    return PoolStatistics(
+        capacity=_pool_monitor.capacity,
+        checked_out=pool.checkedout(),
+        checked_in=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        peak_checked_out=_pool_monitor.peak_checked_out,
+        checkouts=_pool_monitor.checkouts,
+    )
 
 
 class TransportManager:
@@ -173,6 +238,41 @@ def get_session_id(
     return query[0][1]
 
 
+_session_id_ttl: float = 600
+_session_ids: dict[tuple[str, str, str, str], tuple[int, float]] = {}
+_session_ids_lock = threading.Lock()
+
+
+def get_cached_session_id(
+    microscope: str,
+    proposal_code: str,
+    proposal_number: str,
+    visit_number: str,
+) -> int:
+    """
+    Look up the ISPyB session ID of a visit, remembering it for
+    _session_id_ttl seconds. Session IDs do not change for the lifetime of a
+    visit, so this avoids a database query for every request about a visit.
+    """
+    key = (microscope, proposal_code, proposal_number, visit_number)
+    now = time.monotonic()
+    with _session_ids_lock:
+        cached = _session_ids.get(key)
+    if cached and now - cached[1] < _session_id_ttl:
+        return cached[0]
+    with Session() as db:
+        session_id = get_session_id(
+            microscope=microscope,
+            proposal_code=proposal_code,
+            proposal_number=proposal_number,
+            visit_number=visit_number,
+            db=db,
+        )
+    with _session_ids_lock:
+        _session_ids[key] = (session_id, now)
+    return session_id
+
+
 def get_all_ongoing_visits(microscope: str, db: sqlalchemy.orm.Session) -> list[Visit]:
     query = (
         db.query(BLSession)
@@ -207,14 +307,120 @@ def get_all_ongoing_visits(microscope: str, db: sqlalchemy.orm.Session) -> list[
     ]
 
 
+class VisitCache:
+    """
+    Ongoing visits on a microscope, held in memory indexed by visit name so
+    that requests about visits do not need to query ISPyB. The visits are
+    loaded on first use and then refreshed in a background thread every
+    refresh_interval seconds, or as soon as possible after invalidate() is
+    called. If a refresh fails the previously loaded visits are kept.
+    """
+
+    def __init__(
+        self,
+        microscope: str,
+        refresh_interval: float = 30,
+        session_factory: sqlalchemy.orm.sessionmaker = Session,
+    ):
+        self._microscope = microscope
+        self._refresh_interval = refresh_interval
+        self._session_factory = session_factory
+        self._visits: dict[str, Visit] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self.refreshes = 0
+
+    def __repr__(self) -> str:
+        return f"<VisitCache for {self._microscope} ({len(self._visits)} visits)>"
+
+    def refresh(self):
+        """Reload the ongoing visits from ISPyB"""
+        with self._session_factory() as db:
+            visits = get_all_ongoing_visits(self._microscope, db)
+        with self._lock:
+            self._visits = {visit.name: visit for visit in visits}
+            self.refreshes += 1
+            self._loaded = True
+
+    def invalidate(self):
+        """Request that the visits are reloaded from ISPyB without delay"""
+        self._wake.set()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.refresh()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refresh_loop,
+                    name=f"VisitCache-{self._microscope}",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self._refresh_interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning(
+                    f"Could not refresh visits for {self._microscope}: {e}",
+                    exc_info=True,
+                )
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def visits(self) -> list[Visit]:
+        """All visits that are ongoing"""
+        self._ensure_loaded()
+        now = datetime.datetime.now()
+        with self._lock:
+            return [v for v in self._visits.values() if v.start < now < v.end]
+
+    def get(self, visit_name: str) -> Visit | None:
+        """Look up an ongoing visit by name"""
+        self._ensure_loaded()
+        now = datetime.datetime.now()
+        with self._lock:
+            visit = self._visits.get(visit_name)
+        if visit and visit.start < now < visit.end:
+            return visit
+        return None
+
+
+_visit_caches: dict[str, VisitCache] = {}
+_visit_caches_lock = threading.Lock()
+
+
+def get_visit_cache(microscope: str) -> VisitCache:
+    with _visit_caches_lock:
+        if microscope not in _visit_caches:
+            _visit_caches[microscope] = VisitCache(microscope)
+        return _visit_caches[microscope]
+
+
 def get_data_collection_group_ids(session_id):
-    query = (
-        Session()
-        .query(DataCollectionGroup)
-        .filter(
-            DataCollectionGroup.sessionId == session_id,
+    with Session() as db:
+        query = (
+            db.query(DataCollectionGroup)
+            .filter(
+                DataCollectionGroup.sessionId == session_id,
+            )
+            .all()
         )
-        .all()
-    )
     dcgids = [row.dataCollectionGroupId for row in query]
     return dcgids
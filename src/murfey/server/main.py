@@ -39,3 +39,6 @@ app.include_router(murfey.server.bootstrap.pypi)
 app.include_router(murfey.server.websocket.ws)
 
 app.include_router(router)
+
+app.add_event_handler("startup", murfey.server.start_feedback_consumer)
+app.add_event_handler("shutdown", murfey.server.stop_feedback_consumer)
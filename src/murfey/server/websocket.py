@@ -4,7 +4,7 @@ import asyncio
 import json
 import logging
 from datetime import datetime
-from typing import Any, Dict, Generic, TypeVar
+from typing import Any, Dict, Generic, Tuple, TypeVar
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
@@ -16,32 +16,190 @@ ws = APIRouter(prefix="/ws", tags=["websocket"])
 log = logging.getLogger("murfey.server.websocket")
 
 
+class _Client:
+    """A websocket connection with a queue of messages waiting to be sent to it"""
+
+    def __init__(self, websocket: WebSocket, max_queued: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(max_queued)
+        self.sender: asyncio.Task | None = None
+        self.resyncs = 0
+
+
+# placeholder in a send queue for the full state at the time it is sent
+_STATE_FULL = object()
+
+
 class ConnectionManager(Generic[T]):
-    def __init__(self, state: State[T]):
+    """
+    Keep track of websocket connections and send them messages and changes
+    of the state.
+
+    State changes are sent as numbered deltas, which set an attribute, add
+    entries to a dictionary attribute or remove an attribute. Clients apply
+    them in sequence and ask for the full state if they miss one. Deltas are
+    collected for broadcast_window seconds, during which successive changes
+    of an attribute are merged, and are then sent to all connections.
+
+    Each connection has its own queue of up to max_queued messages, so that
+    clients are sent messages concurrently. A client whose queue fills up has
+    the messages dropped and is sent the full state instead, and a client
+    that does not accept a message within send_timeout seconds is
+    disconnected.
+    """
+
+    def __init__(
+        self,
+        state: State[T],
+        broadcast_window: float = 0.05,
+        max_queued: int = 100,
+        send_timeout: float = 10,
+    ):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.broadcast_window = broadcast_window
+        self.max_queued = max_queued
+        self.send_timeout = send_timeout
+        self._clients: Dict[str, _Client] = {}
+        self._pending: Dict[str, Tuple[str, Any]] = {}
+        self._sequence = 0
+        self._flush_scheduled = False
+        self._loop: asyncio.AbstractEventLoop | None = None
         self._state = state
         self._state.subscribe(self._broadcast_state_update)
 
     async def connect(self, websocket: WebSocket, client_id):
         await websocket.accept()
+        self._loop = asyncio.get_running_loop()
         self.active_connections[client_id] = websocket
-        await websocket.send_json({"message": "state-full", "state": self._state.data})
+        client = _Client(websocket, self.max_queued)
+        client.queue.put_nowait(_STATE_FULL)
+        client.sender = asyncio.create_task(self._send_to(client_id, client))
+        self._clients[client_id] = client
 
     def disconnect(self, websocket: WebSocket, client_id):
-        self.active_connections.pop(client_id)
+        self.active_connections.pop(client_id, None)
+        client = self._clients.pop(client_id, None)
+        if client and client.sender:
+            client.sender.cancel()
+
+    def resync(self, client_id):
+        """Send the full state to a client"""
+        if client_id in self._clients:
+            self._enqueue(client_id, _STATE_FULL)
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            log.info(f"Sending '{message}'")
-            await self.active_connections[connection].send_text(message)
+        log.info(f"Sending '{message}'")
+        for client_id in list(self._clients):
+            self._enqueue(client_id, message)
 
     async def _broadcast_state_update(
         self, attribute: str, value: T | None, message: str = "state-update"
     ):
-        for connection in self.active_connections:
-            await self.active_connections[connection].send_json(
-                {"message": message, "attribute": attribute, "value": value}
+        if not self._clients:
+            # clients connecting later are sent the full state
+            return
+        if self._loop and asyncio.get_running_loop() is not self._loop:
+            # a synchronous state change made outside the server's event loop
+            self._loop.call_soon_threadsafe(
+                self._queue_state_update, attribute, value, message
             )
+            return
+        self._queue_state_update(attribute, value, message)
+
+    def _queue_state_update(self, attribute: str, value: T | None, message: str):
+        if message == "state-update-partial" and isinstance(value, dict):
+            op = "add"
+        elif value is None and attribute not in self._state:
+            op = "remove"
+        else:
+            op = "set"
+        pending = self._pending.get(attribute)
+        if (
+            pending
+            and op == "add"
+            and isinstance(value, dict)
+            and pending[0] in ("set", "add")
+            and isinstance(pending[1], dict)
+        ):
+            # entries added to a pending value are part of the same delta
+            self._pending[attribute] = (pending[0], {**pending[1], **value})
+        else:
+            self._pending[attribute] = (op, value)
+        if self.broadcast_window <= 0:
+            self._flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_later(self.broadcast_window, self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        for attribute, (op, value) in pending.items():
+            self._sequence += 1
+            delta = {
+                "message": "state-delta",
+                "sequence": self._sequence,
+                "attribute": attribute,
+                "op": op,
+                "value": value,
+            }
+            for client_id in list(self._clients):
+                self._enqueue(client_id, delta)
+
+    def _enqueue(self, client_id: str, message: Any):
+        client = self._clients[client_id]
+        try:
+            client.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # the full state supersedes everything waiting to be sent
+            log.warning(
+                f"Client {client_id} is not keeping up with messages, sending it the full state instead"
+            )
+            while not client.queue.empty():
+                client.queue.get_nowait()
+            client.queue.put_nowait(_STATE_FULL)
+            client.resyncs += 1
+
+    async def _send_to(self, client_id: str, client: _Client):
+        while True:
+            message = await client.queue.get()
+            if message is _STATE_FULL:
+                # the full state includes any deltas still waiting
+                waiting = [
+                    client.queue.get_nowait() for _ in range(client.queue.qsize())
+                ]
+                for text in waiting:
+                    if isinstance(text, str):
+                        client.queue.put_nowait(text)
+                send = client.websocket.send_json(
+                    {
+                        "message": "state-full",
+                        "sequence": self._sequence,
+                        "state": self._state.data,
+                    }
+                )
+            elif isinstance(message, str):
+                send = client.websocket.send_text(message)
+            else:
+                send = client.websocket.send_json(message)
+            try:
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                log.warning(
+                    f"Disconnecting client {client_id}, which did not accept a message within {self.send_timeout} seconds"
+                )
+            except Exception as e:
+                log.warning(f"Disconnecting client {client_id}: {e}")
+            else:
+                continue
+            if self._clients.get(client_id) is client:
+                del self._clients[client_id]
+                self.active_connections.pop(client_id, None)
+            try:
+                await client.websocket.close()
+            except Exception:
+                pass
+            return
 
     async def set_state(self, attribute: str, value: T):
         log.info(f"State attribute {attribute!r} set to {value!r}")
@@ -69,6 +227,8 @@ async def websocket_endpoint(websocket: WebSocket, client_id: int):
                 if json_data["type"] == "log":  # and isinstance(json_data, dict)
                     json_data.pop("type")
                     await forward_log(json_data, websocket)
+                elif json_data["type"] == "state-resync":
+                    manager.resync(client_id)
             #                elif json_data["type"] == "start_dc":
             #                    json_data.pop("type")
             #                    assert _transport_object is not None
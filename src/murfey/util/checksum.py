@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import os
+import zlib
+from typing import NamedTuple
+
+_chunk_size = 8 * 1024 * 1024
+
+
+class FileChecksum(NamedTuple):
+    size: int
+    crc32: int
+
+
+def file_checksum(file_path: str | os.PathLike) -> FileChecksum:
+    """
+    Calculate the CRC32 checksum of a file, reading it in large chunks into a
+    reused buffer. The same function is used on client and server so that the
+    results can be compared.
+    """
+    crc32 = 0
+    size = 0
+    buffer = bytearray(_chunk_size)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            crc32 = zlib.crc32(view[:length], crc32)
+            size += length
+    return FileChecksum(size=size, crc32=crc32)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import collections
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class DirectoryCache:
+    """
+    Create directories, remembering which directories are known to exist so
+    that repeated requests for the same directory do not touch the file
+    system. At most maxsize directories are remembered, each for up to
+    max_age seconds, after which their existence is checked again.
+    """
+
+    def __init__(self, maxsize: int = 10000, max_age: float = 3600):
+        self._maxsize = maxsize
+        self._max_age = max_age
+        self._known: collections.OrderedDict[Path, float] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"<DirectoryCache {len(self._known)} directories, {self.hits} hits, {self.misses} misses>"
+
+    def _is_known(self, directory: Path, now: float) -> bool:
+        known_since = self._known.get(directory)
+        if known_since is None or now - known_since > self._max_age:
+            return False
+        self._known.move_to_end(directory)
+        return True
+
+    def ensure(self, *directories: str | os.PathLike):
+        """
+        Make sure that all given directories exist. Each directory is only
+        created once, and only the deepest of a set of nested directories is
+        created explicitly, as creating it creates its parents too.
+        """
+        now = time.monotonic()
+        with self._lock:
+            missing = set()
+            for directory in map(Path, directories):
+                if self._is_known(directory, now):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    missing.add(directory)
+        if not missing:
+            return
+        implied = {parent for directory in missing for parent in directory.parents}
+        for directory in sorted(missing - implied):
+            directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            for directory in missing:
+                self._known[directory] = now
+                self._known.move_to_end(directory)
+            while len(self._known) > self._maxsize:
+                self._known.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple
+
+
+class LockStatistics(NamedTuple):
+    acquisitions: int
+    contended: int
+    total_wait: float
+    max_wait: float
+    total_hold: float
+    max_hold: float
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.acquisitions if self.acquisitions else 0
+
+    @property
+    def mean_hold(self) -> float:
+        return self.total_hold / self.acquisitions if self.acquisitions else 0
+
+
+def combine_statistics(statistics: Iterable[LockStatistics]) -> LockStatistics:
+    combined = LockStatistics(0, 0, 0, 0, 0, 0)
+    for s in statistics:
+        combined = LockStatistics(
+            acquisitions=combined.acquisitions + s.acquisitions,
+            contended=combined.contended + s.contended,
+            total_wait=combined.total_wait + s.total_wait,
+            max_wait=max(combined.max_wait, s.max_wait),
+            total_hold=combined.total_hold + s.total_hold,
+            max_hold=max(combined.max_hold, s.max_hold),
+        )
+    return combined
+
+
+class MeasuredLock:
+    """
+    A reentrant lock which records how often it was acquired, how often and
+    for how long threads had to wait for it, and for how long it was held.
+    Reentrant acquisitions by the thread holding the lock are not counted.
+
+    The counters are only changed by the thread holding the lock, and are
+    read without taking the lock, so statistics can be slightly out of date.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._held_since: float = 0
+        self._acquisitions = 0
+        self._contended = 0
+        self._total_wait: float = 0
+        self._max_wait: float = 0
+        self._total_hold: float = 0
+        self._max_hold: float = 0
+
+    def __repr__(self) -> str:
+        return f"<MeasuredLock {self.name} {self.statistics}>"
+
+    @property
+    def statistics(self) -> LockStatistics:
+        return LockStatistics(
+            acquisitions=self._acquisitions,
+            contended=self._contended,
+            total_wait=self._total_wait,
+            max_wait=self._max_wait,
+            total_hold=self._total_hold,
+            max_hold=self._max_hold,
+        )
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        wait: float = 0
+        if not self._lock.acquire(blocking=False):
+            if not blocking:
+                return False
+            start = time.perf_counter()
+            if not self._lock.acquire(timeout=timeout):
+                return False
+            wait = time.perf_counter() - start
+        if not self._depth:
+            self._held_since = time.perf_counter()
+            self._acquisitions += 1
+            if wait:
+                self._contended += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if not self._depth:
+            held = time.perf_counter() - self._held_since
+            self._total_hold += held
+            self._max_hold = max(self._max_hold, held)
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class KeyedLocks:
+    """
+    A separate MeasuredLock for each key, eg. for each tilt series, so that
+    work on different keys does not contend. If a shared lock is given it is
+    used for all keys instead.
+    """
+
+    def __init__(self, name: str = "", shared: MeasuredLock | None = None):
+        self.name = name
+        self._shared = shared
+        self._locks: Dict[str, MeasuredLock] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<KeyedLocks {self.name} {len(self._locks)} locks>"
+
+    def __getitem__(self, key: str) -> MeasuredLock:
+        if self._shared:
+            return self._shared
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(key, MeasuredLock(f"{self.name}[{key}]"))
+        return lock
+
+    @property
+    def statistics(self) -> LockStatistics:
+        if self._shared:
+            return self._shared.statistics
+        return combine_statistics(
+            lock.statistics for lock in list(self._locks.values())
+        )
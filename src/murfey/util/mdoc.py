@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import TextIO
+from typing import List, TextIO
 
 
 def _basic_parse(line: str) -> dict:
@@ -25,6 +25,13 @@ def get_block(mdocfile: TextIO) -> dict:
     return as_dict
 
 
+def get_blocks(mdocfile: TextIO) -> List[dict]:
+    blocks = []
+    while block := get_block(mdocfile):
+        blocks.append(block)
+    return blocks
+
+
 def get_global_data(mdocfile: TextIO) -> dict:
     as_dict = {}
     while line := mdocfile.readline():
@@ -1,6 +1,13 @@
 from __future__ import annotations
 
+import time
+from unittest import mock
+from urllib.parse import urlparse
+
 from murfey.client.analyser import Analyser
+from murfey.client.context import TomographyContext
+from murfey.client.contexts.tomo import TiltSeriesTracker
+from murfey.client.instance_environment import MurfeyInstanceEnvironment
 
 
 def test_analyser_setup_and_stopping(tmp_path):
@@ -29,3 +36,107 @@ def test_analyser_epu_determination(tmp_path):
     analyser.queue.put(tomo_file)
     analyser.stop()
     assert analyser._context._acquisition_software == "epu"
+
+
+_tomo_xml = (
+    "<Acquisition><Info><ImageSize><Width>4096</Width><Height>4096</Height>"
+    "</ImageSize><SensorPixelSize><Height>1e-10</Height></SensorPixelSize>"
+    "</Info></Acquisition>"
+)
+
+
+def _environment():
+    return MurfeyInstanceEnvironment(
+        url=urlparse("http://localhost:8000", allow_fragments=False), demo=True
+    )
+
+
+def _transfer(analyser, tmp_path, movies):
+    for movie in movies:
+        movie = tmp_path / movie
+        movie.with_suffix(".xml").write_text(_tomo_xml)
+        analyser.queue.put(movie)
+    while not analyser.queue.empty():
+        time.sleep(0.01)
+
+
+def test_analyser_analyses_tilt_series_in_order_and_in_parallel(tmp_path):
+    analysed = []
+
+    def slow_request_tilt(self, file_path, sequenced, environment):
+        if file_path.name.startswith("Position_1_"):
+            time.sleep(0.05)
+        analysed.append(file_path.name)
+
+    with mock.patch.object(TomographyContext, "_request_tilt", slow_request_tilt):
+        analyser = Analyser(tmp_path, environment=_environment(), partitions=4)
+        analyser.start()
+        _transfer(
+            analyser,
+            tmp_path,
+            [
+                f"{tilt_series}_[{angle}].tiff"
+                for angle in ("0.0", "3.0", "-3.0")
+                for tilt_series in ("Position_1", "Position_2")
+            ],
+        )
+        analyser.stop()
+    assert [f for f in analysed if f.startswith("Position_1_")] == [
+        "Position_1_[0.0].tiff",
+        "Position_1_[3.0].tiff",
+        "Position_1_[-3.0].tiff",
+    ]
+    assert [f for f in analysed if f.startswith("Position_2_")] == [
+        "Position_2_[0.0].tiff",
+        "Position_2_[3.0].tiff",
+        "Position_2_[-3.0].tiff",
+    ]
+    # the second tilt series is not held up by the slow first one
+    assert analysed.index("Position_2_[-3.0].tiff") < analysed.index(
+        "Position_1_[-3.0].tiff"
+    )
+    assert set(analyser._context._tilt_series) == {"Position_1", "Position_2"}
+
+
+def test_analyser_completes_tilt_series_in_transfer_order(tmp_path):
+    analysed = []
+    completed = []
+
+    def slow_request_tilt(self, file_path, sequenced, environment):
+        if file_path.name == "Position_1_[-3.0].tiff":
+            time.sleep(0.2)
+        analysed.append(file_path.name)
+
+    def align_tilt_series(self, tilt_series, environment):
+        analysed.append(tilt_series)
+
+    def mark_complete(self, tilt_series):
+        completed.append((tilt_series, len(self[tilt_series])))
+        return tracker_mark_complete(self, tilt_series)
+
+    tracker_mark_complete = TiltSeriesTracker.mark_complete
+    with mock.patch.object(
+        TomographyContext, "_request_tilt", slow_request_tilt
+    ), mock.patch.object(
+        TomographyContext, "_align_tilt_series", align_tilt_series
+    ), mock.patch.object(
+        TiltSeriesTracker, "mark_complete", mark_complete
+    ):
+        analyser = Analyser(tmp_path, environment=_environment(), partitions=4)
+        analyser.start()
+        _transfer(
+            analyser,
+            tmp_path,
+            [
+                f"{tilt_series}_[{angle}].tiff"
+                for tilt_series in ("Position_1", "Position_2")
+                for angle in ("0.0", "3.0", "-3.0")
+            ],
+        )
+        analyser.stop()
+    # the first tilt series is completed by the start of the second one, not
+    # before its slowly analysed last tilt has been added to it
+    assert completed == [("Position_1", 3), ("Position_2", 3)]
+    assert analyser._context._completed_tilt_series == ["Position_1", "Position_2"]
+    # the tilt series is aligned after the analysis of all its tilts
+    assert analysed.index("Position_1") > analysed.index("Position_1_[-3.0].tiff")
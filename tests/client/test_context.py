@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import os
+import time
+from unittest import mock
+
 from murfey.client.context import TomographyContext
+from murfey.client.contexts.tomo import TiltSeriesTracker
 
 
 def test_tomography_context_initialisation_for_tomo():
@@ -96,3 +101,138 @@ def test_tomography_context_add_serialem_decimal_tilt(tmp_path):
     context.post_transfer(tmp_path / "tomography_2_2_30.0.tiff", role="detector")
     assert len(context._tilt_series.values()) == 2
     assert context._completed_tilt_series == ["1"]
+
+
+def test_tilt_series_tracker_ignores_repeated_movies_and_angles(tmp_path):
+    tracker = TiltSeriesTracker()
+    assert tracker.add("1", tmp_path / "a.tiff", "30.0")
+    assert not tracker.add("1", tmp_path / "a.tiff", "-30.0")
+    assert not tracker.add("1", tmp_path / "b.tiff", "30.0")
+    assert tracker.add("1", tmp_path / "b.tiff", "-30.0")
+    assert tracker.add("2", tmp_path / "c.tiff", "30.0")
+    assert tracker == {
+        "1": [tmp_path / "a.tiff", tmp_path / "b.tiff"],
+        "2": [tmp_path / "c.tiff"],
+    }
+    assert tracker.largest == 2
+
+
+def test_tilt_series_tracker_completion(tmp_path):
+    tracker = TiltSeriesTracker()
+    for series in ("1", "2", "3"):
+        for angle in ("30.0", "-30.0"):
+            tracker.add(series, tmp_path / f"{series}_{angle}.tiff", angle)
+    tracker.add("3", tmp_path / "3_60.0.tiff", "60.0")
+    assert tracker.incomplete_largest() == ["3"]
+    tracker.add("1", tmp_path / "1_60.0.tiff", "60.0")
+    assert tracker.incomplete_largest() == ["1", "3"]
+    tracker.mark_complete("3")
+    tracker.mark_complete("1")
+    tracker.mark_aligned("1")
+    assert tracker.incomplete_largest() == []
+    assert tracker.completed == ["3", "1"]
+    assert tracker.is_aligned("1")
+
+    tracker.reopen("1")
+    assert not tracker.is_complete("1")
+    assert not tracker.is_aligned("1")
+    assert tracker.incomplete_largest() == ["1"]
+    tracker.add("1", tmp_path / "1_-60.0.tiff", "-60.0")
+    assert tracker.largest == 4
+    assert tracker.incomplete_largest() == ["1"]
+    assert tracker.completed_count == 1
+
+
+def _write_mdoc(mdoc_path, movies, age: float = 3600):
+    """Write an mdoc file last changed age seconds ago"""
+    with open(mdoc_path, "w") as mdoc:
+        mdoc.write("PixelSpacing = 1.94\nVoltage = 300\n\n")
+        for z, movie in enumerate(movies):
+            mdoc.write(
+                f"[ZValue = {z}]\nSubFramePath = X:\\Frames\\{movie}\nNumSubFrames = 10\n\n"
+            )
+    modification_time = time.time() - age
+    os.utime(mdoc_path, (modification_time, modification_time))
+
+
+def test_tomography_context_tilt_series_complete_with_last_scheduled_tilt(tmp_path):
+    context = TomographyContext("tomo")
+    angles = ("0.0", "3.0", "-3.0")
+    _write_mdoc(
+        tmp_path / "Position_1.mdoc", [f"Position_1_[{a}].tiff" for a in angles]
+    )
+    assert context.post_transfer(tmp_path / "Position_1.mdoc") == []
+    for angle in angles[:2]:
+        assert not context._add_tomo_tilt(tmp_path / f"Position_1_[{angle}].tiff")
+    assert context._add_tomo_tilt(tmp_path / "Position_1_[-3.0].tiff") == ["Position_1"]
+    assert context._completed_tilt_series == ["Position_1"]
+
+    # tilt series with a schedule are not completed by reaching the size of
+    # the largest tilt series
+    _write_mdoc(
+        tmp_path / "Position_2.mdoc",
+        [f"Position_2_[{a}].tiff" for a in (*angles, "6.0")],
+    )
+    context.post_transfer(tmp_path / "Position_2.mdoc")
+    for angle in angles:
+        assert context._add_tomo_tilt(tmp_path / f"Position_2_[{angle}].tiff") == []
+    assert context._add_tomo_tilt(tmp_path / "Position_2_[6.0].tiff") == ["Position_2"]
+    assert context._completed_tilt_series == ["Position_1", "Position_2"]
+
+
+def test_tomography_context_tilt_series_complete_with_late_schedule(tmp_path):
+    context = TomographyContext("serialem")
+    movies = [f"tomography_1_2_{a}.tiff" for a in ("0.0", "3.0", "-3.0")]
+    for movie in movies:
+        context.post_transfer(tmp_path / movie, role="detector")
+    assert not context._completed_tilt_series
+    _write_mdoc(tmp_path / "tomography_1.mrc.mdoc", movies)
+    assert context.post_transfer(tmp_path / "tomography_1.mrc.mdoc") == ["1"]
+    assert context._completed_tilt_series == ["1"]
+
+
+def test_tomography_context_does_not_trust_a_growing_mdoc(tmp_path):
+    context = TomographyContext("tomo")
+    mdoc_file = tmp_path / "Position_1.mdoc"
+    # the mdoc file is transferred while the tilt series is being acquired
+    _write_mdoc(mdoc_file, ["Position_1_[0.0].tiff", "Position_1_[3.0].tiff"], age=0)
+    assert context.post_transfer(mdoc_file) == []
+    assert context._add_tomo_tilt(tmp_path / "Position_1_[0.0].tiff") == []
+    assert context._add_tomo_tilt(tmp_path / "Position_1_[3.0].tiff") == []
+    assert not context._completed_tilt_series
+
+    _write_mdoc(
+        mdoc_file,
+        [f"Position_1_[{a}].tiff" for a in ("0.0", "3.0", "-3.0")],
+        age=context._tilt_schedule_settling_time,
+    )
+    assert context.post_transfer(mdoc_file) == []
+    assert context._add_tomo_tilt(tmp_path / "Position_1_[-3.0].tiff") == ["Position_1"]
+
+
+def test_tomography_context_completes_last_tilt_series_once_its_mdoc_settles(
+    tmp_path,
+):
+    context = TomographyContext("serialem")
+    context._tilt_schedule_settling_time = 0.2
+    movies = [f"tomography_1_2_{a}.tiff" for a in ("0.0", "3.0", "-3.0")]
+    _write_mdoc(tmp_path / "tomography_1.mrc.mdoc", movies, age=0)
+    environment = mock.sentinel.environment
+    with mock.patch.object(context, "_align_tilt_series") as align_tilt_series:
+        assert context._add_serialem_tilt(tmp_path / movies[0]) == []
+        assert (
+            context.post_transfer(
+                tmp_path / "tomography_1.mrc.mdoc", environment=environment
+            )
+            == []
+        )
+        for movie in movies[1:]:
+            assert context._add_serialem_tilt(tmp_path / movie) == []
+        # no more files are transferred after the last tilt series of the session
+        for _ in range(100):
+            if align_tilt_series.called:
+                break
+            time.sleep(0.01)
+    assert context._completed_tilt_series == ["1"]
+    assert context._tilt_series.is_scheduled("1")
+    align_tilt_series.assert_called_once_with("1", environment)
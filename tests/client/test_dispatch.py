@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+from murfey.client.dispatch import APIDispatcher
+
+
+def test_requests_with_the_same_key_are_sent_in_order():
+    sent = []
+    lock = threading.Lock()
+
+    def post(url, json):
+        # later requests would overtake earlier ones if they were sent in parallel
+        time.sleep(0.01 * (5 - json["n"]))
+        with lock:
+            sent.append((url, json["n"]))
+        return mock.Mock(status_code=200, ok=True)
+
+    dispatcher = APIDispatcher(max_in_flight=4)
+    with mock.patch("murfey.client.dispatch.requests.Session") as session:
+        session.return_value.post.side_effect = post
+        for n in range(5):
+            dispatcher.post("http://server/a", json={"n": n}, key="Position_1")
+            dispatcher.post("http://server/b", json={"n": n}, key="Position_2")
+        dispatcher.shutdown()
+    assert [n for url, n in sent if url.endswith("a")] == list(range(5))
+    assert [n for url, n in sent if url.endswith("b")] == list(range(5))
+    statistics = dispatcher.statistics
+    assert statistics.completed == 10
+    assert statistics.queued == statistics.in_flight == statistics.failed == 0
+    assert statistics.max_latency >= statistics.mean_latency > 0
+
+
+def test_failed_requests_are_retried_with_backoff():
+    responses = [
+        requests.ConnectionError("connection refused"),
+        mock.Mock(status_code=503, ok=False),
+        mock.Mock(status_code=200, ok=True),
+    ]
+    dispatcher = APIDispatcher(retries=3, backoff=0)
+    with mock.patch("murfey.client.dispatch.requests.Session") as session:
+        session.return_value.post.side_effect = responses
+        response = dispatcher.post("http://server/a", json={}).result(timeout=5)
+        assert response.status_code == 200
+
+        session.return_value.post.side_effect = requests.ConnectionError("down")
+        future = dispatcher.post("http://server/a", json={})
+        with pytest.raises(requests.ConnectionError):
+            future.result(timeout=5)
+        dispatcher.shutdown()
+    assert dispatcher.statistics.completed == 1
+    assert dispatcher.statistics.failed == 1
+
+
+def test_coalesced_items_are_sent_as_lists():
+    dispatcher = APIDispatcher(coalesce_window=60, coalesce_max=3)
+    with mock.patch("murfey.client.dispatch.requests.Session") as session:
+        session.return_value.post.return_value = mock.Mock(status_code=200, ok=True)
+        for n in range(5):
+            dispatcher.post_coalesced("http://server/batch", {"n": n})
+        dispatcher.join()
+        assert session.return_value.post.call_args_list == [
+            mock.call("http://server/batch", json=[{"n": 0}, {"n": 1}, {"n": 2}]),
+            mock.call("http://server/batch", json=[{"n": 3}, {"n": 4}]),
+        ]
+        dispatcher.shutdown()
+
+        dispatcher = APIDispatcher(coalesce_window=0.05)
+        dispatcher.post_coalesced("http://server/batch", {"n": 5})
+        time.sleep(0.5)
+        assert dispatcher.statistics.completed == 1
+        dispatcher.shutdown()
+
+
+def test_timer_of_a_full_batch_does_not_flush_the_next_batch():
+    dispatcher = APIDispatcher(coalesce_window=0.2, coalesce_max=2)
+    with mock.patch("murfey.client.dispatch.requests.Session") as session:
+        session.return_value.post.return_value = mock.Mock(status_code=200, ok=True)
+        dispatcher.post_coalesced("http://server/batch", {"n": 0})
+        time.sleep(0.1)
+        dispatcher.post_coalesced("http://server/batch", {"n": 1})
+        dispatcher.post_coalesced("http://server/batch", {"n": 2})
+        # the first batch's timer would have fired by now
+        time.sleep(0.15)
+        dispatcher.post_coalesced("http://server/batch", {"n": 3})
+        time.sleep(0.3)
+        dispatcher.shutdown()
+        assert session.return_value.post.call_args_list == [
+            mock.call("http://server/batch", json=[{"n": 0}, {"n": 1}]),
+            mock.call("http://server/batch", json=[{"n": 2}, {"n": 3}]),
+        ]
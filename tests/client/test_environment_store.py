@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from murfey.client.environment_store import (
+    Change,
+    EnvironmentChange,
+    EnvironmentStore,
+)
+
+
+def test_environment_store_emits_a_change_per_entry():
+    movies: dict = {}
+    store = EnvironmentStore({"movies": movies})
+    changes = []
+    store.subscribe("movies", changes.append)
+    store.put("movies", "a", 1)
+    store.update("movies", {"a": 1, "b": 2})
+    store.update("movies", {"a": 3})
+    store.remove("movies", "b")
+    store.remove("movies", "c")
+    assert changes == [
+        EnvironmentChange("movies", "a", Change.ADDED, 1),
+        EnvironmentChange("movies", "b", Change.ADDED, 2),
+        EnvironmentChange("movies", "a", Change.UPDATED, 3),
+        EnvironmentChange("movies", "b", Change.REMOVED, 2),
+    ]
+    assert store["movies"] is movies
+    assert movies == {"a": 3}
+    assert store.events == 4
+
+
+def test_environment_store_replace_only_reports_differences():
+    store = EnvironmentStore({"movies": {"a": 1, "b": 2}})
+    changes = []
+    store.subscribe("movies", changes.append)
+    store.replace("movies", {"b": 2, "c": 3})
+    assert changes == [
+        EnvironmentChange("movies", "a", Change.REMOVED, 1),
+        EnvironmentChange("movies", "c", Change.ADDED, 3),
+    ]
+    assert store["movies"] == {"b": 2, "c": 3}
+
+
+def test_environment_store_listener_errors_do_not_stop_other_listeners():
+    store = EnvironmentStore({"movies": {}})
+    changes = []
+
+    def fail(change: EnvironmentChange):
+        raise ValueError(change.key)
+
+    store.subscribe("movies", fail)
+    store.subscribe("movies", changes.append)
+    store.put("movies", "a", 1)
+    assert [c.key for c in changes] == ["a"]
+    store.unsubscribe("movies", changes.append)
+    store.put("movies", "b", 1)
+    assert [c.key for c in changes] == ["a"]
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import threading
+from pathlib import Path
+from unittest import mock
 from urllib.parse import urlparse
 
 import pytest
@@ -33,3 +36,135 @@ def test_murfey_instance_environment_subscribe(env):
         "b": {"em-tomo-preprocess": 2},
     }
     assert dc.elem == "b"
+
+
+def test_machine_config_is_cached_and_revalidated(env):
+    config = {"rsync_basepath": "/dls"}
+    with mock.patch("murfey.client.instance_environment.requests.get") as get:
+        get.return_value = mock.Mock(
+            status_code=200, json=lambda: config, headers={"ETag": '"1"'}
+        )
+        assert env.get_machine_config() == config
+        assert env.get_machine_config() == config
+        get.assert_called_once_with("http://localhost:8000/machine/", headers={})
+
+        env.machine_config_checked -= env.machine_config_max_age
+        get.return_value = mock.Mock(status_code=304)
+        assert env.get_machine_config() == config
+        get.assert_called_with(
+            "http://localhost:8000/machine/", headers={"If-None-Match": '"1"'}
+        )
+        assert get.call_count == 2
+
+
+def test_state_deltas_are_applied_in_place(env):
+    added = []
+    env.listeners["data_collection_ids"] = {added.append}
+    env.apply_state_delta("data_collection_ids", "set", {"Position_1": 1})
+    data_collection_ids = env.data_collection_ids
+    env.apply_state_delta("data_collection_ids", "add", {"Position_2": "2"})
+    env.apply_state_delta("data_collection_ids", "add", {"Position_1": 3})
+    assert env.data_collection_ids is data_collection_ids
+    assert env.data_collection_ids == {"Position_1": 3, "Position_2": 2}
+    assert added == ["Position_1", "Position_2", "Position_1"]
+
+    env.apply_state_delta("data_collection_ids", "remove", None)
+    assert env.data_collection_ids == {}
+    env.apply_state_delta("Client 1", "set", "joined")
+
+
+def test_assignments_only_notify_listeners_of_changed_entries(env):
+    added = []
+    env.listeners["data_collection_ids"] = {added.append}
+    data_collection_ids = env.data_collection_ids
+    env.data_collection_ids = {"Position_1": 1}
+    env.data_collection_ids = {"Position_1": 1, "Position_2": "2"}
+    env.data_collection_ids = {"Position_2": 3}
+    assert added == ["Position_1", "Position_2", "Position_2"]
+    assert env.data_collection_ids is data_collection_ids
+    assert env.data_collection_ids == {"Position_2": 3}
+    assert env.store.events == 4
+
+
+def test_motion_corrected_listeners_are_given_the_motion_corrected_tilts(env):
+    calls = []
+    env.listeners["motion_corrected_movies"] = {lambda *args: calls.append(args)}
+    env.data_collection_ids = {"Position_1": 1}
+    env.processing_job_ids = {"Position_1": {"em-tomo-align": 2}}
+    env.autoproc_program_ids = {"Position_1": {"em-tomo-align": 3}}
+    for angle in ("0.0", "3.0"):
+        movie = Path(f"/data/Position_1_[{angle}].tiff")
+        env.movie_tilt_pair[movie] = "Position_1"
+        env.tilt_angles.setdefault("Position_1", []).append([str(movie), angle])
+    env.apply_state_delta(
+        "motion_corrected_movies",
+        "add",
+        {"/data/Position_1_[3.0].tiff": ["/processed/Position_1_3.0.mrc", 2]},
+    )
+    env.apply_state_delta(
+        "motion_corrected_movies",
+        "add",
+        {"/data/Position_1_[0.0].tiff": ["/processed/Position_1_0.0.mrc", 1]},
+    )
+    assert [c[0] for c in calls] == [
+        Path("/data/Position_1_[3.0].tiff"),
+        Path("/data/Position_1_[0.0].tiff"),
+    ]
+    assert calls[-1][1:] == (
+        "/processed/Position_1_0.0.mrc",
+        "http://localhost:8000/visits//align",
+        1,
+        2,
+        3,
+        "1",
+        [
+            ["/processed/Position_1_0.0.mrc", "0.0", "1"],
+            ["/processed/Position_1_3.0.mrc", "3.0", "2"],
+        ],
+    )
+
+
+def test_listeners_are_called_under_the_lock_of_their_tag(env):
+    called = []
+
+    def flush(tag: str):
+        assert env.tag_lock(tag).acquire(blocking=False)
+        env.tag_lock(tag).release()
+        called.append(tag)
+
+    env.listeners["data_collection_ids"] = {flush}
+    held = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        with env.tag_lock("Position_1"):
+            held.set()
+            done.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    # a listener for another tilt series is not held up
+    env.apply_state_delta("data_collection_ids", "add", {"Position_2": 2})
+    assert called == ["Position_2"]
+    adding = threading.Thread(
+        target=env.apply_state_delta,
+        args=("data_collection_ids", "add", {"Position_1": 1}),
+    )
+    adding.start()
+    adding.join(0.05)
+    assert called == ["Position_2"]
+    done.set()
+    adding.join()
+    holder.join()
+    assert called == ["Position_2", "Position_1"]
+    assert env.lock_statistics()["tags"].contended == 1
+
+
+def test_data_collection_group_listeners_see_the_new_group(env):
+    seen = []
+    env.listeners["data_collection_group_id"] = {
+        lambda: seen.append(env.data_collection_group_id)
+    }
+    env.data_collection_group_id = 1
+    assert seen == [1]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from murfey.client.journal import FileState, JournalEntry, TransferJournal
+from murfey.client.rsync import RSyncer
+from murfey.client.watchdir import DirWatcher
+
+
+def test_journal_keeps_file_details_across_state_changes(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    journal.record("a/file01.tiff", FileState.SETTLED, size=10, modification_time=1.5)
+    journal.record("a/file01.tiff", FileState.QUEUED)
+    journal.record("file02.mdoc", FileState.SETTLED, size=3, modification_time=2.5)
+    journal.record("a/file01.tiff", FileState.TRANSFERRED)
+    journal.close()
+
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    assert journal.entries() == {
+        "a/file01.tiff": JournalEntry(10, 1.5, FileState.TRANSFERRED),
+        "file02.mdoc": JournalEntry(3, 2.5, FileState.SETTLED),
+    }
+    assert list(journal.entries(FileState.TRANSFERRED)) == ["a/file01.tiff"]
+    journal.close()
+
+
+def test_journal_flushes_buffered_records_once_no_more_arrive(tmp_path):
+    journal = TransferJournal(tmp_path / "journal.sqlite")
+    journal._flush_interval = 0.1
+    journal.record("file01.tiff", FileState.SETTLED, size=10, modification_time=1.5)
+    time.sleep(0.5)
+    connection = sqlite3.connect(tmp_path / "journal.sqlite")
+    assert connection.execute("SELECT path, state FROM files").fetchall() == [
+        ("file01.tiff", FileState.SETTLED)
+    ]
+    connection.close()
+    journal.close()
+
+
+def test_restarted_client_only_transfers_new_and_changed_files(tmp_path):
+    source = tmp_path / "source"
+    (source / "a").mkdir(parents=True)
+    for name in ("a/file01.tiff", "file02.mdoc", "file03.xml"):
+        (source / name).write_text("x")
+
+    def run_session(journal: TransferJournal) -> list[Path]:
+        watcher = DirWatcher(source, settling_time=0, journal=journal)
+        rsyncer = RSyncer(
+            source,
+            basepath_remote=Path("remote"),
+            server_url=urlparse("http://localhost:8000"),
+            do_transfer=False,
+            batch_max_wait=0.1,
+            journal=journal,
+        )
+        transferred: list[Path] = []
+        rsyncer.subscribe(lambda update: transferred.append(update.file_path))
+        watcher.subscribe(rsyncer.enqueue)
+        rsyncer.start()
+        watcher.scan(transfer_all=True)
+        watcher.scan(transfer_all=True)
+        rsyncer.stop()
+        journal.close()
+        return sorted(transferred)
+
+    assert run_session(TransferJournal(tmp_path / "journal.sqlite")) == [
+        Path("a/file01.tiff"),
+        Path("file02.mdoc"),
+        Path("file03.xml"),
+    ]
+
+    (source / "file03.xml").write_text("xx")
+    (source / "file04.tiff").write_text("x")
+    assert run_session(TransferJournal(tmp_path / "journal.sqlite")) == [
+        Path("file03.xml"),
+        Path("file04.tiff"),
+    ]
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlparse
+
+from murfey.client.rsync import (
+    RSyncer,
+    RSyncerUpdate,
+    TransferPriority,
+    TransferResult,
+    _parse_out_format,
+    _rsync_has_machine_readable_output,
+)
+
+
+def test_rsyncer_with_several_workers_reports_files_in_queue_order(tmp_path):
+    files = []
+    for d in ("a", "b", "c"):
+        (tmp_path / d).mkdir()
+        for i in range(10):
+            f = tmp_path / d / f"file{i:02d}.tiff"
+            f.write_bytes(b"x" * (i + 1) * 100)
+            files.append(f)
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        do_transfer=False,
+        workers=3,
+    )
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    rsyncer.start()
+    for f in files:
+        rsyncer.enqueue(f)
+    rsyncer.stop()
+    assert len(rsyncer._worker_threads) == 3
+    assert not any(t.is_alive() for t in rsyncer._worker_threads)
+    assert [u.file_path for u in updates] == [f.relative_to(tmp_path) for f in files]
+    assert all(u.outcome is TransferResult.SUCCESS for u in updates)
+
+
+def test_rsyncer_batches_respect_file_limit_and_are_recorded(tmp_path):
+    files = []
+    for i in range(10):
+        f = tmp_path / f"file{i:02d}.tiff"
+        f.write_bytes(b"x" * 10)
+        files.append(f)
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        do_transfer=False,
+        batch_max_files=4,
+        batch_max_wait=0.1,
+        adaptive_batching=False,
+    )
+    for f in files:
+        rsyncer.enqueue(f)
+    rsyncer.start()
+    rsyncer.stop()
+    assert rsyncer.batch_statistics.batches == 3
+    assert rsyncer.batch_statistics.files == 10
+    assert rsyncer.batch_statistics.bytes == 100
+    assert rsyncer.batch_statistics.histogram == {4: 2, 2: 1}
+
+
+def test_batch_is_cut_once_the_queue_goes_idle(tmp_path):
+    (tmp_path / "file01.tiff").write_bytes(b"x" * 10)
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        do_transfer=False,
+        batch_max_wait=10,
+        batch_idle_wait=0.1,
+    )
+    transferred = threading.Event()
+    rsyncer.subscribe(lambda update: transferred.set())
+    rsyncer.start()
+    rsyncer.enqueue(tmp_path / "file01.tiff")
+    transferred_in_time = transferred.wait(timeout=2)
+    rsyncer.stop()
+    assert transferred_in_time
+
+
+def test_http_backend_streams_files_over_one_session(tmp_path):
+    (tmp_path / "a").mkdir()
+    files = [tmp_path / "file02.mdoc", tmp_path / "a" / "file01.tiff"]
+    for f in files:
+        f.write_bytes(b"x" * 10)
+    received = {}
+
+    def put(url, data, headers):
+        received[url] = data.read()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"size": len(received[url])}
+        return response
+
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        backend="http",
+    )
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    with mock.patch("murfey.client.rsync.requests.Session") as session:
+        session.return_value.put.side_effect = put
+        for f in files:
+            rsyncer.enqueue(f)
+        rsyncer.start()
+        rsyncer.stop()
+    session.assert_called_once_with()
+    assert received == {
+        "http://localhost:8000/upload/remote/a/file01.tiff": b"x" * 10,
+        "http://localhost:8000/upload/remote/file02.mdoc": b"x" * 10,
+    }
+    assert [u.file_path for u in updates] == [f.relative_to(tmp_path) for f in files]
+    assert all(u.outcome is TransferResult.SUCCESS for u in updates)
+    assert all(u.file_size == 10 for u in updates)
+
+
+def test_parse_out_format_lines():
+    assert _parse_out_format("murfey:>f+++++++++:3136:3136:a/b:c.tiff") == (
+        ">f+++++++++",
+        3136,
+        3136,
+        Path("a/b:c.tiff"),
+    )
+    assert _parse_out_format("murfey:.f.........:10:0:file.mdoc").bytes_transferred == 0
+    assert _parse_out_format("murfey:cd+++++++++:0:0:a") is None
+    assert _parse_out_format("sent 6,676 bytes  received 397 bytes") is None
+
+
+def test_machine_readable_rsync_output_is_reported_per_file(tmp_path):
+    files = [tmp_path / "file01.tiff", tmp_path / "file02.tiff"]
+    for f in files:
+        f.write_bytes(b"x" * 10)
+
+    def run(command, callback_stdout, **kwargs):
+        assert any(c.startswith("--out-format=") for c in command)
+        callback_stdout("murfey:>f+++++++++:10:10:file01.tiff")
+        callback_stdout("murfey:.f.........:12:0:file02.tiff")
+        return mock.Mock(returncode=0)
+
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        machine_readable_output=True,
+        adaptive_batching=False,
+    )
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    with mock.patch("murfey.client.rsync.procrunner.run", side_effect=run):
+        for f in files:
+            rsyncer.enqueue(f)
+        rsyncer.start()
+        rsyncer.stop()
+    assert [(u.file_path, u.file_size, u.outcome) for u in updates] == [
+        (Path("file01.tiff"), 10, TransferResult.SUCCESS),
+        (Path("file02.tiff"), 12, TransferResult.SUCCESS),
+    ]
+    assert rsyncer._bytes_transferred == 10
+    # file02.tiff was already up to date, so only file01.tiff counts
+    assert rsyncer.batch_statistics.bytes == 10
+
+
+def test_metadata_is_transferred_ahead_of_data_in_separate_batches(tmp_path):
+    names = ["file01.tiff", "file02.tiff", "file01.xml", "file03.tiff", "file.mdoc"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"x" * 10)
+    commands = []
+
+    def run(command, callback_stdout, stdin, **kwargs):
+        commands.append(command)
+        for name in stdin.decode().split("\n"):
+            callback_stdout(f"murfey:>f+++++++++:10:10:{name}")
+        return mock.Mock(returncode=0)
+
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        machine_readable_output=True,
+        bandwidth_limits={TransferPriority.DATA: 1000},
+    )
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    with mock.patch("murfey.client.rsync.procrunner.run", side_effect=run):
+        for name in names:
+            rsyncer.enqueue(tmp_path / name)
+        rsyncer.start()
+        rsyncer.stop()
+    assert [u.file_path.name for u in updates] == [
+        "file01.xml",
+        "file.mdoc",
+        "file01.tiff",
+        "file02.tiff",
+        "file03.tiff",
+    ]
+    assert len(commands) == 2
+    assert not any(c.startswith("--bwlimit") for c in commands[0])
+    assert "--bwlimit=1000" in commands[1]
+
+
+def test_failing_worker_does_not_hold_back_outcomes_while_backing_off(tmp_path):
+    for d in ("a", "b"):
+        (tmp_path / d).mkdir()
+        (tmp_path / d / "file.tiff").write_bytes(b"x" * 10)
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        do_transfer=False,
+        workers=2,
+        batch_max_wait=0.1,
+    )
+    fake_transfer = rsyncer._fake_transfer
+
+    def fail_in_a(files, notify=None):
+        fake_transfer(files, notify=notify)
+        return files[0].parent.name != "a"
+
+    updates: list[RSyncerUpdate] = []
+    all_reported = threading.Event()
+
+    def record(update: RSyncerUpdate):
+        updates.append(update)
+        if len(updates) == 2:
+            all_reported.set()
+
+    rsyncer.subscribe(record)
+    with mock.patch.object(rsyncer, "_fake_transfer", side_effect=fail_in_a):
+        rsyncer.start()
+        rsyncer.enqueue(tmp_path / "a" / "file.tiff")
+        rsyncer.enqueue(tmp_path / "b" / "file.tiff")
+        # the failed transfer backs off for a second
+        reported_in_time = all_reported.wait(timeout=0.8)
+        rsyncer.stop()
+    assert reported_in_time
+    assert [u.file_path for u in updates] == [Path("a/file.tiff"), Path("b/file.tiff")]
+
+
+def test_worker_reports_files_without_a_matching_outcome(tmp_path):
+    (tmp_path / "file01.tiff").write_bytes(b"x" * 10)
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        do_transfer=False,
+        workers=2,
+    )
+
+    def report_other_name(files, notify=None):
+        notify(RSyncerUpdate(Path("other.tiff"), 10, TransferResult.SUCCESS, 1, 0))
+        return True
+
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    with mock.patch.object(rsyncer, "_fake_transfer", side_effect=report_other_name):
+        rsyncer.enqueue(tmp_path / "file01.tiff")
+        rsyncer.start()
+        rsyncer.stop()
+    assert [(u.file_path, u.outcome) for u in updates] == [
+        (Path("file01.tiff"), TransferResult.FAILURE),
+        (Path("other.tiff"), TransferResult.SUCCESS),
+    ]
+
+
+def test_interleaved_metadata_does_not_break_up_data_batches(tmp_path):
+    names = [f"file{i:02d}{suffix}" for i in range(10) for suffix in (".tiff", ".xml")]
+    for name in names:
+        (tmp_path / name).write_bytes(b"x" * 10)
+    batches = []
+
+    def run(command, callback_stdout, stdin, **kwargs):
+        batches.append(stdin.decode().split("\n"))
+        for name in batches[-1]:
+            callback_stdout(f"murfey:>f+++++++++:10:10:{name}")
+        return mock.Mock(returncode=0)
+
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        machine_readable_output=True,
+        batch_idle_wait=0.5,
+        metadata_max_delay=5,
+    )
+    with mock.patch("murfey.client.rsync.procrunner.run", side_effect=run):
+        rsyncer.start()
+        for name in names:
+            rsyncer.enqueue(tmp_path / name)
+        rsyncer.stop()
+    data_batches = [b for b in batches if b[0].endswith(".tiff")]
+    assert sum(len(b) for b in data_batches) == 10
+    assert len(data_batches) <= 2
+    assert sorted(sum(batches, [])) == sorted(names)
+
+
+def test_retransfers_ignore_times_and_are_marked(tmp_path):
+    for name in ("file01.tiff", "file02.tiff"):
+        (tmp_path / name).write_bytes(b"x" * 10)
+    commands = []
+
+    def run(command, callback_stdout, stdin, **kwargs):
+        commands.append((command, stdin.decode()))
+        for name in stdin.decode().split("\n"):
+            callback_stdout(f"murfey:>f+++++++++:10:10:{name}")
+        return mock.Mock(returncode=0)
+
+    rsyncer = RSyncer(
+        tmp_path,
+        basepath_remote=Path("remote"),
+        server_url=urlparse("http://localhost:8000"),
+        machine_readable_output=True,
+    )
+    updates: list[RSyncerUpdate] = []
+    rsyncer.subscribe(updates.append)
+    with mock.patch("murfey.client.rsync.procrunner.run", side_effect=run):
+        rsyncer.enqueue(tmp_path / "file01.tiff", retransfer=True)
+        rsyncer.enqueue(tmp_path / "file02.tiff")
+        rsyncer.start()
+        rsyncer.stop()
+    assert [(stdin, "--ignore-times" in command) for command, stdin in commands] == [
+        ("file02.tiff", False),
+        ("file01.tiff", True),
+    ]
+    assert {u.file_path.name: u.retransfer for u in updates} == {
+        "file01.tiff": True,
+        "file02.tiff": False,
+    }
+
+
+def test_machine_readable_output_depends_on_the_rsync_version():
+    def run(version):
+        return mock.Mock(returncode=0, stdout=version.encode())
+
+    for version, supported in (
+        ("rsync  version 3.2.7  protocol version 31\n", True),
+        ("rsync  version 3.1.0  protocol version 31\n", True),
+        ("rsync  version 2.6.9  protocol version 29\n", False),
+        ("openrsync: protocol version 29\nrsync version 2.6.9 compatible\n", False),
+    ):
+        _rsync_has_machine_readable_output.cache_clear()
+        with mock.patch(
+            "murfey.client.rsync.procrunner.run", return_value=run(version)
+        ):
+            assert _rsync_has_machine_readable_output() is supported
+    _rsync_has_machine_readable_output.cache_clear()
+    with mock.patch(
+        "murfey.client.rsync.procrunner.run", side_effect=FileNotFoundError("rsync")
+    ):
+        rsyncer = RSyncer(
+            Path("local"),
+            basepath_remote=Path("remote"),
+            server_url=urlparse("http://localhost:8000"),
+        )
+    assert not rsyncer._machine_readable_output
+    _rsync_has_machine_readable_output.cache_clear()
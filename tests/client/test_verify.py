@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlparse
+
+from murfey.client.rsync import RSyncer, RSyncerUpdate, TransferResult
+from murfey.client.verify import TransferVerifier
+from murfey.util.checksum import file_checksum
+
+
+def test_files_differing_from_the_server_copy_are_transferred_again(tmp_path):
+    for name in ("file01.tiff", "file02.tiff"):
+        (tmp_path / name).write_bytes(b"x" * 100)
+    server_checksums = {
+        "remote/file01.tiff": file_checksum(tmp_path / "file01.tiff")._asdict(),
+        "remote/file02.tiff": {"size": 100, "crc32": 0},
+    }
+
+    def get(url):
+        return mock.Mock(
+            status_code=200,
+            json=lambda: server_checksums[url.split("/checksum/")[1]],
+        )
+
+    rsyncer = mock.Mock(
+        spec=RSyncer,
+        _basepath=tmp_path,
+        _basepath_remote=Path("remote"),
+        _server_url=urlparse("http://localhost:8000"),
+    )
+    verifier = TransferVerifier(rsyncer)
+    rsyncer.subscribe.assert_called_once_with(verifier.enqueue)
+    with mock.patch("murfey.client.verify.requests.Session") as session:
+        session.return_value.get.side_effect = get
+        for name in ("file01.tiff", "file02.tiff"):
+            verifier.enqueue(
+                RSyncerUpdate(
+                    file_path=Path(name),
+                    file_size=100,
+                    outcome=TransferResult.SUCCESS,
+                    transfer_total=1,
+                    queue_size=0,
+                )
+            )
+        verifier.stop()
+    assert verifier.verified == 1
+    assert verifier.mismatched == 1
+    rsyncer.enqueue.assert_called_once_with(tmp_path / "file02.tiff", retransfer=True)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import os
+import queue
+import time
+from unittest import mock
+
+import pytest
+
+from murfey.client.inotify import InotifyEventSource, inotify_available
+from murfey.client.watchdir import DirWatcher
+
+
+def test_incremental_scan_finds_the_same_files_as_a_full_scan(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file01.tiff").touch()
+    (tmp_path / "a" / "file02.xml").touch()
+    (tmp_path / "file03.mdoc").touch()
+    full = DirWatcher(tmp_path)._scan_directory()
+    incremental = DirWatcher(tmp_path, incremental=True)
+    assert incremental._scan_directory() == full
+    assert incremental._scan_directory() == full
+    assert len(full) == 3
+
+
+def test_incremental_scan_does_not_list_unchanged_directories(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "file01.tiff").touch()
+    watcher = DirWatcher(tmp_path, incremental=True)
+    # trust directory timestamps regardless of how recently they changed
+    watcher._racy_interval = -1
+    watcher._scan_directory()
+    with mock.patch("murfey.client.watchdir.os.scandir", wraps=os.scandir) as scandir:
+        assert len(watcher._scan_directory()) == 1
+        scandir.assert_not_called()
+
+        (tmp_path / "a" / "file02.tiff").touch()
+        assert len(watcher._scan_directory()) == 2
+        scandir.assert_called_once_with(os.path.join(str(tmp_path), "a"))
+
+
+def test_incremental_scan_follows_growing_candidates(tmp_path):
+    (tmp_path / "file01.tiff").write_text("x")
+    watcher = DirWatcher(tmp_path, settling_time=3600, incremental=True)
+    watcher._racy_interval = -1
+    watcher.scan()
+    assert str(tmp_path / "file01.tiff") in watcher._file_candidates
+
+    (tmp_path / "file01.tiff").write_text("xxxx")
+    watcher.scan()
+    assert watcher._file_candidates[str(tmp_path / "file01.tiff")].size == 4
+
+
+class _FakeEventSource:
+    def __init__(self):
+        self.events: queue.Queue = queue.Queue()
+        self.closed = False
+
+    def read(self, timeout: float):
+        try:
+            return [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+    def close(self):
+        self.closed = True
+
+
+def test_file_events_are_passed_on_without_waiting_for_a_scan(tmp_path):
+    watcher = DirWatcher(tmp_path, settling_time=0)
+    transferred = []
+    watcher.subscribe(transferred.append)
+    event_source = _FakeEventSource()
+    watcher.scan(transfer_all=True)
+    assert watcher.start_events(event_source=event_source)
+
+    (tmp_path / "file01.tiff").write_text("x")
+    event_source.events.put(str(tmp_path / "file01.tiff"))
+    for _ in range(50):
+        if transferred:
+            break
+        time.sleep(0.05)
+    watcher.stop_events()
+    assert event_source.closed
+    assert transferred == [tmp_path / "file01.tiff"]
+
+    # a subsequent scan must not offer the file again
+    watcher.scan(transfer_all=True)
+    assert not watcher._file_candidates
+    assert transferred == [tmp_path / "file01.tiff"]
+
+
+@pytest.mark.skipif(not inotify_available(), reason="requires inotify")
+def test_inotify_event_source_follows_new_directories(tmp_path):
+    event_source = InotifyEventSource(tmp_path)
+    try:
+        (tmp_path / "file01.tiff").touch()
+        assert event_source.read(timeout=1) == [str(tmp_path / "file01.tiff")]
+        (tmp_path / "a").mkdir()
+        assert event_source.read(timeout=1) == []
+        (tmp_path / "a" / "file02.tiff").touch()
+        assert event_source.read(timeout=1) == [str(tmp_path / "a" / "file02.tiff")]
+    finally:
+        event_source.close()
+
+
+def test_scan_only_checks_candidates_that_are_due(tmp_path):
+    for i in range(5):
+        (tmp_path / f"file0{i}.tiff").touch()
+    watcher = DirWatcher(tmp_path, settling_time=3600)
+    watcher.scan(transfer_all=True)
+    assert watcher.scan_statistics.files == 5
+    assert watcher.scan_statistics.candidates == 5
+    assert watcher.scan_statistics.settle_checks == 0
+
+    watcher.settling_time = 0
+    watcher._add_candidate(
+        str(tmp_path / "file00.tiff"),
+        watcher._file_candidates[str(tmp_path / "file00.tiff")],
+        time.time() - 1,
+    )
+    transferred = []
+    watcher.subscribe(transferred.append)
+    watcher.scan(transfer_all=True)
+    assert watcher.scan_statistics.settle_checks == 1
+    assert watcher.scan_statistics.candidates == 4
+    assert transferred == [tmp_path / "file00.tiff"]
+
+
+def test_failing_candidate_does_not_lose_the_other_due_candidates(tmp_path):
+    for name in ("a.tiff", "b.tiff", "c.tiff"):
+        (tmp_path / name).touch()
+    watcher = DirWatcher(tmp_path, settling_time=3600)
+    watcher.scan(transfer_all=True)
+    watcher.settling_time = 0
+    for name in ("a.tiff", "b.tiff", "c.tiff"):
+        candidate = str(tmp_path / name)
+        watcher._add_candidate(
+            candidate, watcher._file_candidates[candidate], time.time() - 1
+        )
+    transferred = []
+    watcher.subscribe(transferred.append)
+    settle = watcher._settle
+
+    def flaky_settle(file_candidate, *args):
+        if file_candidate == str(tmp_path / "a.tiff"):
+            # removed between listing and settling
+            raise FileNotFoundError(file_candidate)
+        if file_candidate == str(tmp_path / "c.tiff"):
+            raise PermissionError(file_candidate)
+        return settle(file_candidate, *args)
+
+    with mock.patch.object(watcher, "_settle", side_effect=flaky_settle):
+        watcher.scan(transfer_all=True)
+    assert transferred == [tmp_path / "b.tiff"]
+    assert watcher.scan_statistics.settle_checks == 3
+    assert str(tmp_path / "a.tiff") not in watcher._file_candidates
+    assert str(tmp_path / "c.tiff") in watcher._file_candidates
+
+    watcher.scan(transfer_all=True)
+    assert transferred == [tmp_path / "b.tiff", tmp_path / "c.tiff"]
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+from unittest import mock
+
+import murfey.server
+from murfey.util.state import global_state
+
+
+class _FakeSession:
+    def __init__(self):
+        self.added: list = []
+        self.committed = False
+        self._ids = itertools.count(100)
+
+    def add_all(self, records):
+        self.added.extend(records)
+
+    def flush(self):
+        for record in self.added:
+            for key in ("dataCollectionId", "processingJobId", "autoProcProgramId"):
+                if hasattr(record, key) and getattr(record, key) is None:
+                    setattr(record, key, next(self._ids))
+                    break
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _send_from_transport_thread(consumer, messages):
+    thread = threading.Thread(
+        target=lambda: [consumer(header, message) for header, message in messages]
+    )
+    thread.start()
+    thread.join()
+
+
+def test_feedback_consumer_registers_messages_in_one_transaction():
+    session = _FakeSession()
+    transport = mock.Mock()
+    notified_loops = []
+
+    async def listener(*args, **kwargs):
+        notified_loops.append(asyncio.get_running_loop())
+
+    async def consume():
+        consumer = murfey.server.FeedbackConsumer("feedback", batch_window=60)
+        await consumer.start()
+        transport.transport.subscribe.assert_called_once_with(
+            "feedback", consumer, acknowledgement=True, prefetch_count=100
+        )
+        _send_from_transport_thread(
+            consumer,
+            [
+                (
+                    {"id": tag},
+                    {
+                        "register": "data_collection",
+                        "session_id": 2,
+                        "experiment_type": "tomo",
+                        "image_directory": "/data",
+                        "image_suffix": ".tiff",
+                        "voltage": 300,
+                        "tag": tag,
+                    },
+                )
+                for tag in ("Position_1", "Position_2")
+            ]
+            + [
+                (
+                    {"id": "pj"},
+                    {
+                        "register": "processing_job",
+                        "tag": "Position_1",
+                        "recipe": "em-tomo-align",
+                    },
+                ),
+            ],
+        )
+        await asyncio.sleep(0.1)
+        transport.transport.ack.assert_not_called()
+        # any other message causes the pending registrations to be processed
+        _send_from_transport_thread(
+            consumer, [({"id": 1}, {"register": "motion_corrected", "movie": "a"})]
+        )
+        for _ in range(100):
+            if transport.transport.ack.call_count == 4:
+                break
+            await asyncio.sleep(0.01)
+        await consumer.stop()
+        return asyncio.get_running_loop()
+
+    with mock.patch.object(
+        murfey.server, "Session", return_value=session, create=True
+    ), mock.patch.object(
+        murfey.server, "_transport_object", transport
+    ), mock.patch.object(
+        global_state, "_listeners", [listener]
+    ), mock.patch.dict(
+        global_state.data, {"data_collection_group_id": 1}, clear=True
+    ):
+        loop = asyncio.run(consume())
+
+        assert session.committed
+        assert global_state["data_collection_ids"] == {
+            "Position_1": 100,
+            "Position_2": 101,
+        }
+        assert global_state["processing_job_ids"] == {
+            "Position_1": {"em-tomo-align": 102}
+        }
+        assert global_state["autoproc_program_ids"] == {
+            "Position_1": {"em-tomo-align": 103}
+        }
+        assert global_state["motion_corrected_movies"] == {"a": [None, None]}
+    assert [c.args[0] for c in transport.transport.ack.call_args_list] == [
+        {"id": "Position_1"},
+        {"id": "Position_2"},
+        {"id": "pj"},
+        {"id": 1},
+    ]
+    transport.transport.nack.assert_not_called()
+    assert notified_loops and all(n is loop for n in notified_loops)
+
+
+def test_feedback_consumer_rejects_processing_jobs_without_data_collection():
+    session = _FakeSession()
+    transport = mock.Mock()
+
+    async def consume():
+        consumer = murfey.server.FeedbackConsumer("feedback", batch_window=60)
+        await consumer.start()
+        _send_from_transport_thread(
+            consumer,
+            [
+                (
+                    {"id": "pj"},
+                    {
+                        "register": "processing_job",
+                        "tag": "Position_1",
+                        "recipe": "em-tomo-align",
+                    },
+                ),
+            ],
+        )
+        for _ in range(100):
+            if consumer._pending:
+                break
+            await asyncio.sleep(0.01)
+        await consumer.stop()
+
+    with mock.patch.object(
+        murfey.server, "Session", return_value=session, create=True
+    ), mock.patch.object(
+        murfey.server, "_transport_object", transport
+    ), mock.patch.dict(
+        global_state.data, {"data_collection_group_id": 1}, clear=True
+    ):
+        asyncio.run(consume())
+        assert "processing_job_ids" not in global_state
+    transport.transport.ack.assert_not_called()
+    # the message is not requeued, as it would only be rejected again
+    transport.transport.nack.assert_called_once_with({"id": "pj"}, requeue=False)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import datetime
+import time
+from unittest import mock
+
+import pytest
+import sqlalchemy
+import sqlalchemy.orm
+from ispyb.sqlalchemy import BLSession, Proposal
+
+import murfey.server.ispyb
+
+
+@pytest.fixture
+def session_ids():
+    murfey.server.ispyb._session_ids.clear()
+    with mock.patch.object(
+        murfey.server.ispyb, "Session"
+    ) as session, mock.patch.object(
+        murfey.server.ispyb, "get_session_id", return_value=42
+    ) as get_session_id:
+        yield session, get_session_id
+    murfey.server.ispyb._session_ids.clear()
+
+
+def test_session_ids_are_looked_up_once(session_ids):
+    session, get_session_id = session_ids
+    for _ in range(3):
+        assert (
+            murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "2") == 42
+        )
+    get_session_id.assert_called_once_with(
+        microscope="m12",
+        proposal_code="cm",
+        proposal_number="31111",
+        visit_number="2",
+        db=session.return_value.__enter__.return_value,
+    )
+    session.return_value.__exit__.assert_called_once()
+    murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "3")
+    assert get_session_id.call_count == 2
+
+
+def test_session_ids_expire(session_ids):
+    _, get_session_id = session_ids
+    murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "2")
+    with mock.patch.object(murfey.server.ispyb, "_session_id_ttl", 0):
+        murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "2")
+    assert get_session_id.call_count == 2
+
+
+def test_failed_session_id_lookups_are_not_remembered(session_ids):
+    _, get_session_id = session_ids
+    get_session_id.side_effect = IndexError
+    with pytest.raises(IndexError):
+        murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "2")
+    get_session_id.side_effect = None
+    assert murfey.server.ispyb.get_cached_session_id("m12", "cm", "31111", "2") == 42
+
+
+def test_pool_monitor_tracks_peak_utilisation(caplog):
+    monitor = murfey.server.ispyb._PoolMonitor(capacity=2)
+    monitor.checkout()
+    monitor.checkin()
+    monitor.checkout()
+    assert not caplog.records
+    monitor.checkout()
+    assert "All 2 ISPyB database connections are in use" in caplog.text
+    monitor.checkin()
+    monitor.checkin()
+    assert monitor.checked_out == 0
+    assert monitor.peak_checked_out == 2
+    assert monitor.checkouts == 3
+
+
+@pytest.fixture
+def ispyb_db():
+    """An in-memory SQLite stand-in for the ISPyB tables holding visits"""
+    engine = sqlalchemy.create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=sqlalchemy.pool.StaticPool,
+    )
+    metadata = sqlalchemy.MetaData()
+    for model in (Proposal, BLSession):
+        sqlalchemy.Table(
+            model.__table__.name,
+            metadata,
+            *(
+                sqlalchemy.Column(
+                    column.name,
+                    column.type.as_generic(),
+                    primary_key=column.primary_key,
+                )
+                for column in model.__table__.columns
+            ),
+        )
+    metadata.create_all(engine)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)
+    with session() as db:
+        db.add(
+            Proposal(
+                proposalId=1,
+                personId=1,
+                proposalCode="cm",
+                proposalNumber="31111",
+                title="Murfey",
+            )
+        )
+        db.commit()
+    return session
+
+
+def _add_visit(db, session_id: int, visit_number: int, started: float, ends: float):
+    now = datetime.datetime.now()
+    with db() as session:
+        session.add(
+            BLSession(
+                sessionId=session_id,
+                proposalId=1,
+                beamLineName="m12",
+                visit_number=visit_number,
+                startDate=now + datetime.timedelta(hours=started),
+                endDate=now + datetime.timedelta(hours=ends),
+            )
+        )
+        session.commit()
+
+
+def test_visit_cache_answers_from_memory(ispyb_db):
+    _add_visit(ispyb_db, 1, 1, -1, 1)
+    _add_visit(ispyb_db, 2, 2, 1, 2)
+    visits = murfey.server.ispyb.VisitCache(
+        "m12", refresh_interval=60, session_factory=ispyb_db
+    )
+    try:
+        assert [v.name for v in visits.visits()] == ["cm31111-1"]
+        assert visits.get("cm31111-1").session_id == 1
+        assert visits.get("cm31111-2") is None
+        assert visits.get("cm31111-1") is not None
+        assert visits.refreshes == 1
+    finally:
+        visits.stop()
+
+
+def test_visit_cache_is_refreshed_when_invalidated(ispyb_db):
+    visits = murfey.server.ispyb.VisitCache(
+        "m12", refresh_interval=60, session_factory=ispyb_db
+    )
+    try:
+        assert visits.visits() == []
+        _add_visit(ispyb_db, 1, 1, -1, 1)
+        visits.invalidate()
+        for _ in range(100):
+            if visits.refreshes > 1:
+                break
+            time.sleep(0.01)
+        assert visits.get("cm31111-1").session_id == 1
+    finally:
+        visits.stop()
+
+
+def test_visit_cache_keeps_visits_if_refresh_fails(ispyb_db):
+    _add_visit(ispyb_db, 1, 1, -1, 1)
+    visits = murfey.server.ispyb.VisitCache(
+        "m12", refresh_interval=60, session_factory=ispyb_db
+    )
+    try:
+        visits.visits()
+        visits._session_factory = mock.Mock(side_effect=RuntimeError)
+        visits.invalidate()
+        time.sleep(0.1)
+        assert visits.get("cm31111-1") is not None
+    finally:
+        visits.stop()
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from unittest import mock
+
 from fastapi.testclient import TestClient
 
 from murfey.server.main import app
@@ -35,3 +37,71 @@ def test_openapi_json_is_valid():
     response = client.get("/openapi.json")
     assert response.status_code == 200
     assert response.json()
+
+
+def test_machine_info_supports_conditional_requests():
+    response = client.get("/machine/")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = client.get("/machine/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get("/machine/", headers={"If-None-Match": '"x"'}).json() == (
+        client.get("/machine/").json()
+    )
+
+
+def test_upload_with_invalid_modification_time_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "murfey.server.api.machine_config",
+        mock.Mock(rsync_basepath=tmp_path),
+    )
+    response = client.put(
+        "/upload/data/file01.tiff",
+        data=b"x" * 10,
+        headers={"X-Murfey-Modification-Time": "yesterday"},
+    )
+    assert response.status_code == 400
+    assert not list(tmp_path.rglob("*"))
+
+    response = client.put(
+        "/upload/data/file01.tiff",
+        data=b"x" * 10,
+        headers={"X-Murfey-Modification-Time": "1.5"},
+    )
+    assert response.json() == {"size": 10}
+    assert (tmp_path / "data" / "file01.tiff").stat().st_mtime == 1.5
+    assert [f.name for f in (tmp_path / "data").iterdir()] == ["file01.tiff"]
+
+
+def test_preprocessing_batch_skips_movies_outside_the_visit(tmp_path, monkeypatch):
+    transport = mock.Mock()
+    monkeypatch.setattr("murfey.server.api._transport_object", transport)
+    monkeypatch.setattr(
+        "murfey.server.api.machine_config",
+        mock.Mock(processed_directory_name="processed", feedback_queue="feedback"),
+    )
+    monkeypatch.setattr("murfey.server.api.known_directories", mock.Mock())
+    proc_file = {
+        "description": "",
+        "size": 10,
+        "timestamp": 1.5,
+        "processing_job": 1,
+        "data_collection_id": 2,
+        "image_number": 3,
+        "mc_uuid": 4,
+        "autoproc_program_id": 5,
+        "pixel_size": 1e-10,
+    }
+    response = client.post(
+        "/visits/cm12345-6/tomography_preprocess_batch",
+        json=[
+            {**proc_file, "path": f"{tmp_path}/cm12345-6/raw/Position_1_[0.0].tiff"},
+            {**proc_file, "path": f"{tmp_path}/cm54321-6/raw/Position_1_[3.0].tiff"},
+        ],
+    )
+    assert response.status_code == 200
+    assert [pf["path"] for pf in response.json()] == [
+        f"{tmp_path}/cm12345-6/raw/Position_1_[0.0].tiff"
+    ]
+    assert transport.transport.send.call_count == 1
+    transport.transport.transaction_commit.assert_called_once()
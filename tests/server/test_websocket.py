@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from murfey.server.websocket import ConnectionManager
+from murfey.util.state import State
+
+
+class _WebSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent: list = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(json.dumps(data)))
+
+    async def send_text(self, data):
+        await asyncio.sleep(self.delay)
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_partial_state_updates_are_merged_into_one_delta():
+    async def update():
+        state: State = State()
+        manager = ConnectionManager(state, broadcast_window=0.05)
+        websockets = [_WebSocket(), _WebSocket()]
+        for client_id, websocket in enumerate(websockets):
+            await manager.connect(websocket, client_id)
+        await asyncio.sleep(0.01)
+        await state.aupdate("movies", {"a": 1})
+        for n in range(100):
+            await state.aupdate("movies", {f"movie_{n}": n})
+        await state.set("tag", "Position_1")
+        await asyncio.sleep(0.2)
+        for n in range(2):
+            await state.aupdate("movies", {f"late_movie_{n}": n})
+        await state.delete("tag")
+        await asyncio.sleep(0.2)
+        return websockets, state
+
+    websockets, state = asyncio.run(update())
+    for websocket in websockets:
+        assert websocket.sent == [
+            {"message": "state-full", "sequence": 0, "state": {}},
+            {
+                "message": "state-delta",
+                "sequence": 1,
+                "attribute": "movies",
+                "op": "set",
+                "value": {"a": 1, **{f"movie_{n}": n for n in range(100)}},
+            },
+            {
+                "message": "state-delta",
+                "sequence": 2,
+                "attribute": "tag",
+                "op": "set",
+                "value": "Position_1",
+            },
+            {
+                "message": "state-delta",
+                "sequence": 3,
+                "attribute": "movies",
+                "op": "add",
+                "value": {"late_movie_0": 0, "late_movie_1": 1},
+            },
+            {
+                "message": "state-delta",
+                "sequence": 4,
+                "attribute": "tag",
+                "op": "remove",
+                "value": None,
+            },
+        ]
+
+
+def test_slow_clients_are_sent_the_full_state():
+    async def update():
+        state: State = State()
+        manager = ConnectionManager(state, broadcast_window=0, max_queued=5)
+        fast, slow = _WebSocket(), _WebSocket(delay=0.05)
+        await manager.connect(fast, "fast")
+        await manager.connect(slow, "slow")
+        await asyncio.sleep(0.1)
+        for n in range(20):
+            await state.set("count", n)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.5)
+        return fast, slow, manager
+
+    fast, slow, manager = asyncio.run(update())
+    assert [m["value"] for m in fast.sent[1:]] == list(range(20))
+    assert {"message": "state-full", "sequence": 0, "state": {}} in slow.sent
+    assert len(slow.sent) < 10
+    full_states = [m for m in slow.sent[1:] if m["message"] == "state-full"]
+    assert full_states
+    # the client ends up with the current state, followed by consecutive deltas
+    last_full_state = slow.sent.index(full_states[-1])
+    sequence = full_states[-1]["sequence"]
+    assert [full_states[-1]["state"]["count"]] + [
+        m["value"] for m in slow.sent[last_full_state + 1 :]
+    ] == list(range(sequence - 1, 20))
+    assert [m["sequence"] for m in slow.sent[last_full_state + 1 :]] == list(
+        range(sequence + 1, 21)
+    )
+    assert manager._clients["slow"].resyncs
+
+
+def test_unresponsive_clients_are_disconnected():
+    async def update():
+        state: State = State()
+        manager = ConnectionManager(state, broadcast_window=0, send_timeout=0.05)
+        fast, stuck = _WebSocket(), _WebSocket(delay=60)
+        await manager.connect(fast, "fast")
+        await manager.connect(stuck, "stuck")
+        await state.set("count", 1)
+        await asyncio.sleep(0.2)
+        return fast, stuck, manager
+
+    fast, stuck, manager = asyncio.run(update())
+    assert fast.sent[-1] == {
+        "message": "state-delta",
+        "sequence": 1,
+        "attribute": "count",
+        "op": "set",
+        "value": 1,
+    }
+    assert stuck.closed
+    assert list(manager.active_connections) == ["fast"]
+
+
+def test_clients_can_ask_for_the_full_state():
+    async def update():
+        state: State = State()
+        manager = ConnectionManager(state, broadcast_window=0)
+        websocket = _WebSocket()
+        await manager.connect(websocket, "client")
+        await state.set("count", 1)
+        manager.resync("client")
+        await asyncio.sleep(0.1)
+        return websocket
+
+    websocket = asyncio.run(update())
+    assert websocket.sent[-1] == {
+        "message": "state-full",
+        "sequence": 1,
+        "state": {"count": 1},
+    }
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import zlib
+from unittest import mock
+
+from murfey.util.checksum import FileChecksum, file_checksum
+
+
+def test_file_checksum_over_several_chunks(tmp_path):
+    data = bytes(range(256)) * 1000
+    (tmp_path / "file01.tiff").write_bytes(data)
+    with mock.patch("murfey.util.checksum._chunk_size", 1000):
+        checksum = file_checksum(tmp_path / "file01.tiff")
+    assert checksum == FileChecksum(size=len(data), crc32=zlib.crc32(data))
+
+
+def test_file_checksum_of_empty_file(tmp_path):
+    (tmp_path / "file01.tiff").touch()
+    assert file_checksum(tmp_path / "file01.tiff") == FileChecksum(size=0, crc32=0)
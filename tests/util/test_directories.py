@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from unittest import mock
+
+from murfey.util.directories import DirectoryCache
+
+
+def test_directories_are_only_created_once(tmp_path):
+    cache = DirectoryCache()
+    motioncorr = tmp_path / "processed" / "MotionCorr"
+    ctf = tmp_path / "processed" / "CTF"
+    with mock.patch.object(
+        Path,
+        "mkdir",
+        autospec=True,
+        side_effect=lambda path, **kwargs: os.makedirs(path, exist_ok=True),
+    ) as mkdir:
+        cache.ensure(motioncorr, ctf, tmp_path / "processed")
+        assert motioncorr.is_dir() and ctf.is_dir()
+        # the parent directory is created along with its subdirectories
+        assert sorted(c.args[0] for c in mkdir.call_args_list) == [ctf, motioncorr]
+
+        cache.ensure(motioncorr, ctf)
+        cache.ensure(str(motioncorr))
+        assert mkdir.call_count == 2
+    assert cache.hits == 3
+    assert cache.misses == 3
+
+
+def test_directory_cache_is_bounded(tmp_path):
+    cache = DirectoryCache(maxsize=2)
+    for name in ("a", "b", "c"):
+        cache.ensure(tmp_path / name)
+    assert list(cache._known) == [tmp_path / "b", tmp_path / "c"]
+
+    cache.ensure(tmp_path / "a")
+    assert cache.hits == 0
+    assert list(cache._known) == [tmp_path / "c", tmp_path / "a"]
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from murfey.util.locks import KeyedLocks, MeasuredLock
+
+
+def _hold(lock: MeasuredLock, held: threading.Event, seconds: float):
+    with lock:
+        held.set()
+        time.sleep(seconds)
+
+
+def test_measured_lock_records_waits_and_holds():
+    lock = MeasuredLock("test")
+    with lock:
+        with lock:
+            pass
+    assert lock.statistics.acquisitions == 1
+    assert not lock.statistics.contended
+
+    held = threading.Event()
+    holder = threading.Thread(target=_hold, args=(lock, held, 0.05))
+    holder.start()
+    held.wait()
+    assert not lock.acquire(blocking=False)
+    with lock:
+        pass
+    holder.join()
+    statistics = lock.statistics
+    assert statistics.acquisitions == 3
+    assert statistics.contended == 1
+    assert 0.02 < statistics.max_wait <= statistics.total_wait
+    assert statistics.max_hold >= 0.05
+    assert statistics.mean_hold == statistics.total_hold / 3
+
+
+def test_keyed_locks_only_contend_for_the_same_key():
+    locks = KeyedLocks("tag")
+    assert locks["a"] is locks["a"]
+    assert locks["a"] is not locks["b"]
+    held = threading.Event()
+    holder = threading.Thread(target=_hold, args=(locks["a"], held, 0.05))
+    holder.start()
+    held.wait()
+    assert locks["b"].acquire(blocking=False)
+    locks["b"].release()
+    assert not locks["a"].acquire(blocking=False)
+    holder.join()
+    assert locks.statistics.acquisitions == 2
+    assert not locks.statistics.contended
+
+    shared = MeasuredLock("shared")
+    locks = KeyedLocks("tag", shared=shared)
+    assert locks["a"] is locks["b"] is shared
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from pathlib import Path
 
-from murfey.util.mdoc import get_block, get_global_data
+from murfey.util.mdoc import get_block, get_blocks, get_global_data
 
 
 def test_mdoc_file_parse_global_data():
@@ -36,3 +36,12 @@ def test_mdoc_file_parse_multiple_blocks():
         assert data["PixelSpacing"] == "1.94"
         assert data["TiltAngle"] == "2.98863"
         assert data["DateTime"] == datetime(2022, 8, 1, 18, 59, 43)
+
+
+def test_mdoc_file_parse_all_blocks():
+    with open(Path(__file__).parent / "test.mdoc", "r") as md:
+        data = get_blocks(md)
+    assert len(data) == 11
+    assert data[0]["TiltAngle"] == "-0.00949884"
+    assert data[1]["TiltAngle"] == "2.98863"
+    assert all(len(block.keys()) == 32 for block in data)